@@ -29,6 +29,7 @@
 
 from neubot.http.message import Message
 from neubot.http.server import ServerHTTP
+from neubot.utils_random import RandomBody
 
 #
 # The default body size is small enough that the body, and
@@ -63,10 +64,11 @@ class DASHServerSmpl(ServerHTTP):
         # it.  Moreover, reading it leads to framentation, as
         # we need to actually allocate and then free all those
         # bytes.  (This is true especially when testing with
-        # fast Neubot clients.)  This fix brings the amount of
-        # memory consumed by the server under control again.
+        # fast Neubot clients.)  In sink mode the stream just
+        # counts the body bytes, without creating a piece object
+        # and invoking a callback for each of them.
         #
-        request.body.write = lambda data: None
+        stream.sink_body()
 
         if not stream.opaque:
             stream.opaque = DASHServerSideState()
@@ -106,21 +108,12 @@ class DASHServerSmpl(ServerHTTP):
                 body_size = DASH_MAXIMUM_BODY_SIZE
 
             #
-            # XXX We don't have a quick solution for generating
-            # and sending many random bytes from Python.
+            # The body comes from the configured payload engine, so
+            # that a compressing middlebox cannot inflate the speed.
             #
-            # Or, better, we have a couple of ideas, but they
-            # have not been implemented into Neubot yet.
-            #
-            pattern = request["Authorization"]
-            if not pattern:
-                pattern = "deadbeef"
-            body = pattern * ((body_size / len(pattern)) + 1)
-            if len(body) > body_size:
-                body = body[:body_size]
-
             response = Message()
-            response.compose(code="200", reason="Ok", body=body,
+            response.compose(code="200", reason="Ok",
+                             body=RandomBody(body_size),
                              mimetype="video/mp4")
 
             stream.set_timeout(15)
@@ -0,0 +1,147 @@
+# neubot/accept_guard.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Accept connections in batches and survive EMFILE '''
+
+# Python3-ready: yes
+
+#
+# Both listener classes (neubot/listener.py and the one in
+# neubot/net/stream.py) use this module to accept many connections
+# per readable event, rather than one per poller round trip.
+#
+# When the process runs out of file descriptors, the listening
+# socket stays readable, and a naive listener spins.  So, we stop
+# listening for EMFILE_BACKOFF seconds.  Before that, we close a
+# spare descriptor, reserved for this purpose, to accept and drop
+# one pending connection, so that at least a client is not left
+# hanging in the backlog.  (This is the trick used by libev.)
+# The listener must invoke forget() when it is closed, so that we
+# don't resume a dead listener when the backoff expires.
+#
+
+import errno
+import logging
+import os
+import socket
+import sys
+
+# Maximum number of connections accepted per readable event
+ACCEPT_BATCH = 16
+
+# Seconds we stop accepting after running out of file descriptors
+EMFILE_BACKOFF = 1
+
+# Errors meaning that there are no more pending connections
+SOFT_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK)
+
+# Errors meaning that a pending connection went away
+TRANSIENT_ERRORS = (errno.ECONNABORTED, errno.EINTR,
+                    getattr(errno, 'EPROTO', errno.ECONNABORTED))
+
+# Errors meaning that we ran out of file descriptors (or memory)
+RESOURCE_ERRORS = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS,
+                   errno.ENOMEM)
+
+# Counters exported by /debugmem/count
+STATS = {
+    'accept.accepted': 0,
+    'accept.drops': 0,
+    'accept.full_batches': 0,
+    'accept.storms': 0,
+}
+
+def set_accept_batch(count):
+    ''' Set the maximum number of accepts per readable event '''
+    global ACCEPT_BATCH
+    ACCEPT_BATCH = max(int(count), 1)
+
+class AcceptGuard(object):
+
+    ''' Accept connections in batches and survive EMFILE '''
+
+    def __init__(self):
+        self.spare = -1
+        self.paused = {}
+
+    def reserve(self):
+        ''' Reserve the spare file descriptor '''
+        if self.spare < 0:
+            try:
+                self.spare = os.open(os.devnull, os.O_RDONLY)
+            except OSError:
+                logging.warning('accept_guard: cannot reserve spare fd')
+
+    def accept(self, poller, listener, lsock, handle_accept):
+        ''' Accept and pass to handle_accept() up to ACCEPT_BATCH
+            connections pending on lsock '''
+        for _ in range(ACCEPT_BATCH):
+            try:
+                sock = lsock.accept()[0]
+            except socket.error:
+                code = sys.exc_info()[1].args[0]
+                if code in SOFT_ERRORS:
+                    return
+                if code in TRANSIENT_ERRORS:
+                    continue
+                if code not in RESOURCE_ERRORS:
+                    raise
+                self._storm(poller, listener, lsock)
+                return
+            STATS['accept.accepted'] += 1
+            handle_accept(sock)
+        STATS['accept.full_batches'] += 1
+
+    def _storm(self, poller, listener, lsock):
+        ''' Drop a connection and stop accepting for a while '''
+        STATS['accept.storms'] += 1
+        logging.warning('accept_guard: out of file descriptors: %s paused '
+                        'for %d seconds', listener, EMFILE_BACKOFF)
+        if self.spare >= 0:
+            os.close(self.spare)
+            self.spare = -1
+            try:
+                lsock.accept()[0].close()
+                STATS['accept.drops'] += 1
+            except socket.error:
+                pass
+            self.reserve()
+        poller.unset_readable(listener)
+        self.forget(listener)
+        self.paused[listener] = poller.sched(EMFILE_BACKOFF, self._resume,
+                                             poller, listener)
+
+    def _resume(self, args):
+        ''' Start accepting again '''
+        poller, listener = args
+        del self.paused[listener]
+        logging.info('accept_guard: %s resumed', listener)
+        poller.set_readable(listener)
+
+    def forget(self, listener):
+        ''' Invoked when listener is closed: don't resume it '''
+        task = self.paused.pop(listener, None)
+        if task:
+            task.cancel()
+
+ACCEPT_GUARD = AcceptGuard()
@@ -140,6 +140,7 @@ class BitTorrentClient(ClientHTTP):
 
     def peer_test_complete(self, stream, download_speed, rtt, target_bytes):
         self.success = True
+        sockopts = utils_net.get_sockopts(stream.sock.sock)
         stream = self.http_stream
 
         # Update the downstream channel estimate
@@ -167,6 +168,9 @@ class BitTorrentClient(ClientHTTP):
 
             # Test version (added Neubot 0.4.12)
             'test_version': CONFIG['bittorrent_test_version'],
+
+            # Socket options of the test connection
+            'sockopts': sockopts,
         }
 
         logging.info("BitTorrent: collecting in progress...")
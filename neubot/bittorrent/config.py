@@ -54,6 +54,7 @@ PROPERTIES = (
     ('bittorrent.numpieces', NUMPIECES, 'Num of pieces in bitfield'),
     ('bittorrent.piece_len', PIECE_LEN, 'Length of each piece'),
     ('bittorrent.port', 6881, 'Port to listen/connect to (0 = auto)'),
+    ('bittorrent.sample_pieces', 0, 'Check one PIECE every N (0 = never)'),
     ('bittorrent.watchdog', WATCHDOG, 'Maximum test run-time in seconds'),
 )
 
@@ -47,6 +47,7 @@ from neubot.state import STATE
 
 from neubot import utils
 from neubot import utils_net
+from neubot import utils_random
 from neubot import utils_rc
 
 # Constants
@@ -80,14 +81,21 @@ class PeerNeubot(StreamHandler):
         self.rtt = 0
         self.version = 1
         self.begin_upload = 0.0
+        self.blocks = None
 
     def configure(self, conf):
+        # The test sockets, both sides, use the bulk profile; we set
+        # it on a copy, not to leak it into the negotiate sockets
+        conf = conf.copy()
+        if not conf.get("net.stream.profile"):
+            conf["net.stream.profile"] = "bulk"
         StreamHandler.configure(self, conf)
         self.numpieces = conf["bittorrent.numpieces"]
         self.bitfield = make_bitfield(self.numpieces)
         self.peer_bitfield = make_bitfield(self.numpieces)
         self.my_id = conf["bittorrent.my_id"]
         self.target_bytes = conf["bittorrent.bytes.down"]
+        self.blocks = utils_random.get_payload()
         self.make_sched()
 
     def make_sched(self):
@@ -135,6 +143,9 @@ class PeerNeubot(StreamHandler):
             peer.version = self.version
         else:
             peer = self
+        # We only count the bytes of the pieces we receive
+        stream.discard_pieces = True
+        stream.sample_pieces = self.conf["bittorrent.sample_pieces"]
         stream.attach(peer, sock, peer.conf)
         stream.watchdog = self.conf["bittorrent.watchdog"]
 
@@ -190,13 +201,7 @@ class PeerNeubot(StreamHandler):
         if self.version == 2:
             return
 
-        #
-        # TODO Here we should use the random block
-        # generator but before we do that we should
-        # also make sure it does not slow down the
-        # bittorrent test.
-        #
-        block = chr(random.randint(32, 126)) * length
+        block = self.blocks.get_block()[:length]
         stream.send_piece(index, begin, block)
 
     def send_complete(self, stream):
@@ -218,13 +223,7 @@ class PeerNeubot(StreamHandler):
             if self.version == 3:
                 return
 
-            #
-            # TODO Here we should use the random block
-            # generator but before we do that we should
-            # also make sure it does not slow down the
-            # bittorrent test.
-            #
-            block = chr(random.randint(32, 126)) * PIECE_LEN
+            block = self.blocks.get_block()[:PIECE_LEN]
             index = random.randrange(self.numpieces)
             stream.send_piece(index, 0, block)
 
@@ -363,6 +362,20 @@ class PeerNeubot(StreamHandler):
             self.saved_bytes = stream.bytes_recv_tot
             self.saved_ticks = utils.ticks()
 
+        #
+        # In discard mode we just get the payload length, except
+        # for the sampled pieces.  We cannot check their content,
+        # because the sender picks it at random, but we can make
+        # sure that the payload fits into the piece.
+        #
+        if stream.sample_pieces and not isinstance(args[3], (int, long)):
+            index, begin, block = args[1:]
+            piece_len = self.conf["bittorrent.piece_len"]
+            if not block or begin + len(block) > piece_len:
+                raise RuntimeError("PIECE: invalid payload length")
+            logging.debug("BitTorrent: sampled PIECE %d %d len=%d... ok",
+                          index, begin, len(block))
+
         #
         # The download is driven by the sender and
         # we just need to discard the pieces.
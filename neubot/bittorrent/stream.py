@@ -55,6 +55,17 @@ FLAGS = ''.join(FLAGS)
 # Protocol name (for handshake)
 PROTOCOL_NAME = 'BitTorrent protocol'
 
+#
+# Messages with a fixed layout are packed together with their
+# length prefix in a single pack() call.  For PIECE we pack only
+# the 13 bytes header and queue the block after it as is, so that
+# the payload (typically a view of a shared precomputed block) is
+# never copied before it hits the socket.
+#
+PIECE_HEADER = struct.Struct("!IcII")
+REQUEST_MESSAGE = struct.Struct("!IcIII")
+HAVE_MESSAGE = struct.Struct("!IcI")
+
 def toint(data):
     ''' Converts binary data to integer '''
     return struct.unpack("!I", data)[0]
@@ -78,6 +89,11 @@ class StreamBitTorrent(Stream):
         self.count = 0
         self.id = None
         self.piece = None
+        # Discard mode, see recv_complete()
+        self.discard_pieces = False
+        self.sample_pieces = 0
+        self.pieces_seen = 0
+        self.discarding = None
 
     def connection_made(self):
         ''' Invoked when the connection is established '''
@@ -121,12 +137,14 @@ class StreamBitTorrent(Stream):
     def send_request(self, index, begin, length):
         ''' Send the REQUEST message '''
         logging.debug("> REQUEST %d %d %d", index, begin, length)
-        self._send_message(struct.pack("!cIII", REQUEST, index, begin, length))
+        self.start_send(REQUEST_MESSAGE.pack(13, REQUEST, index, begin,
+                                             length))
 
     def send_cancel(self, index, begin, length):
         ''' Send the CANCEL message '''
         logging.debug("> CANCEL %d %d %d", index, begin, length)
-        self._send_message(struct.pack("!cIII", CANCEL, index, begin, length))
+        self.start_send(REQUEST_MESSAGE.pack(13, CANCEL, index, begin,
+                                             length))
 
     def send_bitfield(self, bitfield):
         ''' Send the BITFIELD message '''
@@ -136,7 +154,7 @@ class StreamBitTorrent(Stream):
     def send_have(self, index):
         ''' Send the HAVE message '''
         logging.debug("> HAVE %d", index)
-        self._send_message(struct.pack("!cI", HAVE, index))
+        self.start_send(HAVE_MESSAGE.pack(5, HAVE, index))
 
     def send_keepalive(self):
         ''' Send the KEEPALIVE message '''
@@ -144,10 +162,11 @@ class StreamBitTorrent(Stream):
         self._send_message('')
 
     def send_piece(self, index, begin, block):
-        ''' Send the PIECE message '''
+        ''' Send the PIECE message, block may be a memoryview '''
         logging.debug("> PIECE %d %d len=%d", index, begin, len(block))
-        self._send_message(struct.pack("!cII%ss" % len(block), PIECE,
-          index, begin, block))
+        self.start_send(PIECE_HEADER.pack(9 + len(block), PIECE,
+                                          index, begin))
+        self.start_send(block)
 
     def _send_message(self, *msg_a):
         ''' Convenience function to send a message '''
@@ -169,6 +188,15 @@ class StreamBitTorrent(Stream):
     # of bytes we've read so far, and self.buff contains a portion
     # of the next message.
     #
+    # When self.discard_pieces is set, we buffer at most the first
+    # nine bytes of each message (type, index and begin) and, if it
+    # is a PIECE, we validate the header and then just count and
+    # throw away the payload as it arrives, so that we don't need to
+    # reassemble the whole piece.  In this mode, parent.got_piece()
+    # receives the length of the payload rather than the payload.
+    # If self.sample_pieces is N > 0, one PIECE every N is buffered
+    # and dispatched as usual, so the parent can inspect its content.
+    #
     def recv_complete(self, s):
 
         ''' Invoked when recv() completes '''
@@ -194,15 +222,33 @@ class StreamBitTorrent(Stream):
                 elif self.count > 4:
                     raise RuntimeError("Invalid self.count")
 
+            # Count and throw away the payload of a PIECE
+            elif self.left > 0 and self.discarding:
+                amt = min(len(s), self.left)
+                s = buffer(s, amt)
+                self.left -= amt
+
+                if self.left == 0:
+                    index, begin, length = self.discarding
+                    self.discarding = None
+                    self.count = 0
+                    self.parent.got_piece(self, index, begin, length)
+
             # Bufferize and pass upstream messages
             elif self.left > 0:
                 amt = min(len(s), self.left)
+                if self.discard_pieces and self.complete and self.count < 9:
+                    amt = min(amt, 9 - self.count)
                 self.buff.append(s[:amt])
                 s = buffer(s, amt)
                 self.left -= amt
                 self.count += amt
 
-                if self.left == 0:
+                if (self.count == 9 and self.left > 0 and
+                  self.discard_pieces and self.complete):
+                    self._maybe_discard_piece()
+
+                elif self.left == 0:
                     self._got_message("".join(self.buff))
                     del self.buff[:]
                     self.count = 0
@@ -217,6 +263,23 @@ class StreamBitTorrent(Stream):
         if not (self.close_pending or self.close_complete):
             self.start_recv()
 
+    def _maybe_discard_piece(self):
+        ''' Decide whether to discard the PIECE we're receiving '''
+        header = "".join(self.buff)
+        if header[0] != PIECE:
+            return
+        self.pieces_seen += 1
+        if self.sample_pieces and self.pieces_seen % self.sample_pieces == 0:
+            return
+        # Same checks of _got_message() but for the length
+        self.got_anything = True
+        index, begin = struct.unpack("!xII", header)
+        logging.debug("< PIECE %d %d len=%d", index, begin, self.left)
+        if index >= self.parent.numpieces:
+            raise RuntimeError("PIECE: index out of bounds")
+        self.discarding = index, begin, self.left
+        del self.buff[:]
+
     def _got_message(self, message):
 
         ''' Invoked when we receive a complete message '''
@@ -306,3 +369,4 @@ class StreamBitTorrent(Stream):
     def connection_lost(self, exception):
         ''' Invoked when the connection is lost '''
         del self.buff[:]
+        self.discarding = None
@@ -24,7 +24,6 @@
 
 # Python3-ready: yes
 
-from collections import deque
 from neubot import six
 
 NEWLINE = six.b('\n')
@@ -35,64 +34,91 @@ if six.PY3:
 else:
     BYTES = str
 
+# Compact the buffer when we have consumed more than this
+COMPACT = 65536
+
 class Brigade(object):
 
     ''' Bucket brigade '''
 
+    #
+    # Incoming data lives in self.data, starting at self.offset.  In
+    # the common case there is just one bucket, and self.data is that
+    # bucket, so that pullup() of the whole bucket does not copy.  When
+    # more data arrives before the first bucket is consumed, we switch
+    # to a bytearray, where appending and consuming are amortized linear.
+    # getline() remembers how far it already scanned, so a line that is
+    # split across many small buckets is scanned just once.
+    #
+
     def __init__(self):
-        self.brigade = deque()
+        self.data = EMPTY
+        self.offset = 0
+        self.scanned = 0
         self.total = 0
 
     def bufferise(self, octets):
         ''' Bufferise incoming data '''
-        self.brigade.append(octets)
+        if not octets:
+            return
+        if self.total == 0:
+            if not isinstance(octets, BYTES):
+                octets = memoryview(octets).tobytes()
+            self.data = octets
+            self.offset = 0
+        else:
+            if not isinstance(self.data, bytearray):
+                self.data = bytearray(self._view(self.total))
+                self.offset = 0
+            self.data += octets
         self.total += len(octets)
 
+    def _view(self, length):
+        ''' View on the first length buffered bytes '''
+        return memoryview(self.data)[self.offset:self.offset + length]
+
+    def _consume(self, length):
+        ''' Consume length buffered bytes '''
+        self.offset += length
+        self.total -= length
+        self.scanned = max(self.scanned - length, 0)
+        if self.total == 0:
+            self.data = EMPTY
+            self.offset = 0
+        elif (isinstance(self.data, bytearray) and self.offset > COMPACT
+                and self.offset > (len(self.data) >> 1)):
+            del self.data[:self.offset]
+            self.offset = 0
+
     def skip(self, length):
-        ''' Skip up to lenght bytes from brigade '''
-        if self.total >= length:
-            while length > 0:
-                bucket = self.brigade.popleft()
-                if len(bucket) > length:
-                    self.brigade.appendleft(six.buff(bucket, length))
-                    self.total -= length
-                    return 0
-                length -= len(bucket)
-                self.total -= len(bucket)
-        return length
+        ''' Skip up to length bytes from brigade and return the number
+            of bytes that still need to be skipped '''
+        count = min(self.total, length)
+        if count > 0:
+            self._consume(count)
+        return length - count
 
     def pullup(self, length):
         ''' Pullup length bytes from brigade '''
-        retval = []
-        if self.total >= length:
-            while length > 0:
-                bucket = self.brigade.popleft()
-                if len(bucket) > length:
-                    self.brigade.appendleft(six.buff(bucket, length))
-                    bucket = six.buff(bucket, 0, length)
-                retval.append(BYTES(bucket))
-                self.total -= len(bucket)
-                length -= len(bucket)
-        return EMPTY.join(retval)
+        if self.total < length:
+            return EMPTY
+        if (self.offset == 0 and length == len(self.data)
+                and not isinstance(self.data, bytearray)):
+            retval = self.data  # The whole bucket, no need to copy
+        else:
+            retval = self._view(length).tobytes()
+        self._consume(length)
+        return retval
 
     def getline(self, maxline):
         ''' Read line from brigade '''
-        if self.total >= maxline:
-            tmp = self.pullup(maxline)
-        else:
-            tmp = self.pullup(self.total)
-            self.brigade.clear()
-            self.total = 0
-        index = tmp.find(NEWLINE)
+        limit = min(self.total, maxline)
+        index = self.data.find(NEWLINE, self.offset + self.scanned,
+                               self.offset + limit)
         if index >= 0:
-            line = tmp[:index + 1]
-            remainder = tmp[index + 1:]
-            if remainder:
-                self.brigade.appendleft(remainder)
-                self.total += len(remainder)
-            return line
-        if len(tmp) >= maxline:
+            self.scanned = 0
+            return self.pullup(index - self.offset + 1)
+        if limit >= maxline:
             raise RuntimeError('brigade: line too long')
-        self.brigade.appendleft(tmp)
-        self.total += len(tmp)
+        self.scanned = limit
         return EMPTY
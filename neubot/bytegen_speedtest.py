@@ -28,7 +28,7 @@ import sys
 if __name__ == '__main__':
     sys.path.insert(0, '.')
 
-from neubot.utils_random import RANDOMBLOCKS
+from neubot.utils_random import get_payload
 from neubot import utils
 
 PIECE_LEN = 262144
@@ -36,12 +36,16 @@ PIECE_LEN = 262144
 class BytegenSpeedtest(object):
     ''' Bytes generator for speedtest '''
 
-    def __init__(self, seconds, piece_len=PIECE_LEN):
+    def __init__(self, seconds, piece_len=PIECE_LEN, blocks=None):
         ''' Initializer '''
         self.seconds = seconds
         self.ticks = utils.ticks()
         self.closed = False
+        self.pending_crlf = False
         self.piece_len = piece_len
+        if blocks is None:
+            blocks = get_payload()
+        self.blocks = blocks
 
     def read(self, count=sys.maxint):
         ''' Read count bytes '''
@@ -53,7 +57,7 @@ class BytegenSpeedtest(object):
 
         diff = utils.ticks() - self.ticks
         if diff < self.seconds:
-            data = RANDOMBLOCKS.get_block()[:self.piece_len]
+            data = self.blocks.get_block()[:self.piece_len].tobytes()
             length = '%x\r\n' % self.piece_len
             vector = [ length, data, '\r\n' ]
         else:
@@ -62,6 +66,36 @@ class BytegenSpeedtest(object):
 
         return ''.join(vector)
 
+    #
+    # readv() returns the next chunk as a vector, where the payload
+    # is a view of the random block, so that the stream can pass it
+    # to writev() as is.  The CRLF that ends a chunk is sent along
+    # with the header of the next one, so that each chunk costs one
+    # vectored send, and the last vector also ends the body.
+    #
+
+    def readv(self, count=sys.maxint):
+        ''' Read the next chunk as a vector of buffers '''
+
+        if self.closed:
+            return []
+        if count < self.piece_len:
+            raise RuntimeError('Invalid count')
+
+        if self.pending_crlf:
+            header = '\r\n%x\r\n'
+        else:
+            header = '%x\r\n'
+            self.pending_crlf = True
+
+        diff = utils.ticks() - self.ticks
+        if diff < self.seconds:
+            return [header % self.piece_len,
+                    self.blocks.get_block()[:self.piece_len]]
+
+        self.closed = True
+        return [header % 0 + '\r\n']
+
     def close(self):
         ''' Close  '''
         self.closed = True
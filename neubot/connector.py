@@ -31,6 +31,7 @@ import logging
 from neubot.defer import Deferred
 from neubot.pollable import Pollable
 from neubot.poller import POLLER
+from neubot.resolver import RESOLVER
 
 from neubot import utils_net
 from neubot import utils
@@ -39,7 +40,8 @@ class Connector(Pollable):
 
     ''' Pollable socket connector '''
 
-    def __init__(self, parent, endpoint, prefer_ipv6, sslconfig, extra):
+    def __init__(self, parent, endpoint, prefer_ipv6, sslconfig, extra,
+                 sockopts=None):
         Pollable.__init__(self)
 
         self.epnts = collections.deque()
@@ -47,6 +49,7 @@ class Connector(Pollable):
         self.prefer_ipv6 = prefer_ipv6
         self.sslconfig = sslconfig
         self.extra = extra
+        self.sockopts = sockopts
         self.sock = None
         self.timestamp = 0
         self.watchdog = 10
@@ -85,13 +88,19 @@ class Connector(Pollable):
 
     def _connect(self):
         ''' Connect first available epnt '''
-        sock = utils_net.connect(self.epnts.popleft(), self.prefer_ipv6)
-        if sock:
-            self.sock = sock
-            self.timestamp = utils.ticks()
-            POLLER.set_writable(self)
-        else:
-            self._connection_failed()
+        RESOLVER.resolve(self.epnts.popleft(), self.prefer_ipv6,
+                         self._resolved)
+
+    def _resolved(self, addrinfo):
+        ''' Connect the first address that does not fail at once '''
+        for ainfo in addrinfo:
+            sock = utils_net.connect_ainfo(ainfo, self.sockopts)
+            if sock:
+                self.sock = sock
+                self.timestamp = utils.ticks()
+                POLLER.set_writable(self)
+                return
+        self._connection_failed()
 
     def fileno(self):
         return self.sock.fileno()
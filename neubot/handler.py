@@ -36,12 +36,17 @@ class Handler(object):
 
     # Inspired by BitTorrent handle class
 
-    def listen(self, endpoint, prefer_ipv6, sslconfig, sslcert):
+    def listen(self, endpoint, prefer_ipv6, sslconfig, sslcert,
+               sockopts=None):
         ''' Listen() at endpoint '''
-        sockets = utils_net.listen(endpoint, prefer_ipv6)
+        sockets = utils_net.listen(endpoint, prefer_ipv6, sockopts)
         if not sockets:
             self.handle_listen_error(endpoint)
             return
+        if sslconfig and sslcert:
+            # Lazy import, see the comment in neubot/stream.py
+            from neubot import sslstream
+            sslstream.prepare_server(sslcert)
         for sock in sockets:
             Listener(self, sock, endpoint, sslconfig, sslcert)
 
@@ -60,9 +65,11 @@ class Handler(object):
     def handle_accept_error(self, listener):
         ''' Handle the ACCEPT_ERROR event '''
 
-    def connect(self, endpoint, prefer_ipv6, sslconfig, extra):
+    def connect(self, endpoint, prefer_ipv6, sslconfig, extra,
+                sockopts=None):
         ''' Connect() to endpoint '''
-        return Connector(self, endpoint, prefer_ipv6, sslconfig, extra)
+        return Connector(self, endpoint, prefer_ipv6, sslconfig, extra,
+                         sockopts)
 
     def handle_connect_error(self, connector):
         ''' Handle the CONNECT_ERROR event '''
@@ -0,0 +1,253 @@
+# neubot/http/assets.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' In-memory cache of static assets '''
+
+#
+# The web user interface is made of a handful of small files (HTML
+# pages with SSI, jQuery, jqplot and friends) that are requested
+# again and again.  So, the first time we serve a file we keep in
+# memory the SSI-expanded body, its MIME type, a strong ETag and,
+# for compressible types, the gzipped variant.  The entry remembers
+# the mtime and size of the file and of all the files it includes,
+# and we stat() them again at most once every CHECK_INTERVAL seconds,
+# so in the common case a request does not touch the disk at all.
+#
+
+import StringIO
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+
+from neubot.http.ssi import ssi_replace
+
+from neubot import utils
+
+# Seconds between two checks of the files behind an entry
+CHECK_INTERVAL = 1
+
+# Files larger than this are served from disk
+MAXSIZE = 1 << 20
+
+# Do not keep more than this number of bytes in memory
+MAXTOTAL = 1 << 24
+
+# Smaller bodies are not worth compressing
+MINGZIP = 256
+
+COMPRESSIBLE = (
+    "application/javascript",
+    "application/json",
+    "application/x-javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+def guess_type(fullpath, use_mime):
+    ''' Return MIME type and content encoding of @fullpath '''
+    if not use_mime:
+        return "text/plain", None
+    mimetype, encoding = mimetypes.guess_type(fullpath)
+    #XXX Do we need to enforce the charset?
+    if not encoding and mimetype in ("text/html",
+                                     "application/x-javascript"):
+        mimetype += "; charset=UTF-8"
+    return mimetype, encoding
+
+def _compressible(mimetype):
+    ''' Return True if it makes sense to gzip this MIME type '''
+    if not mimetype:
+        return False
+    mimetype = mimetype.split(";")[0]
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE
+
+def _gzip(body):
+    ''' Return the gzipped body '''
+    bodyfp = StringIO.StringIO()
+    # Fixed mtime, so that the result (and its ETag) is stable
+    gzipfp = gzip.GzipFile(fileobj=bodyfp, mode="wb", mtime=0)
+    gzipfp.write(body)
+    gzipfp.close()
+    return bodyfp.getvalue()
+
+def _list_tokens(value):
+    ''' Split a comma separated header value into tokens '''
+    return [token.strip() for token in value.split(",") if token.strip()]
+
+def accepts_gzip(value):
+    ''' Return True if the Accept-Encoding @value allows gzip '''
+    for token in _list_tokens(value):
+        params = [param.strip() for param in token.split(";")]
+        if params[0].lower() not in ("gzip", "x-gzip"):
+            continue
+        for param in params[1:]:
+            if param.replace(" ", "") in ("q=0", "q=0.0", "q=0.00",
+                                          "q=0.000"):
+                return False
+        return True
+    return False
+
+def etag_matches(value, etag):
+    ''' Return True if the If-None-Match @value matches @etag '''
+    for token in _list_tokens(value):
+        # If-None-Match uses the weak comparison function
+        if token == "*" or token.replace("W/", "", 1) == etag:
+            return True
+    return False
+
+def _stat(path):
+    ''' Return the part of stat() we use to detect changes '''
+    result = os.stat(path)
+    return result.st_mtime, result.st_size
+
+class Asset(object):
+
+    ''' A file served from memory '''
+
+    def __init__(self, body, mimetype, encoding, depends):
+        self.body = body
+        self.mimetype = mimetype
+        self.encoding = encoding
+        self.etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        self.gzipped = None
+        self.gzip_etag = None
+        if (not encoding and len(body) >= MINGZIP and
+          _compressible(mimetype)):
+            gzipped = _gzip(body)
+            if len(gzipped) < len(body):
+                self.gzipped = gzipped
+                self.gzip_etag = self.etag[:-1] + '-gzip"'
+        self.depends = depends
+        self.checked = utils.ticks()
+
+    def size(self):
+        ''' Number of bytes of memory used by this entry '''
+        if self.gzipped is None:
+            return len(self.body)
+        return len(self.body) + len(self.gzipped)
+
+    def is_fresh(self):
+        ''' Return True if the files behind this entry did not change '''
+        now = utils.ticks()
+        if now - self.checked < CHECK_INTERVAL:
+            return True
+        for path, result in self.depends:
+            try:
+                if _stat(path) != result:
+                    return False
+            except OSError:
+                return False
+        self.checked = now
+        return True
+
+    def compose_response(self, request, response):
+        ''' Compose the @response to @request '''
+
+        if self.gzipped is not None and accepts_gzip(
+          request["accept-encoding"]):
+            body, etag, encoding = self.gzipped, self.gzip_etag, "gzip"
+        else:
+            body, etag, encoding = self.body, self.etag, self.encoding
+
+        if etag_matches(request["if-none-match"], etag):
+            response.compose(code="304", reason="Not Modified")
+            # A 304 response never has a body
+            del response["content-length"]
+        else:
+            response.compose(code="200", reason="Ok", body=body,
+                             mimetype=self.mimetype)
+            if encoding:
+                response["content-encoding"] = encoding
+            if request.method == "HEAD":
+                response.body = ""
+                response.length = 0
+
+        response["etag"] = etag
+        if self.gzipped is not None:
+            response["vary"] = "Accept-Encoding"
+
+class AssetCache(object):
+
+    ''' Cache of static assets indexed by path '''
+
+    #
+    # The key is the tuple (rootdir, path, use_mime, use_ssi), where
+    # path is the request URI without query, so that on a hit we do
+    # not even need to map the URI to a file name, which requires a
+    # few lstat() calls.
+    #
+
+    def __init__(self):
+        self.assets = {}
+        self.total = 0
+
+    def lookup(self, key):
+        ''' Return the cached asset for @key, or None '''
+        asset = self.assets.get(key)
+        if asset is not None and not asset.is_fresh():
+            logging.debug("assets: %s has changed", key[1])
+            self._forget(key)
+            asset = None
+        return asset
+
+    def load(self, key, rootdir, fullpath, use_mime, use_ssi):
+        '''
+         Load @fullpath and cache it using @key.  Returns None if
+         the file is too large to be served from memory and raises
+         IOError or OSError if the file cannot be read.
+        '''
+
+        filep = open(fullpath, "rb")
+        try:
+            result = os.fstat(filep.fileno())
+            if result.st_size > MAXSIZE:
+                return None
+            depends = [(fullpath, (result.st_mtime, result.st_size))]
+
+            mimetype, encoding = guess_type(fullpath, use_mime)
+            # Do not attempt SSI if the resource is, say, gzipped
+            if use_ssi and not encoding and mimetype and \
+              mimetype.startswith("text/html"):
+                included = []
+                body = ssi_replace(rootdir, filep, included)
+                for path in included:
+                    depends.append((path, _stat(path)))
+            else:
+                body = filep.read()
+        finally:
+            filep.close()
+
+        asset = Asset(body, mimetype, encoding, depends)
+        if key in self.assets:
+            self._forget(key)
+        if self.total + asset.size() <= MAXTOTAL:
+            logging.debug("assets: caching %s", fullpath)
+            self.assets[key] = asset
+            self.total += asset.size()
+        return asset
+
+    def _forget(self, key):
+        ''' Remove an entry from the cache '''
+        asset = self.assets.pop(key)
+        self.total -= asset.size()
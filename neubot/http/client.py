@@ -38,11 +38,15 @@ from neubot.net.stream import StreamHandler
 from neubot.http.stream import ERROR
 from neubot.http.stream import nextstate
 from neubot.http.message import Message
+from neubot.http_pool import ConnectionPool
 from neubot.net.poller import POLLER
 from neubot import utils
 from neubot import utils_net
 from neubot.main import common
 
+# Idle keep-alive connections, indexed by (endpoint, secure)
+POOL = ConnectionPool()
+
 class ClientStream(StreamHTTP):
 
     ''' Specializes StreamHTTP and implements the client
@@ -52,6 +56,8 @@ class ClientStream(StreamHTTP):
         ''' Initialize client stream '''
         StreamHTTP.__init__(self, poller)
         self.requests = collections.deque()
+        self.pool_key = None
+        self.rtt = 0.0
 
     def send_request(self, request, response=None):
         ''' Sends a request '''
@@ -111,6 +117,17 @@ class ClientStream(StreamHTTP):
         else:
             self.close()
 
+class IdleParent(object):
+
+    ''' Parent of the streams waiting in the pool '''
+
+    @staticmethod
+    def connection_lost(stream):
+        ''' Invoked when an idle stream is closed '''
+        POOL.discard(stream)
+
+IDLE_PARENT = IdleParent()
+
 class ClientHTTP(StreamHandler):
 
     ''' Manages one or more HTTP streams '''
@@ -138,6 +155,46 @@ class ClientHTTP(StreamHandler):
         else:
             self.connect(endpoint, count)
 
+    def connect(self, endpoint, count=1):
+        ''' Connects to endpoint, reusing idle connections if possible '''
+        key = (endpoint, self.conf.get("net.stream.secure", False))
+        while count > 0:
+            stream = POOL.get(key)
+            if not stream:
+                break
+            # Like a new connection, connection_ready() is not immediate
+            self.poller.sched(0, self._reuse_stream, stream, endpoint)
+            count -= 1
+        if count > 0:
+            StreamHandler.connect(self, endpoint, count)
+
+    def _reuse_stream(self, args):
+        ''' Pass an idle connection to connection_ready() '''
+        stream, endpoint = args
+        if stream.close_complete:
+            StreamHandler.connect(self, endpoint, 1)
+            return
+        stream.parent = self
+        # Report the original connect() RTT, as for a new connection
+        self.rtts.append(stream.rtt)
+        if stream.rtt:
+            self.rtt = stream.rtt
+        self.connection_ready(stream)
+
+    def release_stream(self, stream):
+        ''' Done with stream: keep it in the pool, if possible '''
+        if (not stream.pool_key or stream.requests or stream.send_pending
+          or stream.close_pending or stream.close_complete):
+            stream.close()
+            return
+        # The user is done with the connection, as if it was closed
+        self.connection_lost(stream)
+        if stream.close_pending or stream.close_complete:
+            return
+        stream.parent = IDLE_PARENT
+        if not POOL.put(stream.pool_key, stream):
+            stream.close()
+
     def connection_ready(self, stream):
         ''' Invoked when the connection is ready '''
 
@@ -157,6 +214,8 @@ class ClientHTTP(StreamHandler):
         if not self.host_header:
             self.host_header = utils_net.format_epnt(endpoint)
         stream = ClientStream(self.poller)
+        stream.pool_key = (endpoint, self.conf.get("net.stream.secure", False))
+        stream.rtt = rtt
         stream.attach(self, sock, self.conf)
         self.connection_ready(stream)
 
@@ -26,12 +26,13 @@
 
 import StringIO
 import email.utils
-import collections
 import urlparse
 import socket
 import os
 import logging
+import time
 
+from neubot.log import debug_enabled
 from neubot.log import oops
 
 from neubot import compat
@@ -49,6 +50,33 @@ REDIRECT = '''\
 </HTML>
 '''
 
+#
+# The Date header has a resolution of one second, so we format
+# it at most once per second, rather than once per message.
+#
+_DATE_SECOND = -1
+_DATE_STRING = ""
+
+def http_date():
+    ''' Return the current date formatted for the Date header '''
+    global _DATE_SECOND, _DATE_STRING
+    now = int(time.time())
+    if now != _DATE_SECOND:
+        _DATE_STRING = email.utils.formatdate(now, usegmt=True)
+        _DATE_SECOND = now
+    return _DATE_STRING
+
+# Header names as we send them on the wire, indexed by lowercase name
+HEADER_CASE = {}
+
+def _capitalize(key):
+    ''' Return the header name as we send it on the wire '''
+    name = HEADER_CASE.get(key)
+    if not name:
+        name = "-".join([s.capitalize() for s in key.split("-")])
+        HEADER_CASE[key] = name
+    return name
+
 def urlsplit(uri):
     ''' Wrapper for urlparse.urlsplit() '''
     scheme, netloc, path, query, fragment = urlparse.urlsplit(uri)
@@ -107,9 +135,12 @@ class Message(object):
         # For server-side accounting
         self.requestline = " ".join((method, uri, protocol))
 
-        self.headers = collections.defaultdict(str)
+        self.headers = {}
         self.body = StringIO.StringIO("")
 
+        # Headers serialized in advance, see ResponseTemplate
+        self.serialized = ""
+
         self.family = socket.AF_UNSPEC
         self.response = None
         self.length = 0
@@ -125,6 +156,19 @@ class Message(object):
     #
     def serialize_headers(self):
         ''' Serialize message headers '''
+        return StringIO.StringIO(self.serialize_headers_string())
+
+    def serialize_headers_string(self):
+        ''' Serialize message headers into a string '''
+        verbose = debug_enabled()
+
+        if self.serialized:
+            if verbose:
+                for line in self.serialized.split("\r\n")[:-2]:
+                    logging.debug("> %s", line)
+                logging.debug(">")
+            return self.serialized
+
         vector = []
 
         if self.method:
@@ -146,24 +190,26 @@ class Message(object):
             vector.append(" ")
             vector.append(self.reason)
 
-        logging.debug("> %s", "".join(vector))
+        if verbose:
+            logging.debug("> %s", "".join(vector))
         vector.append("\r\n")
 
         for key, value in self.headers.items():
-            key = "-".join(map(lambda s: s.capitalize(), key.split("-")))
+            key = _capitalize(key)
             vector.append(key)
             vector.append(": ")
             vector.append(value)
 
-            logging.debug("> %s: %s", key, value)
+            if verbose:
+                logging.debug("> %s: %s", key, value)
             vector.append("\r\n")
 
-        logging.debug(">")
+        if verbose:
+            logging.debug(">")
         vector.append("\r\n")
 
         string = "".join(vector)
-        string = utils.stringify(string)
-        return StringIO.StringIO(string)
+        return utils.stringify(string)
 
     def serialize_body(self):
         ''' Serialize message body '''
@@ -179,20 +225,22 @@ class Message(object):
     #
     def __getitem__(self, key):
         ''' Return an header '''
-        return self.headers[key.lower()]
+        return self.headers.get(key.lower(), "")
 
     def __setitem__(self, key, value):
         ''' Save an header '''
         key = key.lower()
-        if self.headers.has_key(key):
+        if key in self.headers:
             value = self.headers[key] + ", " + value
         self.headers[key] = value
+        self.serialized = ""
 
     def __delitem__(self, key):
         ''' Delete an header '''
         key = key.lower()
-        if self.headers.has_key(key):
+        if key in self.headers:
             del self.headers[key]
+        self.serialized = ""
 
     #
     # Note that compose() is meant for composing request messages
@@ -238,7 +286,7 @@ class Message(object):
             self["cache-control"] = "no-cache"
 
         if kwargs.get("date", True):
-            self["date"] = email.utils.formatdate(usegmt=True)
+            self["date"] = http_date()
 
         if not kwargs.get("keepalive", True):
             self["connection"] = "close"
@@ -329,3 +377,35 @@ class Message(object):
         if length < 0:
             raise ValueError("Content-Length must be positive")
         return length
+
+class ResponseTemplate(object):
+
+    ''' A response that is always the same but for the Date header,
+        serialized once and again only when the date changes.  The
+        body, if any, must be a string. '''
+
+    def __init__(self, **kwargs):
+        ''' Initialize the template from compose() arguments '''
+        self.kwargs = kwargs
+        self.message = None
+        self.date = ""
+
+    def response(self):
+        ''' Return a new response built from the template '''
+        date = http_date()
+        if date != self.date:
+            template = Message()
+            template.compose(**self.kwargs)
+            if not isinstance(template.body, basestring):
+                template.body = template.body.read()
+            template.serialized = template.serialize_headers_string()
+            self.message = template
+            self.date = date
+        template = self.message
+        response = Message(code=template.code, reason=template.reason,
+                           protocol=template.protocol)
+        response.headers = template.headers.copy()
+        response.body = template.body
+        response.length = template.length
+        response.serialized = template.serialized
+        return response
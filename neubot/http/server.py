@@ -23,7 +23,6 @@
 ''' HTTP server '''
 
 import StringIO
-import mimetypes
 import os.path
 import sys
 import time
@@ -33,6 +32,8 @@ if __name__ == "__main__":
     sys.path.insert(0, ".")
 
 from neubot.config import CONFIG
+from neubot.http.assets import AssetCache
+from neubot.http.assets import guess_type
 from neubot.http.stream import ERROR
 from neubot.http.message import Message
 from neubot.http.ssi import ssi_replace
@@ -59,6 +60,22 @@ MONTH = [
     "Sep", "Oct", "Nov", "Dec",
 ]
 
+# Like the Date header, the access log time changes once per second
+_LOGTIME_SECOND = -1
+_LOGTIME_STRING = ""
+
+def _access_log_time():
+    ''' Return the current time formatted for the access log '''
+    global _LOGTIME_SECOND, _LOGTIME_STRING
+    now = int(time.time())
+    if now != _LOGTIME_SECOND:
+        tm_ = time.gmtime(now)
+        _LOGTIME_STRING = "%02d/%s/%04d:%02d:%02d:%02d -0000" % (
+          tm_.tm_mday, MONTH[tm_.tm_mon], tm_.tm_year, tm_.tm_hour,
+          tm_.tm_min, tm_.tm_sec)
+        _LOGTIME_SECOND = now
+    return _LOGTIME_STRING
+
 class ServerStream(StreamHTTP):
 
     ''' Specializes StreamHTTP to implement the server-side
@@ -123,9 +140,7 @@ class ServerStream(StreamHTTP):
             self.close()
 
         address = self.peername[0]
-        now = time.gmtime()
-        timestring = "%02d/%s/%04d:%02d:%02d:%02d -0000" % (now.tm_mday,
-          MONTH[now.tm_mon], now.tm_year, now.tm_hour, now.tm_min, now.tm_sec)
+        timestring = _access_log_time()
         requestline = request.requestline
         statuscode = response.code
 
@@ -149,6 +164,7 @@ class ServerHTTP(StreamHandler):
         StreamHandler.__init__(self, poller)
         self._ssl_ports = set()
         self.childs = {}
+        self.assets = AssetCache()
 
     def bind_failed(self, epnt):
         ''' Invoked when we cannot bind a socket '''
@@ -163,6 +179,11 @@ class ServerHTTP(StreamHandler):
     def register_ssl_port(self, port):
         ''' Register a port where we should speak SSL '''
         self._ssl_ports.add(port)
+        try:
+            from neubot import sslstream
+        except ImportError:
+            return
+        sslstream.prepare_server("/etc/neubot/cert.pem")
 
     def got_request_headers(self, stream, request):
         ''' Invoked when we got request headers '''
@@ -181,6 +202,12 @@ class ServerHTTP(StreamHandler):
     def process_request(self, stream, request):
         ''' Process a request and generate the response '''
 
+        if request.uri.startswith("/"):
+            for prefix, child in self.childs.items():
+                if request.uri.startswith(prefix):
+                    child.process_request(stream, request)
+                    return
+
         response = Message()
 
         if not request.uri.startswith("/"):
@@ -189,11 +216,6 @@ class ServerHTTP(StreamHandler):
             stream.send_response(request, response)
             return
 
-        for prefix, child in self.childs.items():
-            if request.uri.startswith(prefix):
-                child.process_request(stream, request)
-                return
-
         rootdir = self.conf.get("http.server.rootdir", "")
         if not rootdir:
             response.compose(code="403", reason="Forbidden",
@@ -211,6 +233,15 @@ class ServerHTTP(StreamHandler):
         else:
             request_uri = request.uri
 
+        use_mime = self.conf.get("http.server.mime", True)
+        use_ssi = self.conf.get("http.server.ssi", False)
+        key = (rootdir, request_uri, use_mime, use_ssi)
+        asset = self.assets.lookup(key)
+        if asset:
+            asset.compose_response(request, response)
+            stream.send_response(request, response)
+            return
+
         fullpath = utils_path.append(rootdir, request_uri, True)
         if not fullpath:
             response.compose(code="403", reason="Forbidden",
@@ -219,7 +250,10 @@ class ServerHTTP(StreamHandler):
             return
 
         try:
-            filep = open(fullpath, "rb")
+            asset = self.assets.load(key, rootdir, fullpath, use_mime,
+                                     use_ssi)
+            if not asset:
+                filep = open(fullpath, "rb")
         except (IOError, OSError):
             logging.error("HTTP: Not Found: %s (WWWDIR: %s)",
                           fullpath, rootdir)
@@ -228,25 +262,18 @@ class ServerHTTP(StreamHandler):
             stream.send_response(request, response)
             return
 
-        if self.conf.get("http.server.mime", True):
-            mimetype, encoding = mimetypes.guess_type(fullpath)
-
-            # Do not attempt SSI if the resource is, say, gzipped
-            if not encoding:
-                if mimetype == "text/html":
-                    ssi = self.conf.get("http.server.ssi", False)
-                    if ssi:
-                        body = ssi_replace(rootdir, filep)
-                        filep = StringIO.StringIO(body)
-
-                #XXX Do we need to enforce the charset?
-                if mimetype in ("text/html", "application/x-javascript"):
-                    mimetype += "; charset=UTF-8"
-            else:
-                response["content-encoding"] = encoding
+        if asset:
+            asset.compose_response(request, response)
+            stream.send_response(request, response)
+            return
 
-        else:
-            mimetype = "text/plain"
+        # Too large to be kept in memory: stream it from disk
+        mimetype, encoding = guess_type(fullpath, use_mime)
+        if encoding:
+            response["content-encoding"] = encoding
+        elif mimetype and mimetype.startswith("text/html") and use_ssi:
+            body = ssi_replace(rootdir, filep)
+            filep = StringIO.StringIO(body)
 
         response.compose(code="200", reason="Ok", body=filep,
                          mimetype=mimetype)
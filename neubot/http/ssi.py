@@ -39,14 +39,16 @@ from neubot import utils_path
 MAXDEPTH = 8
 REGEX = '<!--#include virtual="([A-Za-z0-9./_-]+)"-->'
 
-def ssi_open(rootdir, path, mode):
+def ssi_open(rootdir, path, mode, included=None):
     ''' Wrapper for open() that makes security checks '''
     path = utils_path.append(rootdir, path, False)
     if not path:
         raise ValueError("ssi: Path name above root directory")
+    if included is not None:
+        included.append(path)
     return open(path, mode)
 
-def ssi_split(rootdir, document, page, count):
+def ssi_split(rootdir, document, page, count, included=None):
     ''' Split the page and perform inclusion '''
     if count > MAXDEPTH:
         raise ValueError("ssi: Too many nested includes")
@@ -54,17 +56,18 @@ def ssi_split(rootdir, document, page, count):
     for chunk in re.split(REGEX, document):
         if include:
             include = False
-            filep = ssi_open(rootdir, chunk, "rb")
-            ssi_split(rootdir, filep.read(), page, count + 1)
+            filep = ssi_open(rootdir, chunk, "rb", included)
+            ssi_split(rootdir, filep.read(), page, count + 1, included)
             filep.close()
         else:
             include = True
             page.append(chunk)
 
-def ssi_replace(rootdir, filep):
-    ''' Replace with SSI the content of @filep '''
+def ssi_replace(rootdir, filep, included=None):
+    ''' Replace with SSI the content of @filep, appending the
+        path of each included file to @included, if not None '''
     page = []
-    ssi_split(rootdir, filep.read(), page, 0)
+    ssi_split(rootdir, filep.read(), page, 0, included)
     return "".join(page)
 
 if __name__ == "__main__":
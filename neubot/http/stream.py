@@ -28,6 +28,8 @@ import logging
 
 from neubot.net.stream import MAXBUF
 from neubot.net.stream import Stream
+from neubot import log
+from neubot import utils
 
 # Accepted HTTP protocols
 PROTOCOLS = [ "HTTP/1.0", "HTTP/1.1" ]
@@ -35,6 +37,24 @@ PROTOCOLS = [ "HTTP/1.0", "HTTP/1.1" ]
 # Maximum allowed line length
 MAXLINE = 1 << 15
 
+# Maximum allowed length of the first line plus headers
+MAXHEADERS = 1 << 16
+
+#
+# Common header names, as they are usually spelled on the wire,
+# mapped to the interned lowercase name we pass to got_header().
+# The lookup saves a lower() and the interned names make the
+# later lookups in Message.headers cheaper.
+#
+HEADER_NAMES = {}
+for _name in ("Accept", "Accept-Encoding", "Authorization",
+              "Cache-Control", "Connection", "Content-Length",
+              "Content-Type", "Date", "ETag", "Host", "If-None-Match",
+              "Last-Modified", "Location", "Pragma", "Range", "Server",
+              "Transfer-Encoding", "User-Agent"):
+    HEADER_NAMES[_name] = HEADER_NAMES[_name.lower()] = intern(_name.lower())
+del _name
+
 # Possible states of the receiver
 (IDLE, BOUNDED, UNBOUNDED, CHUNK, CHUNK_END, FIRSTLINE,
  HEADER, CHUNK_LENGTH, TRAILER, ERROR) = range(0,10)
@@ -58,9 +78,13 @@ class StreamHTTP(Stream):
     def __init__(self, poller):
         ''' Initialize the stream '''
         Stream.__init__(self, poller)
-        self.incoming = []
+        self.incoming = ""
         self.state = FIRSTLINE
         self.left = 0
+        self.sink = False
+        self.sink_bytes = 0
+        self.sink_first = 0.0
+        self.sink_last = 0.0
 
     def connection_made(self):
         ''' Called when the connection is created '''
@@ -73,7 +97,7 @@ class StreamHTTP(Stream):
         # it's possible for body to be `up to end of file`
         if self.eof and self.state == UNBOUNDED:
             self.got_end_of_body()
-        self.incoming = None
+        self.incoming = ""
 
     # Send
 
@@ -81,59 +105,95 @@ class StreamHTTP(Stream):
         ''' Send a message '''
         if message.length >= 0 and message.length <= smallmessage:
             vector = []
-            vector.append(message.serialize_headers().read())
+            vector.append(message.serialize_headers_string())
             body = message.serialize_body()
             if not isinstance(body, basestring):
-                vector.append(body.read())
-            else:
-                vector.append(body)
+                body = body.read()
+                # E.g., RandomBody returns memoryviews
+                if isinstance(body, memoryview):
+                    body = body.tobytes()
+            vector.append(body)
             data = "".join(vector)
             self.start_send(data)
         else:
-            self.start_send(message.serialize_headers())
+            self.start_send(message.serialize_headers_string())
             self.start_send(message.serialize_body())
 
     # Recv
 
+    #
+    # A handler that is only interested in the amount of body bytes
+    # and in when they arrived (e.g., the speedtest upload) invokes
+    # sink_body() before got_end_of_headers() returns, i.e. from the
+    # server's got_request_headers() hook.  In this mode
+    # got_piece() is not invoked for the current message, and the
+    # receiver just advances the sink_bytes, sink_first and sink_last
+    # counters, which are reset when the next message begins.
+    #
+
+    def sink_body(self):
+        ''' Count and discard the body of the current message '''
+        self.sink = True
+
+    #
+    # The receiver scans each fragment in place, keeping an offset
+    # into it, and only the incomplete tail is saved and prepended
+    # to the next fragment.  Body pieces are passed upstream as
+    # buffer() views of the fragment, so they are copied only by
+    # consumers that keep them.  In the FIRSTLINE state we wait for
+    # the blank line that ends the headers and we parse all of them
+    # at once, instead of line by line.  Chunk lengths and trailers
+    # are still parsed one line at a time.
+    #
+
     def recv_complete(self, data):
         ''' We've received successfully some data '''
         if self.close_complete or self.close_pending:
             return
 
-        #This one should be debug2 as well
-        #logging.debug("HTTP receiver: got %d bytes", len(data))
-
-        # merge with previous fragments (if any)
+        # merge with the previous remainder (if any)
         if self.incoming:
-            self.incoming.append(data)
-            data = "".join(self.incoming)
-            del self.incoming[:]
+            data = self.incoming + data
+            self.incoming = ""
 
         # consume the current fragment
         offset = 0
         length = len(data)
-        while length > 0:
-            #ostate = self.state        # needed by commented-out code below
+        while offset < length:
 
             # when we know the length we're looking for a piece
-            if self.left > 0:
-                count = min(self.left, length)
+            if self.left > 0 and self.sink:
+                count = min(self.left, length - offset)
+                self.left -= count
+                offset += count
+                self._sunk_piece(count)
+
+            elif self.left > 0:
+                count = min(self.left, length - offset)
                 piece = buffer(data, offset, count)
                 self.left -= count
                 offset += count
-                length -= count
                 self._got_piece(piece)
 
+            # at the beginning of a message we look for all headers
+            elif self.state == FIRSTLINE and self.left == 0:
+                index = _find_end_of_headers(data, offset)
+                if index == -1:
+                    if length - offset > MAXHEADERS:
+                        raise RuntimeError("Headers too long")
+                    break
+                self._got_headers(data, offset, index)
+                offset = index
+
             # otherwise we're looking for the next line
             elif self.left == 0:
                 index = data.find("\n", offset)
                 if index == -1:
-                    if length > MAXLINE:
+                    if length - offset > MAXLINE:
                         raise RuntimeError("Line too long")
                     break
                 index = index + 1
                 line = data[offset:index]
-                length -= (index - offset)
                 offset = index
                 self._got_line(line)
 
@@ -145,60 +205,71 @@ class StreamHTTP(Stream):
             if self.close_complete or self.close_pending:
                 return
 
-#           Should be debug2() not debug()
-#           logging.debug("HTTP receiver: %s -> %s",
-#                         STATES[ostate], STATES[self.state])
-
         # keep the eventual remainder for later
-        if length > 0:
-            remainder = data[offset:]
-            self.incoming.append(remainder)
-            logging.debug("HTTP receiver: remainder %d", len(remainder))
+        if offset < length:
+            self.incoming = data[offset:]
 
         # get the next fragment
         self.start_recv()
 
+    def _got_headers(self, data, offset, index):
+        ''' We've got the first line and the headers '''
+        lines = data[offset:index].split("\n")
+        verbose = log.debug_enabled()
+
+        self.sink = False
+        self.sink_bytes = 0
+        self.sink_first = self.sink_last = 0.0
+
+        line = lines[0].strip()
+        if verbose:
+            logging.debug("< %s", line)
+        vector = line.split(None, 2)
+        if len(vector) != 3:
+            raise RuntimeError("Invalid first line")
+        if line.startswith("HTTP"):
+            protocol, code, reason = vector
+            if protocol not in PROTOCOLS:
+                raise RuntimeError("Invalid protocol")
+            self.got_response_line(protocol, code, reason)
+        else:
+            method, uri, protocol = vector
+            if protocol not in PROTOCOLS:
+                raise RuntimeError("Invalid protocol")
+            self.got_request_line(method, uri, protocol)
+        self.state = HEADER
+
+        # The last two lines are the empty line and what follows it
+        for line in lines[1:-2]:
+            if self.close_complete or self.close_pending:
+                return
+            if verbose:
+                logging.debug("< %s", line.rstrip())
+            # not handling mime folding
+            key, separator, value = line.partition(":")
+            if not separator:
+                raise RuntimeError("Invalid header line")
+            key = key.strip()
+            name = HEADER_NAMES.get(key)
+            if not name:
+                name = key.lower()
+            self.got_header(name, value.strip())
+
+        if self.close_complete or self.close_pending:
+            return
+        if verbose:
+            logging.debug("<")
+        self.state, self.left = self.got_end_of_headers()
+        if self.state == ERROR:
+            # allow upstream to filter out unwanted requests
+            self.close()
+        elif self.state == FIRSTLINE:
+            # this is the case of an empty body
+            self.got_end_of_body()
+
     def _got_line(self, line):
         ''' We've got a line... what do we do? '''
-        if self.state == FIRSTLINE:
-            line = line.strip()
-            logging.debug("< %s", line)
-            vector = line.split(None, 2)
-            if len(vector) == 3:
-                if line.startswith("HTTP"):
-                    protocol, code, reason = vector
-                    if protocol in PROTOCOLS:
-                        self.got_response_line(protocol, code, reason)
-                else:
-                    method, uri, protocol = vector
-                    if protocol in PROTOCOLS:
-                        self.got_request_line(method, uri, protocol)
-                if protocol not in PROTOCOLS:
-                    raise RuntimeError("Invalid protocol")
-                else:
-                    self.state = HEADER
-            else:
-                raise RuntimeError("Invalid first line")
-        elif self.state == HEADER:
-            if line.strip():
-                logging.debug("< %s", line)
-                # not handling mime folding
-                index = line.find(":")
-                if index >= 0:
-                    key, value = line.split(":", 1)
-                    self.got_header(key.strip(), value.strip())
-                else:
-                    raise RuntimeError("Invalid header line")
-            else:
-                logging.debug("<")
-                self.state, self.left = self.got_end_of_headers()
-                if self.state == ERROR:
-                    # allow upstream to filter out unwanted requests
-                    self.close()
-                elif self.state == FIRSTLINE:
-                    # this is the case of an empty body
-                    self.got_end_of_body()
-        elif self.state == CHUNK_LENGTH:
+        if self.state == CHUNK_LENGTH:
             vector = line.split()
             if vector:
                 length = int(vector[0], 16)
@@ -243,6 +314,25 @@ class StreamHTTP(Stream):
         else:
             raise RuntimeError("Not expecting a piece")
 
+    def _sunk_piece(self, count):
+        ''' Like _got_piece() but we just count the bytes '''
+        now = utils.ticks()
+        if not self.sink_bytes:
+            self.sink_first = now
+        self.sink_last = now
+        self.sink_bytes += count
+        if self.state == BOUNDED:
+            if self.left == 0:
+                self.state = FIRSTLINE
+                self.got_end_of_body()
+        elif self.state == UNBOUNDED:
+            self.left = MAXBUF
+        elif self.state == CHUNK:
+            if self.left == 0:
+                self.state = CHUNK_END
+        else:
+            raise RuntimeError("Not expecting a piece")
+
     # Events for upstream
 
     def got_request_line(self, method, uri, protocol):
@@ -268,6 +358,19 @@ class StreamHTTP(Stream):
     def message_sent(self):
         ''' The message was sent '''
 
+def _find_end_of_headers(data, offset):
+    ''' Return the index past the empty line ending headers, or -1 '''
+    index = data.find("\n\r\n", offset)
+    if index >= 0:
+        second = data.find("\n\n", offset, index)
+        if second >= 0:
+            return second + 2
+        return index + 3
+    index = data.find("\n\n", offset)
+    if index >= 0:
+        return index + 2
+    return -1
+
 #
 # Quoting from RFC2616, sect. 4.3:
 #
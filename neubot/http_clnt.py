@@ -35,6 +35,7 @@ if __name__ == '__main__':
 
 from neubot.brigade import Brigade
 from neubot.handler import Handler
+from neubot.http_pool import ConnectionPool
 from neubot.poller import POLLER
 from neubot.stream import Stream
 
@@ -66,6 +67,9 @@ SPACE = six.b(' ')
 TAB = six.b('\t')
 TRANSFER_ENCODING = six.b('transfer-encoding')
 
+# Idle keep-alive connections, indexed by (endpoint, sslconfig)
+POOL = ConnectionPool()
+
 class ClientContext(Brigade):
 
     ''' HTTP client context '''
@@ -92,11 +96,57 @@ class ClientContext(Brigade):
         self.extra = extra
         self.connection_made = connection_made
         self.connection_lost = connection_lost
+        self.pool_key = None
 
 class HttpClient(Handler):
 
     ''' HTTP client '''
 
+    def __init__(self):
+        Handler.__init__(self)
+        self.connecting = set()
+
+    #
+    # Connect.  We first look for an idle connection to the same endpoint
+    # in the pool and, if there is one, we pass it to handle_connect(), in
+    # place of the socket, from the next poller iteration, so that the
+    # user sees the same sequence of events as with a new connection.
+    # Then create_stream() recognizes that it is a stream.  When done,
+    # the user should invoke release_stream() instead of close(), so that
+    # the connection goes back to the pool, if possible.  Note that, when
+    # it reuses an idle connection, connect() returns None rather than a
+    # connector, therefore errfuncs cannot be registered in that case.
+    #
+
+    def connect(self, endpoint, prefer_ipv6, sslconfig, extra,
+                sockopts=None):
+        ''' Connect() to endpoint, reusing an idle connection if possible;
+            returns the connector, or None if the connection is reused '''
+        stream = POOL.get((endpoint, sslconfig))
+        if stream:
+            POLLER.sched(0, self._reuse_stream, stream, endpoint,
+                         prefer_ipv6, sslconfig, extra, sockopts)
+            return None
+        return self._connect(endpoint, prefer_ipv6, sslconfig, extra,
+                             sockopts)
+
+    def _connect(self, endpoint, prefer_ipv6, sslconfig, extra, sockopts):
+        ''' Create a new connection to endpoint '''
+        connector = Handler.connect(self, endpoint, prefer_ipv6, sslconfig,
+                                    extra, sockopts)
+        connector.pool_key = (endpoint, sslconfig)
+        connector.register_errfunc(self.connecting.discard)
+        self.connecting.add(connector)
+        return connector
+
+    def _reuse_stream(self, args):
+        ''' Pass an idle connection to handle_connect() '''
+        stream, endpoint, prefer_ipv6, sslconfig, extra, sockopts = args
+        if stream.isclosed:
+            self._connect(endpoint, prefer_ipv6, sslconfig, extra, sockopts)
+            return
+        self.handle_connect(None, stream, 0.0, sslconfig, extra)
+
     #
     # Setup.  The user should implement handle_connect() and invoke the
     # create_stream() function to setup a new stream.  Stream creation is
@@ -110,8 +160,21 @@ class HttpClient(Handler):
     def create_stream(self, sock, connection_made, connection_lost,
           sslconfig, sslcert, extra):
         ''' Creates an HTTP stream '''
-        logging.debug('http_clnt: stream setup... in progress')
         context = ClientContext(extra, connection_made, connection_lost)
+        if isinstance(sock, Stream):
+            # An idle connection from the pool: the receiver is running
+            logging.debug('http_clnt: stream setup... reused')
+            context.pool_key = sock.opaque.pool_key
+            context.handle_line = self._handle_firstline
+            sock.opaque = context
+            context.connection_made(sock)
+            return
+        logging.debug('http_clnt: stream setup... in progress')
+        for connector in self.connecting:
+            if connector.sock is sock:
+                self.connecting.remove(connector)
+                context.pool_key = connector.pool_key
+                break
         Stream(sock, self._handle_connection_made, self._handle_connection_lost,
           sslconfig, sslcert, context)
 
@@ -130,6 +193,35 @@ class HttpClient(Handler):
         if context.connection_lost:
             context.connection_lost(stream)
 
+    def release_stream(self, stream):
+        ''' Done with stream: keep it in the pool, if possible '''
+        context = stream.opaque
+        reusable = (context.pool_key and context.protocol == HTTP11 and
+          context.headers.get(CONNECTION) != CLOSE and
+          context.handle_line == self._handle_firstline and
+          not context.left and not context.total and
+          not context.outq and not context.outfp)
+        if not reusable or stream.isclosed:
+            stream.close()
+            return
+        # The user is done with the connection, as if it was closed
+        if context.connection_lost:
+            context.connection_lost(stream)
+        if stream.isclosed:
+            return
+        idle = ClientContext(None, None, POOL.discard)
+        idle.pool_key = context.pool_key
+        idle.handle_line = self._handle_idle_line
+        stream.opaque = idle
+        if not POOL.put(idle.pool_key, stream):
+            stream.close()
+
+    @staticmethod
+    def _handle_idle_line(stream, line):
+        ''' Handles data received on an idle connection '''
+        logging.warning('http_clnt: unexpected data on idle connection')
+        stream.close()
+
     #
     # Send path.  This section provides methods to append stuff to the internal
     # output buffer, including an open file handle.  The user is expected to
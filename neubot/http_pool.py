@@ -0,0 +1,113 @@
+# neubot/http_pool.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Pool of idle keep-alive HTTP connections '''
+
+# Python3-ready: yes
+
+#
+# When a client is done with a connection it can release it, rather
+# than closing it, and the next connect() to the same endpoint picks
+# it up instead of opening a new one.  Both the old (neubot/http)
+# and the new (neubot/http_clnt.py) clients use the pool, each one
+# with its own streams and keys.  The HTTP receiver stays active on
+# idle connections, so the pool learns about EOF, RST or unexpected
+# data through the stream's close path and drops the connection.
+# Idle connections are closed by the poller watchdog after IDLE_TIMEOUT
+# seconds, and are checked again with select() right before reuse,
+# in case the peer has closed the connection in the meantime.
+#
+
+import logging
+import select
+
+from neubot.pollable import WATCHDOG
+
+# Max number of idle connections per endpoint
+MAXIDLE = 4
+
+# Seconds after which an idle connection is closed
+IDLE_TIMEOUT = 15
+
+def _is_alive(stream):
+    ''' Return True if the idle stream has not been closed by peer '''
+    # Readable means EOF, RST or unexpected data: all fatal
+    try:
+        return not select.select([stream.fileno()], [], [], 0)[0]
+    except (select.error, ValueError):
+        return False
+
+class ConnectionPool(object):
+
+    ''' Pool of idle connections indexed by endpoint '''
+
+    def __init__(self):
+        self.idle = {}
+        self.keys = {}
+        self.stats = {
+            'http_pool.hits': 0,
+            'http_pool.misses': 0,
+        }
+
+    def put(self, key, stream):
+        ''' Park an idle stream, returns False if the pool is full '''
+        streams = self.idle.setdefault(key, [])
+        if len(streams) >= MAXIDLE:
+            return False
+        logging.debug('http_pool: parking %s', stream)
+        streams.append(stream)
+        self.keys[stream] = key
+        stream.set_timeout(IDLE_TIMEOUT)
+        return True
+
+    def get(self, key):
+        ''' Return an idle stream connected to key, or None '''
+        streams = self.idle.get(key)
+        while streams:
+            # The most recently used one is the most likely alive
+            stream = streams.pop()
+            del self.keys[stream]
+            if not _is_alive(stream):
+                logging.debug('http_pool: stale %s', stream)
+                stream.close()
+                continue
+            logging.debug('http_pool: reusing %s', stream)
+            stream.set_timeout(WATCHDOG)
+            if not streams:
+                del self.idle[key]
+            self.stats['http_pool.hits'] += 1
+            return stream
+        if streams is not None:
+            del self.idle[key]
+        self.stats['http_pool.misses'] += 1
+        return None
+
+    def discard(self, stream):
+        ''' Forget about a stream that has been closed '''
+        key = self.keys.pop(stream, None)
+        if key is None:
+            return
+        logging.debug('http_pool: dropping %s', stream)
+        self.idle[key].remove(stream)
+        if not self.idle[key]:
+            del self.idle[key]
@@ -25,6 +25,7 @@
 # Adapted from neubot/net/stream.py
 # Python3-ready: yes
 
+from neubot.accept_guard import ACCEPT_GUARD
 from neubot.pollable import Pollable
 from neubot.poller import POLLER
 
@@ -43,6 +44,7 @@ class Listener(Pollable):
         # Want to listen "forever"
         self.watchdog = -1
 
+        ACCEPT_GUARD.reserve()
         POLLER.set_readable(self)
         self.parent.handle_listen(self)
 
@@ -55,7 +57,16 @@ class Listener(Pollable):
     def handle_read(self):
         # Make sure we route exceptions properly
         try:
-            sock = self.lsock.accept()[0]
+            ACCEPT_GUARD.accept(POLLER, self, self.lsock, self._handle_accept)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.parent.handle_accept_error(self)
+
+    def _handle_accept(self, sock):
+        ''' Pass the accepted socket to the parent '''
+        # An error with one connection must not stop the batch
+        try:
             sock.setblocking(False)
             self.parent.handle_accept(self, sock, self.sslconfig, self.sslcert)
         except (KeyboardInterrupt, SystemExit):
@@ -64,4 +75,5 @@ class Listener(Pollable):
             self.parent.handle_accept_error(self)
 
     def handle_close(self):
+        ACCEPT_GUARD.forget(self)
         self.parent.handle_listen_close(self)
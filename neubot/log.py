@@ -116,19 +116,45 @@ class StreamingLogger(object):
     # become a problem for faster connections, so I am
     # deploying this piece of warning.
     #
+    # To bound the memory used by slow readers, we are the producer
+    # of each attached stream.  When a stream's send queue crosses
+    # its high watermark we stop copying lines to it and we just
+    # count them.  When it drains below the low watermark we send
+    # a single line saying how many lines were dropped.
+    #
 
     def __init__(self):
         self.streams = set()
+        self.dropped = {}
 
     def start_streaming(self, stream):
         ''' Attach stream to log messages '''
         self.streams.add(stream)
+        stream.set_producer(self)
+        stream.atclose(self._stream_closed)
+
+    def _stream_closed(self, stream, exception):
+        ''' Detach a stream when it is closed '''
+        self.streams.discard(stream)
+        self.dropped.pop(stream, None)
 
     def stop_streaming(self):
         ''' Close all attached streams '''
-        for stream in self.streams:
+        for stream in list(self.streams):
             POLLER.close(stream)
         self.streams.clear()
+        self.dropped.clear()
+
+    def pause_writing(self, stream):
+        ''' Stop copying lines to a slow stream '''
+        self.dropped[stream] = 0
+
+    def resume_writing(self, stream):
+        ''' Resume copying lines to a stream '''
+        count = self.dropped.pop(stream, 0)
+        if count:
+            stream.start_send("WARNING log: %d lines dropped (slow reader)"
+                              "\r\n" % count)
 
     def log(self, severity, message, args, exc_info):
         ''' Really log a message '''
@@ -168,6 +194,9 @@ class StreamingLogger(object):
                 # UTF-8 encoding to avoid supplying unicode to stream.py
                 logline = logline.encode("utf-8")
                 for stream in self.streams:
+                    if stream in self.dropped:
+                        self.dropped[stream] += 1
+                        continue
                     stream.start_send(logline)
 
             except (KeyboardInterrupt, SystemExit):
@@ -385,3 +414,7 @@ def set_verbose():
 def is_verbose():
     ''' Is the logger verbose? '''
     return CONFIG['verbose']
+
+def debug_enabled():
+    ''' Is anyone going to see DEBUG messages? '''
+    return CONFIG['verbose'] or bool(STREAMING_LOG.streams)
@@ -31,24 +31,30 @@
 
 import collections
 import errno
+import os
 import socket
+import stat
 import sys
 import types
 import logging
 
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
 try:
     import ssl
+    from neubot import sslstream
 except ImportError:
     ssl = None
 
-if __name__ == "__main__":
-    sys.path.insert(0, ".")
-
+from neubot.accept_guard import ACCEPT_GUARD
 from neubot.config import CONFIG
 from neubot.log import oops
 from neubot.net.poller import POLLER
 from neubot.net.poller import Pollable
+from neubot.resolver import RESOLVER
 
+from neubot import sockopts
 from neubot import utils
 from neubot import utils_net
 
@@ -63,20 +69,113 @@ MAXBUF = 1 << 18
 # Soft errors on sockets, i.e. we can retry later
 SOFT_ERRORS = [ errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR ]
 
+# Seconds before racing a connection to the next address
+CONNECT_RACE_DELAY = 0.25
+
+# Maximum number of buffers we pass to a single vectored send
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = -1
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+#
+# Use sendmsg() when the socket module provides it (Python >= 3.3),
+# otherwise coalesce the gathered buffers into a single string, which
+# still saves one send() and one trip through the poller per buffer.
+# Coalescing copies, so we only coalesce up to MAXJOIN bytes, and we
+# send the rest later, with MSG_MORE, where available, telling the
+# kernel not to push a short segment in the meantime.  Python 2 does
+# not export MSG_MORE, so we hardcode the Linux value.
+#
+HAVE_SENDMSG = hasattr(socket.socket, "sendmsg")
+MAXJOIN = 1 << 14
+MSG_MORE = getattr(socket, "MSG_MORE", 0)
+if not MSG_MORE and sys.platform.startswith("linux"):
+    MSG_MORE = 0x8000
+
+# Maximum amount of bytes we pass to a single sendfile()
+MAXSENDFILE = 1 << 30
+
+#
+# Watermarks of the send queue.  When the bytes buffered for sending
+# grow above HIGH_WATER the stream invokes the pause_writing() method
+# of its producer, and, once they drain below LOW_WATER, it invokes
+# resume_writing().  Only strings count, because file-likes are read
+# lazily, one MAXBUF at a time.
+#
+HIGH_WATER = 1 << 20
+LOW_WATER = 1 << 18
+
+def _libc_sendfile():
+
+    #
+    # The os module has sendfile() since Python 3.3 only, so on
+    # Linux we also try to reach the C library one using ctypes.
+    #
+
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        function = ctypes.CDLL(None, use_errno=True).sendfile64
+    except (ImportError, OSError, AttributeError):
+        return None
+
+    function.argtypes = [ctypes.c_int, ctypes.c_int,
+                         ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t]
+    function.restype = ctypes.c_ssize_t
+
+    def sendfile(out_fd, in_fd, offset, count):
+        offset = ctypes.c_int64(offset)
+        result = function(out_fd, in_fd, ctypes.byref(offset), count)
+        if result < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return result
+
+    return sendfile
+
+SENDFILE = getattr(os, "sendfile", None) or _libc_sendfile()
+
+class SendfileBody(object):
+
+    #
+    # A regular file we send with sendfile(), starting from its
+    # current position, so that HEAD responses, which seek at the
+    # end of file, are still empty.  We track the offset on our
+    # own, because sendfile() does not move the file position.
+    #
+
+    def __init__(self, filep):
+        self.filep = filep
+        self.offset = filep.tell()
+        self.left = max(os.fstat(filep.fileno()).st_size - self.offset, 0)
+
+    def __len__(self):
+        return self.left
+
+    def advance(self, count):
+        self.offset += count
+        self.left -= count
+
 if ssl:
     class SSLWrapper(object):
-        def __init__(self, sock):
+        def __init__(self, sock, endpoint=None):
             self.sock = sock
+            self.endpoint = endpoint
 
         def soclose(self):
             try:
+                sslstream.save_session(self.sock, self.endpoint)
                 self.sock.close()
             except ssl.SSLError:
                 logging.error('Exception', exc_info=1)
 
         def sorecv(self, maxlen):
             try:
-                octets = self.sock.read(maxlen)
+                octets = sslstream.read_batch(self.sock, maxlen)
                 return SUCCESS, octets
             except ssl.SSLError, exception:
                 if exception[0] == ssl.SSL_ERROR_WANT_READ:
@@ -132,6 +231,53 @@ class SocketWrapper(object):
             else:
                 return ERROR, exception
 
+    def sosendv(self, buffers):
+        try:
+            if HAVE_SENDMSG:
+                count = self.sock.sendmsg(buffers)
+                return SUCCESS, count
+            number, total = 0, 0
+            for octets in buffers:
+                if number and total + len(octets) > MAXJOIN:
+                    break
+                number += 1
+                total += len(octets)
+            flags = 0
+            if number < len(buffers):
+                flags = MSG_MORE
+            if number == 1:
+                count = self.sock.send(buffers[0], flags)
+            else:
+                count = self.sock.send("".join([_tobytes(octets)
+                                       for octets in buffers[:number]]),
+                                       flags)
+            return SUCCESS, count
+        except socket.error, exception:
+            if exception[0] in SOFT_ERRORS:
+                return WANT_WRITE, 0
+            elif exception[0] == errno.ECONNRESET:
+                return CONNRESET, 0
+            else:
+                return ERROR, exception
+
+    def sosendfile(self, body):
+        try:
+            count = SENDFILE(self.sock.fileno(), body.filep.fileno(),
+                             body.offset, min(body.left, MAXSENDFILE))
+            return SUCCESS, count
+        except (OSError, socket.error), exception:
+            if exception[0] in SOFT_ERRORS:
+                return WANT_WRITE, 0
+            elif exception[0] == errno.ECONNRESET:
+                return CONNRESET, 0
+            else:
+                return ERROR, exception
+
+def _tobytes(octets):
+    if isinstance(octets, memoryview):
+        return octets.tobytes()
+    return octets
+
 class Stream(Pollable):
     def __init__(self, poller):
         Pollable.__init__(self)
@@ -156,6 +302,12 @@ class Stream(Pollable):
         self.send_octets = None
         self.send_queue = collections.deque()
         self.send_pending = False
+        self.send_queued = 0
+
+        self.high_water = HIGH_WATER
+        self.low_water = LOW_WATER
+        self.producer = None
+        self.writing_paused = False
 
         self.bytes_recv_tot = 0
         self.bytes_sent_tot = 0
@@ -179,6 +331,10 @@ class Stream(Pollable):
         self.peername = utils_net.getpeername(sock)
         self.logname = str((self.myname, self.peername))
 
+        self.high_water = conf.get("net.stream.high_water", HIGH_WATER)
+        self.low_water = min(conf.get("net.stream.low_water", LOW_WATER),
+                             self.high_water)
+
         logging.debug("* Connection made %s", str(self.logname))
 
         if conf["net.stream.secure"]:
@@ -188,13 +344,14 @@ class Stream(Pollable):
             server_side = conf["net.stream.server_side"]
             certfile = conf["net.stream.certfile"]
 
-            # wrap_socket distinguishes between None and ''
-            if not certfile:
-                certfile = None
+            # Clients try to resume their last session with the peer
+            endpoint = None
+            if not server_side:
+                endpoint = self.peername
 
-            ssl_sock = ssl.wrap_socket(sock, do_handshake_on_connect=False,
-              certfile=certfile, server_side=server_side)
-            self.sock = SSLWrapper(ssl_sock)
+            ssl_sock = sslstream.wrap_socket(sock, certfile, server_side,
+                                             endpoint)
+            self.sock = SSLWrapper(ssl_sock, endpoint)
 
             self.recv_ssl_needs_kickoff = not server_side
 
@@ -326,16 +483,41 @@ class Stream(Pollable):
     def recv_complete(self, octets):
         pass
 
-    # Send path
+    #
+    # Send path.  The send queue contains strings, memoryviews and
+    # file-likes.  A file-like with a readv() method returns a list
+    # of buffers (e.g., a chunk header and a view of the payload),
+    # which are queued in front of it and sent without joining them.
+    #
 
     def read_send_queue(self):
         octets = ""
 
         while self.send_queue:
             octets = self.send_queue[0]
-            if isinstance(octets, basestring):
+            if isinstance(octets, (basestring, memoryview)):
                 # remove the piece in any case
                 self.send_queue.popleft()
+                self.send_queued -= len(octets)
+                if octets:
+                    break
+            elif hasattr(octets, "readv"):
+                vector = octets.readv(MAXBUF)
+                if vector:
+                    # Queue the rest in front of the file-like, so
+                    # that handle_write() gathers the whole vector
+                    octets = vector[0]
+                    for piece in vector[1:]:
+                        self.send_queued += len(piece)
+                    self.send_queue.extendleft(reversed(vector[1:]))
+                    break
+                # remove the file-like when it is empty
+                self.send_queue.popleft()
+                octets = ""
+            elif self._can_sendfile(octets):
+                # sendfile() consumes the file from here on
+                self.send_queue.popleft()
+                octets = SendfileBody(octets)
                 if octets:
                     break
             else:
@@ -345,7 +527,7 @@ class Stream(Pollable):
                 # remove the file-like when it is empty
                 self.send_queue.popleft()
 
-        if octets:
+        if octets and not isinstance(octets, SendfileBody):
             if type(octets) == types.UnicodeType:
                 oops("Received unicode input")
                 octets = octets.encode("utf-8")
@@ -357,6 +539,13 @@ class Stream(Pollable):
             return
 
         self.send_queue.append(octets)
+        if isinstance(octets, (basestring, memoryview)):
+            self.send_queued += len(octets)
+            if (not self.writing_paused and
+              self.send_buffered() > self.high_water):
+                self.writing_paused = True
+                if self.producer:
+                    self.producer.pause_writing(self)
         if self.send_pending:
             return
 
@@ -380,31 +569,34 @@ class Stream(Pollable):
             self.handle_read()
             return
 
-        status, count = self.sock.sosend(self.send_octets)
+        buffers = self._gather_send_queue()
+        if isinstance(self.send_octets, SendfileBody):
+            status, count = self.sock.sosendfile(self.send_octets)
+        elif len(buffers) > 1:
+            status, count = self.sock.sosendv(buffers)
+        else:
+            status, count = self.sock.sosend(self.send_octets)
 
         if status == SUCCESS and count > 0:
             self.bytes_sent_tot += count
 
-            if count == len(self.send_octets):
-
-                self.send_octets = self.read_send_queue()
-                if self.send_octets:
-                    return
+            if count > sum(len(octets) for octets in buffers):
+                raise RuntimeError("Sent more than expected")
 
-                self.send_pending = False
-                self.poller.unset_writable(self)
-
-                self.send_complete()
-                if self.close_pending:
-                    self.poller.close(self)
+            self._advance_send_queue(count)
+            if self.send_octets:
+                self._maybe_resume_writing()
                 return
 
-            if count < len(self.send_octets):
-                self.send_octets = buffer(self.send_octets, count)
-                self.poller.set_writable(self)
-                return
+            self.send_pending = False
+            self.poller.unset_writable(self)
 
-            raise RuntimeError("Sent more than expected")
+            self.send_complete()
+            if self.close_pending:
+                self.poller.close(self)
+                return
+            self._maybe_resume_writing()
+            return
 
         if status == WANT_WRITE:
             return
@@ -434,72 +626,228 @@ class Stream(Pollable):
 
         raise RuntimeError("Unexpected status value")
 
+    #
+    # Gather send_octets and the strings that follow it in the send
+    # queue, so that a single vectored send can write them all.  We
+    # stop at the first file-like, because reading it may block, and
+    # we don't gather at all on SSL sockets, which have no vectored
+    # send.  We stop adding pieces once we have MAXBUF bytes, like a
+    # single read, so a large piece is sent with the small ones that
+    # precede it (e.g., a chunk with its header).
+    #
+    def _gather_send_queue(self):
+        buffers = [self.send_octets]
+        if not hasattr(self.sock, "sosendv"):
+            return buffers
+        if isinstance(self.send_octets, SendfileBody):
+            return buffers
+        total = len(self.send_octets)
+        for octets in self.send_queue:
+            if len(buffers) >= IOV_MAX:
+                break
+            if total >= MAXBUF:
+                break
+            if not isinstance(octets, (str, memoryview)):
+                break
+            total += len(octets)
+            buffers.append(octets)
+        return buffers
+
+    #
+    # Consume count bytes starting from send_octets and continuing
+    # into the send queue.  A partially-sent piece becomes a memoryview
+    # at the proper offset, so we never copy the unsent tail.
+    #
+    def _advance_send_queue(self, count):
+        if isinstance(self.send_octets, SendfileBody):
+            self.send_octets.advance(count)
+            if not self.send_octets:
+                self.send_octets = self.read_send_queue()
+            return
+        if count < len(self.send_octets):
+            self.send_octets = memoryview(self.send_octets)[count:]
+            return
+        count -= len(self.send_octets)
+        while count > 0:
+            octets = self.send_queue.popleft()
+            self.send_queued -= len(octets)
+            if count < len(octets):
+                self.send_octets = memoryview(octets)[count:]
+                return
+            count -= len(octets)
+        self.send_octets = self.read_send_queue()
+
+    #
+    # Use sendfile() for regular files on plain TCP connections.  SSL
+    # streams have no sosendfile() and keep reading the file.
+    #
+    def _can_sendfile(self, filep):
+        if not SENDFILE or not hasattr(self.sock, "sosendfile"):
+            return False
+        try:
+            return stat.S_ISREG(os.fstat(filep.fileno()).st_mode)
+        except (AttributeError, ValueError, IOError, OSError):
+            return False
+
     def send_complete(self):
         pass
 
-class Connector(Pollable):
-    def __init__(self, poller, parent):
+    #
+    # Flow control.  The producer is any object implementing the
+    # pause_writing(stream) and resume_writing(stream) methods, which
+    # are invoked when the bytes buffered for sending cross the high
+    # and the low watermark, respectively.  A producer that ignores
+    # them keeps queueing, as before.
+    #
+
+    def set_producer(self, producer):
+        self.producer = producer
+
+    def send_buffered(self):
+        if isinstance(self.send_octets, (basestring, memoryview)):
+            return self.send_queued + len(self.send_octets)
+        return self.send_queued
+
+    def _maybe_resume_writing(self):
+        if self.writing_paused and self.send_buffered() <= self.low_water:
+            self.writing_paused = False
+            if self.producer:
+                self.producer.resume_writing(self)
+
+#
+# Connector races connections to all the addresses of an endpoint, in
+# the style of Happy Eyeballs (RFC 6555).  Addresses come from the
+# space-separated list in the endpoint, or from the asynchronous
+# resolver, and families are interleaved.  We start with the first
+# address and we start the next one each CONNECT_RACE_DELAY seconds,
+# or as soon as an attempt fails.  The first attempt that succeeds
+# wins and all the others are closed, so a broken IPv6 path costs a
+# fraction of a second rather than a full connect timeout.
+#
+class ConnectAttempt(Pollable):
+    def __init__(self, connector, sock, endpoint):
         Pollable.__init__(self)
+        self.connector = connector
+        self.sock = sock
+        self.filenum = sock.fileno()
+        self.endpoint = endpoint
+        self.timestamp = utils.ticks()
+        self.done = False
+        self.watchdog = 10
+
+    def __repr__(self):
+        return "connect attempt to %s" % str(self.endpoint)
+
+    def fileno(self):
+        return self.filenum
+
+    def handle_write(self):
+        self.connector.poller.unset_writable(self)
+        success = utils_net.isconnected(self.endpoint, self.sock)
+        self.connector._attempt_complete(self, success)
+
+    def handle_close(self):
+        self.connector._attempt_complete(self, False)
+
+class Connector(object):
+    def __init__(self, poller, parent):
         self.poller = poller
         self.parent = parent
         self.sock = None
-        self.timestamp = 0
         self.endpoint = None
-        self.epnts = collections.deque()
-        self.watchdog = 10
+        self.ainfos = collections.deque()
+        self.attempts = set()
+        self.race = None
+        self.resolving = 0
+        self.resolved = []
+        self.sockopts = None
 
     def __repr__(self):
         return "connector to %s" % str(self.endpoint)
 
-    def _connection_failed(self):
-        if self.sock:
-            self.poller.unset_writable(self)
-            self.sock = None
-        if not self.epnts:
-            self.parent._connection_failed(self, None)
-            return
-        self.connect(self.epnts.popleft(), None)
-
     def connect(self, endpoint, conf):
-
-        # Connect first address in a list
-        if ' ' in endpoint[0]:
-            logging.debug('* Connecting to %s', str(endpoint))
-            for address in endpoint[0].split():
-                epnt = (address.strip(), endpoint[1])
-                self.epnts.append(epnt)
-            endpoint = self.epnts.popleft()
-
         self.endpoint = endpoint
 
         prefer_ipv6 = CONFIG["prefer_ipv6"]
         if conf and "prefer_ipv6" in conf:
             prefer_ipv6 = conf["prefer_ipv6"]
-        sock = utils_net.connect(endpoint, prefer_ipv6)
-        if not sock:
-            self._connection_failed()
+        if conf:
+            self.sockopts = sockopts.get_profile(
+              conf.get("net.stream.profile", ""))
+
+        # Connect to a list of addresses
+        if ' ' in endpoint[0]:
+            logging.debug('* Connecting to %s', str(endpoint))
+            addresses = endpoint[0].split()
+        else:
+            addresses = [endpoint[0]]
+
+        self.resolving = len(addresses)
+        self.resolved = [[]] * len(addresses)
+        for index, address in enumerate(addresses):
+            RESOLVER.resolve((address.strip(), endpoint[1]), prefer_ipv6,
+              lambda result, index=index: self._resolved(index, result))
+
+    def _resolved(self, index, result):
+        self.resolved[index] = result
+        self.resolving -= 1
+        if self.resolving > 0:
             return
+        addrinfo = []
+        for result in self.resolved:
+            addrinfo.extend(result)
+        self.ainfos.extend(utils_net.interleave_families(addrinfo))
+        self._next_attempt()
+
+    def _next_attempt(self):
+        while self.ainfos:
+            ainfo = self.ainfos.popleft()
+            sock = utils_net.connect_ainfo(ainfo, self.sockopts)
+            if not sock:
+                continue
+            attempt = ConnectAttempt(self, sock, ainfo[4])
+            self.attempts.add(attempt)
+            self.poller.set_writable(attempt)
+            if self.ainfos:
+                self.race = self.poller.sched(CONNECT_RACE_DELAY, self._race)
+            return
+        if not self.attempts:
+            self.parent._connection_failed(self, None)
 
-        self.sock = sock
-        self.timestamp = utils.ticks()
-        self.poller.set_writable(self)
+    def _race(self, *args):
+        self.race = None
+        self._next_attempt()
 
-    def fileno(self):
-        return self.sock.fileno()
+    def _cancel_race(self):
+        if self.race:
+            self.race.cancel()
+            self.race = None
 
-    def handle_write(self):
-        self.poller.unset_writable(self)
+    def _attempt_complete(self, attempt, success):
+        if attempt.done:
+            return
+        attempt.done = True
+        self.attempts.discard(attempt)
 
-        if not utils_net.isconnected(self.endpoint, self.sock):
-            self._connection_failed()
+        if not success:
+            attempt.sock.close()
+            self._cancel_race()
+            self._next_attempt()
             return
 
-        rtt = utils.ticks() - self.timestamp
+        self._cancel_race()
+        self.ainfos.clear()
+        for loser in list(self.attempts):
+            loser.done = True
+            self.poller.close(loser)
+            loser.sock.close()
+        self.attempts.clear()
+
+        self.sock = attempt.sock
+        self.endpoint = attempt.endpoint
+        rtt = utils.ticks() - attempt.timestamp
         self.parent._connection_made(self.sock, self.endpoint, rtt)
 
-    def handle_close(self):
-        self._connection_failed()
-
 class Listener(Pollable):
     def __init__(self, poller, parent, sock, endpoint):
         Pollable.__init__(self)
@@ -511,6 +859,8 @@ class Listener(Pollable):
         # Want to listen "forever"
         self.watchdog = -1
 
+        ACCEPT_GUARD.reserve()
+
     def __repr__(self):
         return "listener at %s" % str(self.endpoint)
 
@@ -528,16 +878,25 @@ class Listener(Pollable):
     #
     def handle_read(self):
         try:
-            sock = self.lsock.accept()[0]
+            ACCEPT_GUARD.accept(self.poller, self, self.lsock,
+                                self._connection_made)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception, exception:
+            self.parent.accept_failed(self, exception)
+            return
+
+    def _connection_made(self, sock):
+        try:
             sock.setblocking(False)
             self.parent.connection_made(sock, self.endpoint, 0)
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception, exception:
             self.parent.accept_failed(self, exception)
-            return
 
     def handle_close(self):
+        ACCEPT_GUARD.forget(self)
         self.parent.bind_failed(self.endpoint)  # XXX
 
 class StreamHandler(object):
@@ -547,13 +906,15 @@ class StreamHandler(object):
         self.epnts = collections.deque()
         self.bad = collections.deque()
         self.good = collections.deque()
+        self.connecting = 0
         self.rtts = []
 
     def configure(self, conf):
         self.conf = conf
 
     def listen(self, endpoint):
-        sockets = utils_net.listen(endpoint, CONFIG['prefer_ipv6'])
+        sockets = utils_net.listen(endpoint, CONFIG['prefer_ipv6'],
+          sockopts.get_profile(self.conf.get("net.stream.profile", "")))
         if not sockets:
             self.bind_failed(endpoint)
             return
@@ -576,24 +937,32 @@ class StreamHandler(object):
             count = count - 1
         self._next_connect()
 
+    #
+    # Start all the pending connections at once, and report
+    # either success or failure when all of them are complete.
+    # Note that connect() may fail synchronously and reenter.
+    #
     def _next_connect(self):
-        if self.epnts:
+        while self.epnts:
             connector = Connector(self.poller, self)
+            self.connecting += 1
             connector.connect(self.epnts.popleft(), self.conf)
+        if self.connecting > 0:
+            return
+        if self.bad:
+            while self.bad:
+                connector, exception = self.bad.popleft()
+                self.connection_failed(connector, exception)
+            while self.good:
+                sock = self.good.popleft()[0]
+                sock.close()
         else:
-            if self.bad:
-                while self.bad:
-                    connector, exception = self.bad.popleft()
-                    self.connection_failed(connector, exception)
-                while self.good:
-                    sock = self.good.popleft()
-                    sock.close()
-            else:
-                while self.good:
-                    sock, endpoint, rtt = self.good.popleft()
-                    self.connection_made(sock, endpoint, rtt)
+            while self.good:
+                sock, endpoint, rtt = self.good.popleft()
+                self.connection_made(sock, endpoint, rtt)
 
     def _connection_failed(self, connector, exception):
+        self.connecting -= 1
         self.bad.append((connector, exception))
         self._next_connect()
 
@@ -604,6 +973,7 @@ class StreamHandler(object):
         pass
 
     def _connection_made(self, sock, endpoint, rtt):
+        self.connecting -= 1
         self.rtts.append(rtt)
         self.good.append((sock, endpoint, rtt))
         self._next_connect()
@@ -629,12 +999,13 @@ class GenericProtocolStream(Stream):
         Stream.__init__(self, poller)
         self.buffer = None
         self.kind = ""
+        self.timer = None
 
     def connection_made(self):
         self.buffer = "A" * self.conf["net.stream.chunk"]
         duration = self.conf["net.stream.duration"]
         if duration >= 0:
-            POLLER.sched(duration, self._do_close)
+            self.timer = POLLER.sched(duration, self._do_close)
         if self.kind == "discard":
             self.start_recv()
         elif self.kind == "chargen":
@@ -645,8 +1016,14 @@ class GenericProtocolStream(Stream):
             self.close()
 
     def _do_close(self, *args, **kwargs):
+        self.timer = None
         self.close()
 
+    def connection_lost(self, exception):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
     def recv_complete(self, octets):
         self.start_recv()
         if self.kind == "echo":
@@ -661,6 +1038,9 @@ class GenericProtocolStream(Stream):
 CONFIG.register_defaults({
     # General variables
     "net.stream.certfile": "",
+    "net.stream.high_water": HIGH_WATER,
+    "net.stream.low_water": LOW_WATER,
+    "net.stream.profile": "",
     "net.stream.secure": False,
     "net.stream.server_side": False,
     # For main()
@@ -678,6 +1058,9 @@ def main(args):
     CONFIG.register_descriptions({
         # General variables
         "net.stream.certfile": "Set SSL certfile path",
+        "net.stream.high_water": "Pause producers above this many bytes",
+        "net.stream.low_water": "Resume producers below this many bytes",
+        "net.stream.profile": "Set sockets profile (bulk or realtime)",
         "net.stream.secure": "Enable SSL",
         "net.stream.server_side": "Enable SSL server-side mode",
         # For main()
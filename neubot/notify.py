@@ -43,15 +43,21 @@ class Notifier(object):
     def __init__(self):
         self._timestamps = collections.defaultdict(int)
         self._subscribers = collections.defaultdict(list)
-        self._tofire = []
-        POLLER.sched(INTERVAL, self._periodic)
+        self._timers = {}
 
     def subscribe(self, event, func, context=None, periodic=False):
         ''' Subscribe to event '''
         queue = self._subscribers[event]
         queue.append((func, context))
-        if periodic:
-            self._tofire.append(event)
+        #
+        # Periodic subscribers are notified at most INTERVAL
+        # seconds after they subscribed.  We keep one timer per
+        # event and we cancel it when the event is published,
+        # so that stale timers do not fire.
+        #
+        if periodic and event not in self._timers:
+            self._timers[event] = POLLER.sched(INTERVAL, self._periodic,
+                                               event)
 
     def publish(self, event, tsnap=None):
         ''' Publish event '''
@@ -70,26 +76,24 @@ class Notifier(object):
         queue = self._subscribers[event]
         del self._subscribers[event]
 
+        task = self._timers.pop(event, None)
+        if task:
+            task.cancel()
+
         self._fireq(event, queue)
 
-    def _periodic(self):
+    def _periodic(self, args):
         ''' Periodically generate notification for old events '''
-        POLLER.sched(INTERVAL, self._periodic)
-        self._tofire, queue = [], self._tofire
-        for event in queue:
-
-            #
-            # WARNING! Please resist the temptation of merging
-            # the [] and the del into a single pop() because that
-            # will not work: this is a defaultdict and so here
-            # event might not be in _subscribers.
-            #
-            queue = self._subscribers[event]
-            del self._subscribers[event]
-
-            logging.debug("notify: periodically publish event: %s", event)
-
-            self._fireq(event, queue)
+        event = args[0]
+        del self._timers[event]
+
+        # See the WARNING in publish()
+        queue = self._subscribers[event]
+        del self._subscribers[event]
+
+        logging.debug("notify: periodically publish event: %s", event)
+
+        self._fireq(event, queue)
 
     @staticmethod
     def _fireq(event, queue):
@@ -37,9 +37,42 @@ class Pollable(object):
 
     ''' Base class for pollable objects '''
 
+    #
+    # The created and watchdog attributes are properties because
+    # the poller indexes pollables by deadline (i.e. created plus
+    # watchdog) and must be told when the deadline changes.  To
+    # this end, the poller sets watchdog_hook when it starts to
+    # track a pollable, and we invoke it on every change.
+    #
+
     def __init__(self):
-        self.created = utils.ticks()
-        self.watchdog = WATCHDOG
+        self.watchdog_hook = None
+        self._created = utils.ticks()
+        self._watchdog = WATCHDOG
+
+    def _get_created(self):
+        ''' Get creation (or last activity) time '''
+        return self._created
+
+    def _set_created(self, value):
+        ''' Set creation (or last activity) time '''
+        self._created = value
+        if self.watchdog_hook:
+            self.watchdog_hook(self)
+
+    created = property(_get_created, _set_created)
+
+    def _get_watchdog(self):
+        ''' Get watchdog timeout '''
+        return self._watchdog
+
+    def _set_watchdog(self, value):
+        ''' Set watchdog timeout '''
+        self._watchdog = value
+        if self.watchdog_hook:
+            self.watchdog_hook(self)
+
+    watchdog = property(_get_watchdog, _set_watchdog)
 
     def fileno(self):
         ''' Return file descriptor number '''
@@ -60,5 +93,5 @@ class Pollable(object):
 
     def set_timeout(self, timeo):
         ''' Set timeout of this pollable '''
-        self.created = utils.ticks()
+        self._created = utils.ticks()
         self.watchdog = timeo
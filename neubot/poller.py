@@ -26,10 +26,11 @@
 # Was neubot/net/poller.py
 # Python3-ready: yes
 
+import heapq
 import logging
 import errno
+import os
 import select
-import sched
 import sys
 
 from neubot.utils import ticks
@@ -41,32 +42,360 @@ from neubot.utils import timestamp
 #
 CHECK_TIMEOUT = 10
 
-class Poller(sched.scheduler):
+#
+# Timers that expire within TIMER_SLACK seconds from now are
+# dispatched in the same pass as the already-expired ones, so
+# that deadlines that are very close are coalesced and we do
+# not wake up again just to run them.
+#
+TIMER_SLACK = 0.001
+
+#
+# When more than half of the timers in the heap have been
+# cancelled (and there are at least this many of them) we
+# rebuild the heap to reclaim memory.
+#
+TIMER_COMPACT = 64
+
+#
+# Watchdog index bookkeeping: we rebuild the deadline heap when
+# it contains more than twice the number of watched pollables
+# (plus this number of entries).
+#
+WATCHDOG_COMPACT = 64
+
+class Task(object):
+
+    ''' A scheduled task '''
+
+    #
+    # This is the handle returned by Poller.sched().  Cancel
+    # is lazy: we just forget the function to call and the
+    # poller drops the task when it reaches the top of the
+    # heap (or when it compacts the heap).  The poller clears
+    # self.poller when it pops the task, so that cancelling a
+    # task that is not in the heap anymore is not counted.
+    #
+
+    def __init__(self, poller, deadline, func, args):
+        self.poller = poller
+        self.deadline = deadline
+        self.timestamp = timestamp() + (deadline - ticks())
+        self.func = func
+        self.args = args
+
+    def cancel(self):
+        ''' Cancel this task '''
+        if self.func:
+            self.func = None
+            self.args = None
+            if self.poller:
+                self.poller._task_cancelled()
+                self.poller = None
+
+    def cancelled(self):
+        ''' Returns True if the task has been cancelled '''
+        return self.func is None
+
+    def __repr__(self):
+        return 'task %s at %f' % (self.func, self.deadline)
+
+#
+# Readiness backends.  Each backend tells the poller which file
+# descriptors are readable and which are writable, given the
+# readset and the writeset.  The select() backend is the one we
+# have always used and works everywhere, but it is limited by
+# FD_SETSIZE and costs O(n) per iteration.  The poll() and the
+# epoll() backends keep the interest set inside the kernel (or
+# inside a persistent pollobject) and the poller updates it only
+# when a file descriptor changes its mask.
+#
+
+class SelectBackend(object):
+
+    ''' Readiness backend based on select() '''
+
+    name = 'select'
+
+    def __init__(self):
+        pass
+
+    def update(self, fileno, readable, writable):
+        ''' Update interest set for fileno (nothing to do) '''
+
+    def close(self):
+        ''' Release backend resources '''
+
+    @staticmethod
+    def wait(readset, writeset, timeout):
+        ''' Wait for readability and writability '''
+        res = select.select(list(readset.keys()), list(writeset.keys()),
+                            [], timeout)
+        return res[0], res[1]
+
+class PollBackend(object):
+
+    ''' Readiness backend based on poll() '''
+
+    name = 'poll'
+
+    def __init__(self):
+        self.registered = {}
+        self.pollobj = select.poll()
+        self.flag_in = select.POLLIN
+        self.flag_out = select.POLLOUT
+        self.flag_err = select.POLLERR | select.POLLHUP | select.POLLNVAL
+
+    def _mask(self, readable, writable):
+        ''' Map readable, writable into a mask '''
+        mask = 0
+        if readable:
+            mask |= self.flag_in
+        if writable:
+            mask |= self.flag_out
+        return mask
+
+    def update(self, fileno, readable, writable):
+        ''' Update interest set for fileno '''
+        mask = self._mask(readable, writable)
+        oldmask = self.registered.get(fileno, 0)
+        if mask == oldmask:
+            return
+        if not mask:
+            del self.registered[fileno]
+            self._unregister(fileno)
+        elif not oldmask:
+            self.registered[fileno] = mask
+            self._register(fileno, mask)
+        else:
+            self.registered[fileno] = mask
+            self._modify(fileno, mask)
+
+    def _register(self, fileno, mask):
+        ''' Add fileno to the interest set '''
+        self.pollobj.register(fileno, mask)
+
+    def _modify(self, fileno, mask):
+        ''' Modify fileno mask '''
+        self.pollobj.register(fileno, mask)
+
+    def _unregister(self, fileno):
+        ''' Remove fileno from the interest set '''
+        try:
+            self.pollobj.unregister(fileno)
+        except KeyError:
+            pass
+
+    def close(self):
+        ''' Release backend resources '''
+        self.registered.clear()
+
+    def _poll(self, timeout):
+        ''' Invoke the underlying poll function '''
+        if timeout is not None:
+            timeout = int(timeout * 1000)
+        return self.pollobj.poll(timeout)
+
+    def wait(self, readset, writeset, timeout):
+        ''' Wait for readability and writability '''
+        readable, writable = [], []
+        for fileno, events in self._poll(timeout):
+            #
+            # On error, route the event to both handlers (if the
+            # stream is interested), so that the error surfaces
+            # as a failed recv() or send() and the stream is closed.
+            #
+            if events & (self.flag_in | self.flag_err):
+                if fileno in readset:
+                    readable.append(fileno)
+            if events & (self.flag_out | self.flag_err):
+                if fileno in writeset:
+                    writable.append(fileno)
+        return readable, writable
+
+class EpollBackend(PollBackend):
+
+    ''' Readiness backend based on Linux epoll() '''
+
+    name = 'epoll'
+
+    def __init__(self):
+        PollBackend.__init__(self)
+        self.pollobj = select.epoll()
+        self.flag_in = select.EPOLLIN
+        self.flag_out = select.EPOLLOUT
+        self.flag_err = select.EPOLLERR | select.EPOLLHUP
+
+    #
+    # The kernel automatically removes a file descriptor from the
+    # interest set when it is closed, so a new socket may reuse the
+    # same number while we still believe it registered.  Therefore
+    # we fallback to register() on ENOENT and to modify() on EEXIST,
+    # and we ignore EBADF on unregister().
+    #
+
+    def _register(self, fileno, mask):
+        try:
+            self.pollobj.register(fileno, mask)
+        except (IOError, OSError):
+            if sys.exc_info()[1].args[0] != errno.EEXIST:
+                raise
+            self.pollobj.modify(fileno, mask)
+
+    def _modify(self, fileno, mask):
+        try:
+            self.pollobj.modify(fileno, mask)
+        except (IOError, OSError):
+            if sys.exc_info()[1].args[0] != errno.ENOENT:
+                raise
+            self.pollobj.register(fileno, mask)
+
+    def _unregister(self, fileno):
+        try:
+            self.pollobj.unregister(fileno)
+        except (IOError, OSError):
+            if sys.exc_info()[1].args[0] not in (errno.EBADF, errno.ENOENT):
+                raise
+
+    def close(self):
+        PollBackend.close(self)
+        self.pollobj.close()
+
+    def _poll(self, timeout):
+        if timeout is None:
+            timeout = -1
+        return self.pollobj.poll(timeout)
+
+BACKENDS = {
+    'select': SelectBackend,
+}
+if hasattr(select, 'poll'):
+    BACKENDS['poll'] = PollBackend
+if hasattr(select, 'epoll'):
+    BACKENDS['epoll'] = EpollBackend
+
+def create_backend(name=None):
+    ''' Create the best available readiness backend '''
+    if not name:
+        name = os.environ.get('NEUBOT_POLLER_BACKEND')
+    if name:
+        if name not in BACKENDS:
+            logging.warning('poller: unknown backend: %s', name)
+        else:
+            return BACKENDS[name]()
+    for name in ('epoll', 'poll', 'select'):
+        if name in BACKENDS:
+            return BACKENDS[name]()
+    raise RuntimeError('poller: no backend available')
+
+class Poller(object):
 
     ''' Dispatch read, write, periodic and other events '''
 
     #
     # We always keep the check_timeout() event registered
-    # so the scheduler is alive forever.
-    # We register self._poll() as the delay function and
-    # in that function we either invoke select() or we
-    # sleep for the requested amount of time.
+    # so the loop is alive forever.
+    # Timers are kept in a heap ordered by deadline.  At each
+    # iteration we dispatch all the expired timers in a single
+    # pass and then we wait for I/O using the readiness backend
+    # until the next deadline.
+    #
+    # Changes to readset and writeset are not immediately
+    # propagated to the backend: we record the file descriptors
+    # whose mask has changed into the dirty set and we flush
+    # it before waiting for I/O.  This way a stream that does
+    # unset_readable() followed by set_readable() in the same
+    # iteration does not cost any system call.
+    #
+    # We don't scan every registered stream at each check_timeout()
+    # tick.  Instead, we keep the watched pollables in a heap ordered
+    # by deadline (created plus watchdog) and at each tick we only
+    # touch the ones whose deadline has expired.  The deadlines map
+    # tells which heap entry is valid for each pollable: pollables
+    # notify us through watchdog_hook when their deadline changes,
+    # and entries that were superseded are dropped lazily.  When
+    # the deadline moves forward (e.g. on activity) we don't push a
+    # new entry, rather we re-arm the old one when it expires.
     #
 
-    def __init__(self, select_timeout):
+    def __init__(self, select_timeout, backend=None):
         ''' Initialize '''
-        sched.scheduler.__init__(self, ticks, self._poll)
         self.select_timeout = select_timeout
+        self.timers = []
+        self.timers_cancelled = 0
+        self.timers_seq = 0
         self.again = True
         self.readset = {}
         self.writeset = {}
+        self.dirty = set()
+        self.owners = {}
+        self.deadlines = {}
+        self.deadlines_heap = []
+        self.deadlines_seq = 0
+        self.watchdog_stats = {
+            'checked': 0,
+            'expired': 0,
+            'rearmed': 0,
+        }
+        self.backend = create_backend(backend)
+        logging.debug('poller: using %s backend', self.backend.name)
         self.check_timeout()
 
     def sched(self, delta, func, *args):
-        ''' Schedule task '''
+        ''' Schedule task and return a cancellable handle '''
         #logging.debug('poller: sched: %s, %s, %s', delta, func, args)
-        self.enter(delta, 0, self._run_task, (func, args))
-        return timestamp() + delta
+        task = Task(self, ticks() + delta, func, args)
+        # The sequence number keeps FIFO order for equal deadlines
+        self.timers_seq += 1
+        heapq.heappush(self.timers, (task.deadline, self.timers_seq, task))
+        return task
+
+    def _task_cancelled(self):
+        ''' Invoked when a task is cancelled '''
+        self.timers_cancelled += 1
+        if (self.timers_cancelled >= TIMER_COMPACT and
+            self.timers_cancelled * 2 > len(self.timers)):
+            self.timers = [entry for entry in self.timers
+                           if not entry[2].cancelled()]
+            heapq.heapify(self.timers)
+            self.timers_cancelled = 0
+
+    def _run_expired(self):
+        ''' Run all expired tasks in a single pass '''
+
+        #
+        # We first pop all the expired tasks and then we run
+        # them, so that a task that schedules another task with
+        # zero delay cannot starve I/O: the new task is run in
+        # the next pass, after a nonblocking wait for I/O.
+        #
+        limit = ticks() + TIMER_SLACK
+        expired = []
+        while self.timers and self.timers[0][0] <= limit:
+            task = heapq.heappop(self.timers)[2]
+            if task.cancelled():
+                self.timers_cancelled -= 1
+                continue
+            # Out of the heap: cancel() must not count it anymore
+            task.poller = None
+            expired.append(task)
+
+        for task in expired:
+            # A previous task in this pass may have cancelled it
+            if task.cancelled():
+                continue
+            func, args = task.func, task.args
+            task.func, task.args = None, None
+            self._run_task(func, args)
+
+    def _next_timeout(self):
+        ''' Return the number of seconds until the next deadline '''
+        while self.timers and self.timers[0][2].cancelled():
+            heapq.heappop(self.timers)
+            self.timers_cancelled -= 1
+        if not self.timers:
+            return None
+        return max(0, self.timers[0][0] - ticks())
 
     @staticmethod
     def _run_task(func, args):
@@ -84,28 +413,115 @@ class Poller(sched.scheduler):
 
     def set_readable(self, stream):
         ''' Monitor for readability '''
-        self.readset[stream.fileno()] = stream
+        fileno = stream.fileno()
+        self.readset[fileno] = stream
+        self.dirty.add(fileno)
+        if stream not in self.deadlines:
+            self._watch(stream)
 
     def set_writable(self, stream):
         ''' Monitor for writability '''
-        self.writeset[stream.fileno()] = stream
+        fileno = stream.fileno()
+        self.writeset[fileno] = stream
+        self.dirty.add(fileno)
+        if stream not in self.deadlines:
+            self._watch(stream)
 
     def unset_readable(self, stream):
         ''' Stop monitoring for readability '''
         fileno = stream.fileno()
         if fileno in self.readset:
             del self.readset[fileno]
+            self.dirty.add(fileno)
 
     def unset_writable(self, stream):
         ''' Stop monitoring for writability '''
         fileno = stream.fileno()
         if fileno in self.writeset:
             del self.writeset[fileno]
+            self.dirty.add(fileno)
+
+    def _flush_dirty(self):
+        ''' Propagate readset and writeset changes to the backend '''
+        dirty, self.dirty = self.dirty, set()
+        for fileno in dirty:
+            owner = self.readset.get(fileno)
+            if owner is None:
+                owner = self.writeset.get(fileno)
+            try:
+                #
+                # If another stream now owns the file descriptor, the
+                # old one was probably closed and its number reused
+                # before we had a chance to flush.  The kernel already
+                # forgot the old descriptor, so register from scratch.
+                #
+                if self.owners.get(fileno, owner) is not owner:
+                    self.backend.update(fileno, False, False)
+                if owner is not None:
+                    self.owners[fileno] = owner
+                else:
+                    self.owners.pop(fileno, None)
+                self.backend.update(fileno, fileno in self.readset,
+                                    fileno in self.writeset)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                #
+                # Most likely the file descriptor is not valid
+                # anymore: close the streams that own it, so we
+                # don't wait for something that cannot happen.
+                #
+                logging.error('poller: cannot update backend', exc_info=1)
+                for stream in (self.readset.get(fileno),
+                               self.writeset.get(fileno)):
+                    if stream:
+                        self.close(stream)
+
+    def _watch(self, stream):
+        ''' Start tracking the stream deadline '''
+        self.deadlines[stream] = None
+        stream.watchdog_hook = self._rearm
+        self._rearm(stream)
+
+    def _unwatch(self, stream):
+        ''' Stop tracking the stream deadline '''
+        if stream in self.deadlines:
+            del self.deadlines[stream]
+            stream.watchdog_hook = None
+
+    def _rearm(self, stream):
+        ''' Invoked when the stream deadline changes '''
+        if stream not in self.deadlines:
+            return
+        watchdog = getattr(stream, 'watchdog', -1)
+        if watchdog < 0:
+            self.deadlines[stream] = None
+            return
+        deadline = stream.created + watchdog
+        entry = self.deadlines[stream]
+        if entry and entry[0] <= deadline:
+            return  # Lazily re-armed when the current entry expires
+        self.deadlines_seq += 1
+        entry = (deadline, self.deadlines_seq, stream)
+        self.deadlines[stream] = entry
+        heapq.heappush(self.deadlines_heap, entry)
+        if (len(self.deadlines_heap) >
+            2 * len(self.deadlines) + WATCHDOG_COMPACT):
+            self.deadlines_heap = [entry for entry in self.deadlines.values()
+                                   if entry]
+            heapq.heapify(self.deadlines_heap)
+
+    def _is_registered(self, stream):
+        ''' Returns True if stream is in readset or writeset '''
+        fileno = stream.fileno()
+        return (self.readset.get(fileno) is stream or
+                self.writeset.get(fileno) is stream)
 
     def close(self, stream):
         ''' Safely close a stream '''
         self.unset_readable(stream)
         self.unset_writable(stream)
+        self._unwatch(stream)
         try:
             stream.handle_close()
         except (KeyboardInterrupt, SystemExit):
@@ -149,10 +565,38 @@ class Poller(sched.scheduler):
                 logging.error('poller: handle_write() failed', exc_info=1)
                 self.close(stream)
 
+    def reinit_after_fork(self):
+        ''' Forget inherited streams and create a new backend '''
+
+        #
+        # The child of a fork() shares the epoll instance with the
+        # parent, so we must create a new one.  Also, the streams
+        # registered by the parent belong to the parent: the child
+        # starts with empty readset and writeset.  Timers are kept
+        # and the caller may cancel the ones it does not want.
+        #
+        for stream in self.deadlines:
+            stream.watchdog_hook = None
+        self.deadlines.clear()
+        self.deadlines_heap = []
+        self.readset.clear()
+        self.writeset.clear()
+        self.dirty.clear()
+        self.owners.clear()
+        name = self.backend.name
+        self.backend.close()
+        self.backend = create_backend(name)
+
     def break_loop(self):
         ''' Break out of poller loop '''
         self.again = False
 
+    def run(self):
+        ''' Dispatch expired timers and I/O events '''
+        while True:
+            self._run_expired()
+            self._poll(self._next_timeout())
+
     def loop(self):
         ''' Poller loop '''
         while True:
@@ -176,14 +620,15 @@ class Poller(sched.scheduler):
         elif self.readset or self.writeset:
 
             # Get list of readable/writable streams
+            if self.dirty:
+                self._flush_dirty()
             try:
-                res = select.select(list(self.readset.keys()),
-                                    list(self.writeset.keys()),
-                                    [], timeout)
-            except select.error:
-                code = sys.exc_info()[1][0]
+                res = self.backend.wait(self.readset, self.writeset, timeout)
+            except (select.error, IOError, OSError):
+                code = sys.exc_info()[1].args[0]
                 if code != errno.EINTR:
-                    logging.error('poller: select() failed', exc_info=1)
+                    logging.error('poller: %s() failed', self.backend.name,
+                                  exc_info=1)
                     raise
 
                 else:
@@ -204,22 +649,47 @@ class Poller(sched.scheduler):
         ''' Dispatch the periodic event '''
 
         self.sched(CHECK_TIMEOUT, self.check_timeout)
-        if self.readset or self.writeset:
 
-            streams = set()
-            streams.update(list(self.readset.values()))
-            streams.update(list(self.writeset.values()))
-
-            timenow = ticks()
-            for stream in streams:
-                if stream.handle_periodic(timenow):
-                    logging.debug('poller: watchdog timeout: %s', str(stream))
-                    self.close(stream)
+        timenow = ticks()
+        while self.deadlines_heap and self.deadlines_heap[0][0] < timenow:
+            entry = heapq.heappop(self.deadlines_heap)
+            stream = entry[2]
+            if self.deadlines.get(stream) is not entry:
+                continue  # superseded entry
+
+            # No longer monitored for I/O: forget it until it comes back
+            if not self._is_registered(stream):
+                self._unwatch(stream)
+                continue
+
+            self.deadlines[stream] = None
+            self.watchdog_stats['checked'] += 1
+            if stream.handle_periodic(timenow):
+                logging.debug('poller: watchdog timeout: %s', str(stream))
+                self.watchdog_stats['expired'] += 1
+                self.close(stream)
+                continue
+
+            #
+            # The deadline moved forward since we queued the entry,
+            # or handle_periodic() decided otherwise: re-arm and, if
+            # needed, check again at the next tick.
+            #
+            self.watchdog_stats['rearmed'] += 1
+            self._rearm(stream)
+            entry = self.deadlines.get(stream)
+            if entry and entry[0] < timenow:
+                self.deadlines_seq += 1
+                entry = (timenow + CHECK_TIMEOUT, self.deadlines_seq, stream)
+                self.deadlines[stream] = entry
+                heapq.heappush(self.deadlines_heap, entry)
 
     def snap(self, data):
         ''' Take a snapshot of poller state '''
-        data['poller'] = { "readset": self.readset, "writeset": self.writeset }
-        if hasattr(self, 'queue'):
-            data['poller']['queue'] = self.queue
+        data['poller'] = { "readset": self.readset, "writeset": self.writeset,
+                           "backend": self.backend.name }
+        data['poller']['timers'] = len(self.timers) - self.timers_cancelled
+        data['poller']['watchdog'] = dict(self.watchdog_stats)
+        data['poller']['watchdog']['watched'] = len(self.deadlines)
 
 POLLER = Poller(1)
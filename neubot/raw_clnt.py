@@ -50,6 +50,7 @@ from neubot.state import STATE
 from neubot.stream import Stream
 
 from neubot import utils
+from neubot import utils_net
 
 AUTH_LEN = 64
 LEN_MESSAGE = 32768
@@ -71,6 +72,7 @@ class ClientContext(Brigade):
         self.state = state
         self.alrtt_ticks = 0.0
         self.alrtt_cnt = 10
+        self.periodic = None
 
 class RawClient(Handler):
 
@@ -84,6 +86,7 @@ class RawClient(Handler):
           sslconfig, '', ClientContext(state))
         STATE.update('test', 'raw')
         state['mss'] = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_MAXSEG)
+        state['sockopts'] = utils_net.get_sockopts(sock)
         state['rcvr_data'] = []
 
     def _connection_ready(self, stream):
@@ -161,21 +164,32 @@ class RawClient(Handler):
 
     def _rawtest_sent(self, stream):
         ''' The RAWTEST message has been sent '''
-        stream.recv(MAXRECV, self._waiting_piece)
+        stream.recv_view(MAXRECV, self._waiting_piece)
 
     def _waiting_piece(self, stream, data):
         ''' Invoked when new data is available '''
         # Note: this loop cannot be adapted to process other messages
         # easily, as pointed out in <raw_defs.py>.
         context = stream.opaque
-        context.bufferise(data)
         context.state['rcvr_data'].append((utils.ticks(), len(data)))
+        # Data is a view on a buffer the stream will reuse: we count
+        # PIECE bodies in place and bufferise (i.e. copy) only the
+        # length prefixes.  SSL streams pass strings, that we wrap,
+        # so that slicing does not copy them either.
+        data = memoryview(data)
         while True:
             if context.left > 0:
                 context.left = context.skip(context.left)
+                count = min(context.left, len(data))
+                context.left -= count
+                data = data[count:]
                 if context.left > 0:
                     break
             elif context.left == 0:
+                if context.total < 4:
+                    count = min(4 - context.total, len(data))
+                    context.bufferise(data[:count])
+                    data = data[count:]
                 tmp = context.pullup(4)
                 if not tmp:
                     break
@@ -186,7 +200,8 @@ class RawClient(Handler):
                     context.ticks = context.snap_ticks = utils.ticks()
                     context.count = context.snap_count = stream.bytes_in
                     context.snap_utime, context.snap_stime = os.times()[:2]
-                    POLLER.sched(1, self._periodic, stream)
+                    context.periodic = POLLER.sched(1, self._periodic,
+                                                    stream)
                 if context.left == 0:
                     logging.debug('< {empty-message}')
                     logging.info('raw_clnt: raw goodput test... complete')
@@ -210,7 +225,7 @@ class RawClient(Handler):
                     return
             else:
                 raise RuntimeError('raw_clnt: internal error')
-        stream.recv(MAXRECV, self._waiting_piece)
+        stream.recv_view(MAXRECV, self._waiting_piece)
 
     def _periodic(self, args):
         ''' Periodically snap goodput '''
@@ -220,7 +235,9 @@ class RawClient(Handler):
             deferred.add_callback(self._periodic_internal)
             deferred.add_errback(lambda err: self._periodic_error(stream, err))
             deferred.callback(stream)
-            POLLER.sched(1, self._periodic, stream)
+            context = stream.opaque
+            if context:
+                context.periodic = POLLER.sched(1, self._periodic, stream)
 
     @staticmethod
     def _periodic_error(stream, err):
@@ -252,6 +269,10 @@ class RawClient(Handler):
 
     def _connection_lost(self, stream):
         ''' Invoked when the connection is lost '''
+        context = stream.opaque
+        if context and context.periodic:
+            context.periodic.cancel()
+            context.periodic = None
         deferred = Deferred()
         deferred.add_callback(self._connection_lost_internal)
         deferred.add_errback(lambda error: self._connection_lost_error(stream,
@@ -53,6 +53,7 @@ from neubot.state import STATE
 from neubot import http_utils
 from neubot import raw_analyze
 from neubot import six
+from neubot import sockopts
 from neubot import utils_net
 from neubot import utils_version
 
@@ -197,7 +198,8 @@ class RawNegotiate(HttpClient):
         }
         client = RawClient()
         connector = client.connect((response['address'], response['port']),
-                       extra['prefer_ipv6'], 0, state)
+                       extra['prefer_ipv6'], 0, state,
+                       sockopts.get_profile('bulk'))
         connector.register_errfunc(lambda arg: on_failure('connect failed'))
 
     def _handle_test_success(self, stream, state):
@@ -217,6 +219,7 @@ class RawNegotiate(HttpClient):
                   'myname': state['myname'],
                   'peername': state['peername'],
                   'platform': sys.platform,
+                  'sockopts': state['sockopts'],
                   'uuid': CONFIG['uuid'],
                   'version': utils_version.NUMERIC_VERSION,
                  }
@@ -244,7 +247,6 @@ class RawNegotiate(HttpClient):
         self.append_header(stream, 'Content-Length', str(len(body)))
         self.append_header(stream, 'Cache-Control', 'no-cache')
         self.append_header(stream, 'Pragma', 'no-cache')
-        self.append_header(stream, 'Connection', 'close')
         if extra['authorization']:
             self.append_header(stream, 'Authorization', extra['authorization'])
         self.append_end_of_headers(stream)
@@ -267,7 +269,7 @@ class RawNegotiate(HttpClient):
         deferred.add_callback(self._save_results)
         deferred.callback((extra['local_result'], remote_result))
         extra['final_state'] = 1
-        stream.close()
+        self.release_stream(stream)
 
     @staticmethod
     def _save_results(opaque):
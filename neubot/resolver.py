@@ -0,0 +1,232 @@
+# neubot/resolver.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Asynchronous getaddrinfo() with caching '''
+
+# Python3-ready: yes
+
+#
+# getaddrinfo() blocks, and a slow DNS server would freeze the
+# whole event loop.  So we run getaddrinfo() in a small pool of
+# worker threads.  Workers append results to a deque and write
+# one byte to a pipe, which wakes up the poller, and the poller
+# thread then runs the callbacks.  Results are cached for CACHE_TTL
+# seconds (failures for NEGATIVE_TTL seconds), and concurrent
+# lookups of the same name share one query.
+#
+# Numeric addresses and cache hits do not need a worker, and in
+# that case the callback is invoked immediately.  The same happens
+# on systems where we cannot poll() a pipe (i.e. Windows), where we
+# fall back to a blocking getaddrinfo().
+#
+
+import collections
+import errno
+import logging
+import os
+import socket
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+if os.name == 'posix':
+    import fcntl
+
+from neubot.pollable import Pollable
+from neubot.poller import POLLER
+
+from neubot import six
+from neubot import utils
+from neubot import utils_net
+
+# Number of worker threads
+WORKERS = 4
+
+# Seconds we cache successful lookups
+CACHE_TTL = 300
+
+# Seconds we cache failed lookups
+NEGATIVE_TTL = 5
+
+# Maximum number of cached names
+CACHE_MAX = 256
+
+# Whether we can wait for a pipe in the poller
+THREADED = os.name == 'posix'
+
+class Resolver(Pollable):
+
+    ''' Asynchronous getaddrinfo() with caching '''
+
+    def __init__(self):
+        Pollable.__init__(self)
+        self.cache = {}
+        self.waiting = {}
+        self.requests = queue.Queue()
+        self.results = collections.deque()
+        self.rfd = -1
+        self.wfd = -1
+        self.pid = 0
+        self.stats = {
+            'resolver.hits': 0,
+            'resolver.misses': 0,
+            'resolver.numeric': 0,
+        }
+
+        # Wait for results "forever"
+        self.watchdog = -1
+
+    def __repr__(self):
+        return 'resolver'
+
+    def fileno(self):
+        return self.rfd
+
+    def resolve(self, epnt, prefer_ipv6, callback, family=socket.AF_UNSPEC):
+        ''' Resolve epnt and pass callback() the list of addrinfos,
+            sorted according to prefer_ipv6 (empty on failure) '''
+
+        try:
+            result = socket.getaddrinfo(epnt[0], epnt[1], family,
+              socket.SOCK_STREAM, 0, socket.AI_NUMERICHOST)
+        except socket.error:
+            pass
+        else:
+            self.stats['resolver.numeric'] += 1
+            self._deliver(epnt, result, prefer_ipv6, callback)
+            return
+
+        key = (epnt[0], epnt[1], family)
+        entry = self.cache.get(key)
+        if entry and entry[0] > utils.ticks():
+            self.stats['resolver.hits'] += 1
+            self._deliver(epnt, entry[1], prefer_ipv6, callback)
+            return
+
+        self.stats['resolver.misses'] += 1
+        if not THREADED:
+            self.results.append((key, self._getaddrinfo(key)))
+            self.waiting.setdefault(key, []).append((prefer_ipv6, callback))
+            self.handle_read()
+            return
+
+        if key in self.waiting:
+            self.waiting[key].append((prefer_ipv6, callback))
+            return
+        self.waiting[key] = [(prefer_ipv6, callback)]
+
+        self._start()
+        self.requests.put(key)
+        POLLER.set_readable(self)
+
+    def _start(self):
+        ''' Start the workers, if needed '''
+
+        # Threads do not survive fork(), so start again in the child
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+
+        for filenum in (self.rfd, self.wfd):
+            if filenum >= 0:
+                os.close(filenum)
+        self.rfd, self.wfd = os.pipe()
+        for filenum in (self.rfd, self.wfd):
+            flags = fcntl.fcntl(filenum, fcntl.F_GETFL)
+            fcntl.fcntl(filenum, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.requests = queue.Queue()
+
+        for _ in range(WORKERS):
+            thread = threading.Thread(target=self._work, args=(
+                                      self.requests, self.wfd))
+            thread.daemon = True
+            thread.start()
+
+    def _work(self, requests, wfd):
+        ''' Body of a worker thread '''
+        while True:
+            key = requests.get()
+            self.results.append((key, self._getaddrinfo(key)))
+            try:
+                os.write(wfd, six.b('x'))
+            except OSError:
+                pass  # The pipe is full, so the poller will wake up anyway
+
+    @staticmethod
+    def _getaddrinfo(key):
+        ''' Blocking getaddrinfo() '''
+        try:
+            return socket.getaddrinfo(key[0], key[1], key[2],
+                                      socket.SOCK_STREAM)
+        except socket.error:
+            return sys.exc_info()[1]
+
+    def handle_read(self):
+        if THREADED:
+            try:
+                os.read(self.rfd, 4096)
+            except OSError:
+                if sys.exc_info()[1].args[0] not in (errno.EAGAIN,
+                                                     errno.EINTR):
+                    raise
+
+        while self.results:
+            key, result = self.results.popleft()
+            epnt = (key[0], key[1])
+            if isinstance(result, Exception):
+                logging.error('resolver: cannot resolve %s: %s',
+                              utils_net.format_epnt(epnt), str(result))
+                result, ttl = [], NEGATIVE_TTL
+            else:
+                ttl = CACHE_TTL
+            if len(self.cache) >= CACHE_MAX:
+                self.cache.clear()
+            self.cache[key] = (utils.ticks() + ttl, result)
+            for prefer_ipv6, callback in self.waiting.pop(key, ()):
+                try:
+                    self._deliver(epnt, result, prefer_ipv6, callback)
+                except (KeyboardInterrupt, SystemExit):
+                    raise
+                except:
+                    logging.error('resolver: callback failed', exc_info=1)
+
+        if THREADED and not self.waiting:
+            POLLER.unset_readable(self)
+
+    @staticmethod
+    def _deliver(epnt, result, prefer_ipv6, callback):
+        ''' Sort the result and pass it to the callback '''
+        result = [ainfo for ainfo in result
+                  if ainfo[0] in utils_net.COMPARE_AF]
+        result.sort(key=utils_net.addrinfo_key, reverse=prefer_ipv6)
+        utils_net.log_addrinfo(epnt, result)
+        callback(result)
+
+    def handle_close(self):
+        pass
+
+RESOLVER = Resolver()
@@ -115,7 +115,7 @@ class RunnerMlabns(HttpClient):
             RUNNER_HOSTS.set_random_host(response)
         else:
             RUNNER_HOSTS.set_closest_host(response)
-        stream.close()
+        self.release_stream(stream)
 
 USAGE = 'usage: neubot runner_mlabns [-6Sv] [-A address] [-P policy] [-p port]'
 
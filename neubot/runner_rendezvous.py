@@ -77,7 +77,7 @@ class RunnerRendezvous(ClientHTTP):
 
         request = Message()
         request.compose(method='GET', pathquery='/rendezvous',
-          mimetype='application/json', keepalive=False, host=self.host_header,
+          mimetype='application/json', keepalive=True, host=self.host_header,
           body=json.dumps(message))
 
         stream.send_request(request)
@@ -96,7 +96,7 @@ class RunnerRendezvous(ClientHTTP):
         RUNNER_UPDATES.update(message['update'])
 
         logging.info('runner_rendezvous: rendezvous complete')
-        stream.close()
+        self.release_stream(stream)
 
 def run(address, port):
     ''' Rendezvous at URI '''
@@ -52,12 +52,17 @@ from neubot.config import CONFIG
 from neubot.backend import BACKEND
 from neubot.log import LOG
 from neubot.raw_srvr_glue import RAW_SERVER_EX
+from neubot.resolver import RESOLVER
+from neubot.server_supervisor import Supervisor
 from neubot.skype_srvr_glue import SKYPE_SERVER_EX
 
+from neubot import accept_guard
 from neubot import bittorrent
 from neubot import negotiate
+from neubot import sockopts
 from neubot import system
 from neubot import utils_modules
+from neubot import utils_net
 from neubot import utils_posix
 
 #from neubot import rendezvous          # Not yet
@@ -66,9 +71,47 @@ import neubot.rendezvous.server
 #from neubot import speedtest           # Not yet
 import neubot.speedtest.wrapper
 
+def debugmem_count():
+    ''' Return the counters exported by /debugmem/count '''
+    counts = gc.get_count()
+    result = {
+            'len_gc_objects': len(gc.get_objects()),
+            'len_gc_garbage': len(gc.garbage),
+            'gc_count0': counts[0],
+            'gc_count1': counts[1],
+            'gc_count2': counts[2],
+
+            # Add the length of the most relevant globals
+            'NEGOTIATE_SERVER.queue': len(NEGOTIATE_SERVER.queue),
+            'NEGOTIATE_SERVER.known': len(NEGOTIATE_SERVER.known),
+            'NEGOTIATE_SERVER_BITTORRENT.peers': \
+                len(NEGOTIATE_SERVER_BITTORRENT.peers),
+            'NEGOTIATE_SERVER_SPEEDTEST.clients': \
+                len(NEGOTIATE_SERVER_SPEEDTEST.clients),
+            'POLLER.readset': len(POLLER.readset),
+            'POLLER.writeset': len(POLLER.writeset),
+            'LOG._queue': len(LOG._queue),
+            'CONFIG.conf': len(CONFIG.conf),
+            'NOTIFIER._timestamps': len(NOTIFIER._timestamps),
+            'NOTIFIER._subscribers': len(NOTIFIER._subscribers),
+            'NOTIFIER._timers': len(NOTIFIER._timers),
+           }
+    result.update(accept_guard.STATS)
+    result.update(RESOLVER.stats)
+    return result
+
 class DebugAPI(ServerHTTP):
     ''' Implements the debugging API '''
 
+    def __init__(self, poller, supervisor=None):
+        ServerHTTP.__init__(self, poller)
+        self.supervisor = supervisor
+
+    def started_listening(self, listener):
+        ''' Make sure the workers don't inherit our socket '''
+        if self.supervisor:
+            self.supervisor.close_in_workers(listener.lsock)
+
     def process_request(self, stream, request):
         ''' Process HTTP request and return response '''
 
@@ -78,29 +121,13 @@ class DebugAPI(ServerHTTP):
             body = gc.collect(2)
 
         elif request.uri == '/debugmem/count':
-            counts = gc.get_count()
-            body = {
-                    'len_gc_objects': len(gc.get_objects()),
-                    'len_gc_garbage': len(gc.garbage),
-                    'gc_count0': counts[0],
-                    'gc_count1': counts[1],
-                    'gc_count2': counts[2],
-
-                    # Add the length of the most relevant globals
-                    'NEGOTIATE_SERVER.queue': len(NEGOTIATE_SERVER.queue),
-                    'NEGOTIATE_SERVER.known': len(NEGOTIATE_SERVER.known),
-                    'NEGOTIATE_SERVER_BITTORRENT.peers': \
-                        len(NEGOTIATE_SERVER_BITTORRENT.peers),
-                    'NEGOTIATE_SERVER_SPEEDTEST.clients': \
-                        len(NEGOTIATE_SERVER_SPEEDTEST.clients),
-                    'POLLER.readset': len(POLLER.readset),
-                    'POLLER.writeset': len(POLLER.writeset),
-                    'LOG._queue': len(LOG._queue),
-                    'CONFIG.conf': len(CONFIG.conf),
-                    'NOTIFIER._timestamps': len(NOTIFIER._timestamps),
-                    'NOTIFIER._subscribers': len(NOTIFIER._subscribers),
-                    'NOTIFIER._tofire': len(NOTIFIER._tofire),
-                   }
+            if self.supervisor:
+                body = self.supervisor.counters()
+            else:
+                body = debugmem_count()
+
+        elif request.uri == '/debugmem/workers' and self.supervisor:
+            body = self.supervisor.workers()
 
         elif request.uri == '/debugmem/garbage':
             body = [str(obj) for obj in gc.garbage]
@@ -160,6 +187,7 @@ class ServerSideAPI(ServerHTTP):
         stream.send_response(request, response)
 
 SETTINGS = {
+    "server.accept_batch": accept_guard.ACCEPT_BATCH,
     "server.bittorrent": True,
     "server.daemonize": False,
 #    "server.daemonize": True,
@@ -171,6 +199,7 @@ SETTINGS = {
     "server.sapi": True,
     "server.skype": True,
     "server.speedtest": True,
+    "server.workers": 0,
 }
 
 USAGE = '''\
@@ -182,6 +211,7 @@ valid backends:
   null   Do not save results but pretend to do so
 
 valid defines:
+  server.accept_batch Set max connections accepted at once (default: 16)
   server.bittorrent Set to nonzero to enable BitTorrent server (default: 1)
   server.daemonize  Set to nonzero to run in the background (default: 1)
   server.datadir    Set data directory (default: LOCALSTATEDIR/neubot)
@@ -191,12 +221,14 @@ valid defines:
   server.rendezvous Set to nonzero to enable rendezvous server (default: 0)
   server.sapi       Set to nonzero to enable nagios API (default: 1)
   server.skype      Set to nonzero to enable skype server (default: 1)
-  server.speedtest  Set to nonzero to enable speedtest server (default: 1)'''
+  server.speedtest  Set to nonzero to enable speedtest server (default: 1)
+  server.workers    Set number of worker processes (default: 0)'''
 
-VALID_MACROS = ('server.bittorrent', 'server.daemonize', 'server.datadir',
-                'server.debug', 'server.negotiate', 'server.raw',
-                'server.rendezvous', 'server.sapi', 'server.speedtest',
-                'server.skype')
+VALID_MACROS = ('server.accept_batch', 'server.bittorrent',
+                'server.daemonize', 'server.datadir', 'server.debug',
+                'server.negotiate', 'server.raw', 'server.rendezvous',
+                'server.sapi', 'server.speedtest', 'server.skype',
+                'server.workers')
 
 def main(args):
     """ Starts the server module """
@@ -248,6 +280,8 @@ def main(args):
 
     conf = CONFIG.copy()
 
+    accept_guard.set_accept_batch(conf['server.accept_batch'])
+
     #
     # Configure our global HTTP server and make
     # sure that we don't provide filesystem access
@@ -256,6 +290,100 @@ def main(args):
     conf["http.server.rootdir"] = ""
     HTTP_SERVER.configure(conf)
 
+    #
+    # When we run more than one worker, the supervisor forks
+    # the workers and each of them starts the servers binding
+    # its own sockets with SO_REUSEPORT.  The kernel steers
+    # all the connections of a client to the same worker,
+    # because the negotiate state is per-process.
+    #
+    if conf['server.workers'] > 0 and not utils_net.reuseport_supported():
+        logging.warning('server: cannot run workers: using one process')
+        conf['server.workers'] = 0
+
+    if conf['server.workers'] > 0:
+        _run_supervisor(address, conf)
+        return
+
+    _start_servers(address, conf)
+
+    #
+    # Create localhost-only debug server
+    #
+    if CONFIG['server.debug']:
+        logging.info('server: Starting debug server at {127.0.0.1,::1}:9774')
+        server = DebugAPI(POLLER)
+        server.configure(conf)
+        server.listen(('127.0.0.1 ::1', 9774))
+
+    #
+    # Go background and drop privileges,
+    # then enter into the main loop.
+    #
+    if conf["server.daemonize"]:
+        LOG.redirect()
+        system.go_background()
+
+    sigterm_handler = lambda signo, frame: POLLER.break_loop()
+    signal.signal(signal.SIGTERM, sigterm_handler)
+
+    logging.info('Neubot server -- starting up')
+    system.drop_privileges()
+    POLLER.loop()
+
+    logging.info('Neubot server -- shutting down')
+    utils_posix.remove_pidfile('/var/run/neubot.pid')
+
+def _run_supervisor(address, conf):
+    ''' Fork the workers and supervise them '''
+
+    if conf["server.daemonize"]:
+        LOG.redirect()
+        system.go_background()
+
+    supervisor = Supervisor(conf['server.workers'],
+                            lambda index: _run_worker(address, conf),
+                            debugmem_count)
+    supervisor.start()
+
+    #
+    # The debug server runs in the supervisor only, where it
+    # aggregates the counters of all the workers.
+    #
+    if conf['server.debug']:
+        logging.info('server: Starting debug server at {127.0.0.1,::1}:9774')
+        server = DebugAPI(POLLER, supervisor)
+        server.configure(conf)
+        server.listen(('127.0.0.1 ::1', 9774))
+
+    signal.signal(signal.SIGTERM, lambda signo, frame: supervisor.stop())
+
+    #
+    # The supervisor keeps root privileges, because it must
+    # be able to restart workers that bind privileged ports.
+    #
+    logging.info('Neubot server -- starting up %d workers',
+                 conf['server.workers'])
+    POLLER.loop()
+
+    logging.info('Neubot server -- shutting down')
+    utils_posix.remove_pidfile('/var/run/neubot.pid')
+
+def _run_worker(address, conf):
+    ''' Body of a worker process '''
+
+    utils_net.set_reuseport_workers(conf['server.workers'])
+    _start_servers(address, conf)
+
+    sigterm_handler = lambda signo, frame: POLLER.break_loop()
+    signal.signal(signal.SIGTERM, sigterm_handler)
+
+    system.drop_privileges()
+    POLLER.loop()
+
+def _start_servers(address, conf):
+    ''' Start all the configured servers '''
+
     #
     # New-new style: don't bother with abstraction and start the fucking
     # server by invoking its listen() method.
@@ -263,13 +391,13 @@ def main(args):
     if CONFIG['server.raw']:
         logging.debug('server: starting raw server... in progress')
         RAW_SERVER_EX.listen((address, 12345),
-          CONFIG['prefer_ipv6'], 0, '')
+          CONFIG['prefer_ipv6'], 0, '', sockopts.get_profile('bulk'))
         logging.debug('server: starting raw server... complete')
 
     if conf['server.skype']:
         logging.debug('server: starting skype server... in progress')
         SKYPE_SERVER_EX.listen((":: 0.0.0.0", 45678),
-            CONFIG['prefer_ipv6'], 0, '')
+            CONFIG['prefer_ipv6'], 0, '', sockopts.get_profile('realtime'))
         logging.debug('server: starting skype server... complete')
 
     #
@@ -322,38 +450,11 @@ def main(args):
         server.configure(conf)
         HTTP_SERVER.register_child(server, "/sapi")
 
-    #
-    # Create localhost-only debug server
-    #
-    if CONFIG['server.debug']:
-        logging.info('server: Starting debug server at {127.0.0.1,::1}:9774')
-        server = DebugAPI(POLLER)
-        server.configure(conf)
-        server.listen(('127.0.0.1 ::1', 9774))
-
     # Probe existing modules and ask them to attach to us
     utils_modules.modprobe(None, "server", {
         "http_server": HTTP_SERVER,
         "negotiate_server": NEGOTIATE_SERVER,
     })
 
-    #
-    # Go background and drop privileges,
-    # then enter into the main loop.
-    #
-    if conf["server.daemonize"]:
-        LOG.redirect()
-        system.go_background()
-
-    sigterm_handler = lambda signo, frame: POLLER.break_loop()
-    signal.signal(signal.SIGTERM, sigterm_handler)
-
-    logging.info('Neubot server -- starting up')
-    system.drop_privileges()
-    POLLER.loop()
-
-    logging.info('Neubot server -- shutting down')
-    utils_posix.remove_pidfile('/var/run/neubot.pid')
-
 if __name__ == "__main__":
     main(sys.argv)
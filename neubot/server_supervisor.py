@@ -0,0 +1,344 @@
+# neubot/server_supervisor.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Supervise pre-forked server worker processes '''
+
+#
+# The supervisor forks N workers and each of them runs its own
+# copy of the server, with its own poller.  Each worker sends
+# its /debugmem counters to the supervisor, on a pipe, every
+# REPORT_INTERVAL seconds, and the supervisor aggregates them.
+# The supervisor also restarts workers that crash.
+#
+# Workers bind their listening sockets with SO_REUSEPORT and the
+# steering program selects a socket by its index in the group of
+# each port, i.e. by the order in which sockets joined it.  So
+# we start workers one at a time, and we fork the next one only
+# when the previous one says it is ready, i.e. it has bound all
+# its ports: this way the order is the same for all ports.  When
+# a socket leaves a group the kernel moves the last one into its
+# slot, so we cannot restart just the worker that died.  Instead,
+# we stop all the other workers and, when all of them are gone
+# and the groups are empty, we start a new generation.
+#
+
+import errno
+import fcntl
+import logging
+import os
+import signal
+import sys
+
+from neubot.compat import json
+from neubot.pollable import Pollable
+from neubot.poller import POLLER
+
+from neubot import six
+from neubot import utils
+
+# Seconds between two reports of the counters
+REPORT_INTERVAL = 5
+
+# Seconds between two checks for dead workers
+REAP_INTERVAL = 1
+
+# Workers dying younger than this are restarted with a delay
+MIN_LIFETIME = 5
+
+# Seconds to wait before restarting a worker that died young
+RESTART_DELAY = 5
+
+# Line sent by a worker when it has bound all its sockets
+READY = 'ready'
+
+class WorkerChannel(Pollable):
+
+    ''' Supervisor side of the pipe connected to a worker '''
+
+    def __init__(self, index, pid, filenum, supervisor=None):
+        Pollable.__init__(self)
+        self.index = index
+        self.pid = pid
+        self.filenum = filenum
+        self.supervisor = supervisor
+        self.started = utils.ticks()
+        self.incoming = ''
+        self.counters = {}
+        self.ready = False
+
+        # The worker lives as long as it wants
+        self.watchdog = -1
+
+    def __repr__(self):
+        return 'worker %d (pid %d)' % (self.index, self.pid)
+
+    def fileno(self):
+        return self.filenum
+
+    def handle_read(self):
+        octets = os.read(self.filenum, 65536)
+        if not octets:
+            POLLER.close(self)
+            return
+        lines = (self.incoming + octets).split('\n')
+        self.incoming = lines.pop()
+        for line in lines:
+            if line == READY:
+                self.ready = True
+                if self.supervisor:
+                    self.supervisor.worker_ready(self)
+            elif line:
+                self.counters = json.loads(line)
+
+    def handle_close(self):
+        if self.filenum >= 0:
+            os.close(self.filenum)
+            self.filenum = -1
+
+class KeepAlive(Pollable):
+
+    ''' Keeps the supervisor loop alive when there are no workers '''
+
+    #
+    # The poller leaves the loop when there is no I/O pending, and
+    # this happens while we wait to start a new generation of workers
+    # (unless the debug server is running).  So we monitor the read
+    # end of a pipe whose write end we never write.
+    #
+
+    def __init__(self):
+        Pollable.__init__(self)
+        self.rfd, self.wfd = os.pipe()
+        self.watchdog = -1
+
+    def fileno(self):
+        return self.rfd
+
+    def handle_close(self):
+        if self.rfd >= 0:
+            os.close(self.rfd)
+            os.close(self.wfd)
+            self.rfd = self.wfd = -1
+
+class WorkerReporter(object):
+
+    ''' Worker side of the pipe connected to the supervisor '''
+
+    def __init__(self, filenum, counters):
+        self.filenum = filenum
+        self.counters = counters
+        self.task = None
+
+        # Never block the worker on a slow supervisor
+        flags = fcntl.fcntl(filenum, fcntl.F_GETFL)
+        fcntl.fcntl(filenum, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        self._report()
+
+    def ready(self):
+        ''' Tell the supervisor we have bound all our sockets '''
+        self._write(READY + '\n')
+
+    def _report(self):
+        ''' Send the counters to the supervisor '''
+        self.task = POLLER.sched(REPORT_INTERVAL, self._report)
+        self._write(json.dumps(self.counters()) + '\n')
+
+    def _write(self, octets):
+        ''' Write octets on the pipe '''
+        try:
+            os.write(self.filenum, octets)
+        except OSError:
+            error = sys.exc_info()[1]
+            if error.args[0] == errno.EPIPE:
+                logging.warning('server_supervisor: supervisor is gone')
+                POLLER.break_loop()
+            elif error.args[0] != errno.EAGAIN:
+                raise
+
+class Supervisor(object):
+
+    ''' Fork, monitor and restart worker processes '''
+
+    def __init__(self, count, worker_main, counters):
+        self.count = count
+        self.worker_main = worker_main
+        self.counters_func = counters
+        self.channels = {}
+        self.queue = []
+        self.pending = None
+        self.reaper = None
+        self.restarts = 0
+        self.restarting = False
+        self.delay = 0
+        self.stopping = False
+        self.inherited = []
+        self.keepalive = None
+
+    def start(self):
+        ''' Start all workers '''
+        self.keepalive = KeepAlive()
+        POLLER.set_readable(self.keepalive)
+        self._start_generation()
+        self.reaper = POLLER.sched(REAP_INTERVAL, self._reap)
+
+    def stop(self):
+        ''' Stop all workers and break out of the loop '''
+        self.stopping = True
+        self._stop_workers()
+        if self.keepalive:
+            POLLER.close(self.keepalive)
+            self.keepalive = None
+        POLLER.break_loop()
+
+    def close_in_workers(self, sock):
+        ''' Workers must close sock (e.g., the debug listener) '''
+        self.inherited.append(sock)
+
+    def worker_ready(self, channel):
+        ''' Invoked when a worker has bound all its sockets '''
+        logging.debug('server_supervisor: %s is ready', channel)
+        self._spawn_next()
+
+    def _start_generation(self):
+        ''' Start all workers, one after the other '''
+        self.pending = None
+        self.queue = list(range(self.count))
+        self._spawn_next()
+
+    def _spawn_next(self):
+        ''' Start the next worker of the current generation '''
+        if self.queue and not self.stopping and not self.restarting:
+            self._spawn(self.queue.pop(0))
+
+    def _stop_workers(self):
+        ''' Send SIGTERM to all workers '''
+        del self.queue[:]
+        if self.pending:
+            self.pending.cancel()
+            self.pending = None
+        for pid in list(self.channels.keys()):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                logging.warning('server_supervisor: kill() failed',
+                                exc_info=1)
+
+    def _spawn(self, index):
+        ''' Fork a new worker '''
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(rfd)
+            self._run_worker(index, wfd)
+        os.close(wfd)
+        channel = WorkerChannel(index, pid, rfd, self)
+        self.channels[pid] = channel
+        POLLER.set_readable(channel)
+        logging.info('server_supervisor: started %s', channel)
+
+    def _run_worker(self, index, filenum):
+        ''' Run the worker in the child process (never returns) '''
+        status = 0
+        try:
+            for channel in self.channels.values():
+                channel.handle_close()
+            self.channels.clear()
+            if self.keepalive:
+                self.keepalive.handle_close()
+                self.keepalive = None
+            for sock in self.inherited:
+                sock.close()
+            del self.inherited[:]
+            del self.queue[:]
+            if self.pending:
+                self.pending.cancel()
+                self.pending = None
+            if self.reaper:
+                self.reaper.cancel()
+                self.reaper = None
+            POLLER.reinit_after_fork()
+            reporter = WorkerReporter(filenum, self.counters_func)
+            # Runs after worker_main() has bound its sockets
+            POLLER.sched(0, reporter.ready)
+            self.worker_main(index)
+        except SystemExit:
+            status = sys.exc_info()[1].code
+            if not isinstance(status, int):
+                status = 1
+        except:
+            logging.error('server_supervisor: worker %d failed', index,
+                          exc_info=1)
+            status = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+    def _reap(self):
+        ''' Periodically check for dead workers '''
+        self.reaper = POLLER.sched(REAP_INTERVAL, self._reap)
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError:
+                if sys.exc_info()[1].args[0] != errno.ECHILD:
+                    raise
+                break
+            if pid == 0:
+                break
+            channel = self.channels.pop(pid, None)
+            if not channel:
+                continue
+            POLLER.close(channel)
+            logging.warning('server_supervisor: %s exited with status %d',
+                            channel, status)
+            if self.stopping or self.restarting:
+                continue
+            self.restarts += 1
+            self.restarting = True
+            self.delay = 0
+            if utils.ticks() - channel.started < MIN_LIFETIME:
+                self.delay = RESTART_DELAY
+            logging.warning('server_supervisor: restarting all workers')
+            self._stop_workers()
+
+        # Start again when all the sockets have left their groups
+        if self.restarting and not self.channels and not self.stopping:
+            self.restarting = False
+            self.pending = POLLER.sched(self.delay, self._start_generation)
+
+    def counters(self):
+        ''' Aggregate the counters of all workers '''
+        total = {}
+        for channel in self.channels.values():
+            for key, value in channel.counters.items():
+                if isinstance(value, six.integer_types + (float,)):
+                    total[key] = total.get(key, 0) + value
+        total['supervisor.workers'] = len(self.channels)
+        total['supervisor.restarts'] = self.restarts
+        return total
+
+    def workers(self):
+        ''' Return the counters of each worker '''
+        return dict((str(pid), channel.counters)
+                    for pid, channel in self.channels.items())
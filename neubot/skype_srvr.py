@@ -27,6 +27,7 @@
 
 # Python3-ready: yes
 
+import collections
 import getopt
 import logging
 import os
@@ -53,12 +54,20 @@ from neubot.stream import Stream
 from neubot import six
 from neubot import utils
 from neubot import utils_net
+from neubot import utils_random
 from neubot import utils_version
 from neubot import web100
 
 LEN_MESSAGE = 32768
 MAXRECV = 262144
 
+#
+# We send the same few messages over and over, so the payload must
+# not repeat within the window of a compressing middlebox: with the
+# defaults it repeats every 256 KiB, while deflate looks back 32 KiB.
+#
+NUM_MESSAGES = 8
+
 class ServerContext(Buff):
 
     ''' Server context '''
@@ -67,7 +76,7 @@ class ServerContext(Buff):
         Buff.__init__(self)
         self.ticks = 0.0
         self.count = 0
-        self.message = six.b('')
+        self.messages = collections.deque()
         self.auth = six.b('')
         self.state = {}
         self.snap_ticks = 0.0
@@ -148,9 +157,11 @@ class SkypeServer(Handler):
         context.count = context.snap_count = stream.bytes_out
         context.ticks = context.snap_ticks = utils.ticks()
         context.snap_utime, context.snap_stime = os.times()[:2]
-        message = PIECE_CODE + context.auth * int(LEN_MESSAGE / AUTH_LEN)
-        context.message = struct.pack('!I', len(message)) + message
-        stream.send(context.message, self._piece_sent)
+        blocks = utils_random.get_payload()
+        for _ in range(NUM_MESSAGES):
+            message = PIECE_CODE + blocks.get_block()[:LEN_MESSAGE].tobytes()
+            context.messages.append(struct.pack('!I', len(message)) + message)
+        stream.send(context.messages[0], self._piece_sent)
         #logging.debug('> PIECE')
         POLLER.sched(1, self._periodic, stream)
         stream.recv(1, self._waiting_eof)
@@ -169,7 +180,8 @@ class SkypeServer(Handler):
         context = stream.opaque
         ticks = utils.ticks()
         if ticks - context.ticks < 10:
-            stream.send(context.message, self._piece_sent)
+            context.messages.rotate(-1)
+            stream.send(context.messages[0], self._piece_sent)
             #logging.debug('> PIECE')
             return
         logging.info('raw_srvr: raw test... complete')
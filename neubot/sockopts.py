@@ -0,0 +1,81 @@
+# neubot/sockopts.py
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Named socket tuning profiles '''
+
+#
+# A profile is a set of socket options, stored in CONFIG under the
+# sockopts.<profile>.<option> keys, so that they can be tuned like
+# any other setting.  Each test chooses the profile of its sockets,
+# utils_net applies it before bind() or connect(), and zero (or the
+# empty string) means "keep the kernel default".  The values that
+# are actually in effect are read back with utils_net.get_sockopts()
+# and saved with the results of the test.
+#
+
+import logging
+
+from neubot.config import CONFIG
+
+PROFILES = ('bulk', 'realtime')
+
+OPTIONS = ('sndbuf', 'rcvbuf', 'nodelay', 'notsent_lowat', 'congestion',
+           'max_pacing_rate')
+
+#
+# The bulk profile is for the throughput tests (raw, speedtest and
+# bittorrent) and keeps the kernel defaults.  The realtime profile
+# is for tests where small writes must leave at once.
+#
+PROPERTIES = (
+    ('sockopts.bulk.sndbuf', 0, 'Send buffer size (0 = default)'),
+    ('sockopts.bulk.rcvbuf', 0, 'Receive buffer size (0 = default)'),
+    ('sockopts.bulk.nodelay', 0, 'Disable the Nagle algorithm'),
+    ('sockopts.bulk.notsent_lowat', 0, 'Max unsent bytes in the kernel'),
+    ('sockopts.bulk.congestion', '', 'Congestion control algorithm'),
+    ('sockopts.bulk.max_pacing_rate', 0, 'Max pacing rate, in byte/s'),
+    ('sockopts.realtime.sndbuf', 0, 'Send buffer size (0 = default)'),
+    ('sockopts.realtime.rcvbuf', 0, 'Receive buffer size (0 = default)'),
+    ('sockopts.realtime.nodelay', 1, 'Disable the Nagle algorithm'),
+    ('sockopts.realtime.notsent_lowat', 16384,
+     'Max unsent bytes in the kernel'),
+    ('sockopts.realtime.congestion', '', 'Congestion control algorithm'),
+    ('sockopts.realtime.max_pacing_rate', 0, 'Max pacing rate, in byte/s'),
+)
+
+CONFIG.register_defaults_helper(PROPERTIES)
+CONFIG.register_descriptions_helper(PROPERTIES)
+
+def get_profile(name):
+    ''' Return the socket options of the named profile '''
+    if not name:
+        return {}
+    if name not in PROFILES:
+        logging.warning('sockopts: no such profile: %s', name)
+        return {}
+    result = {}
+    for option in OPTIONS:
+        value = CONFIG['sockopts.%s.%s' % (name, option)]
+        if value:
+            result[option] = value
+    return result
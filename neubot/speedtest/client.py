@@ -28,6 +28,7 @@ import logging
 import os
 
 from neubot.utils_random import RandomBody
+from neubot.compat import json
 from neubot.config import CONFIG
 from neubot.database import DATABASE
 from neubot.database import table_speedtest
@@ -46,6 +47,7 @@ from neubot import log
 from neubot import marshal
 from neubot import privacy
 from neubot import utils
+from neubot import utils_net
 
 from neubot.bytegen_speedtest import BytegenSpeedtest
 from neubot import runner_clnt
@@ -240,6 +242,10 @@ class ClientCollect(ClientHTTP):
         # Test version (added Neubot 0.4.12)
         m1.testVersion = CONFIG['speedtest_test_version']
 
+        # Socket options of the test connections (JSON)
+        m1.sockopts = json.dumps(self.conf.get("speedtest.client.sockopts",
+                                               {}))
+
         s = marshal.marshal_object(m1, "text/xml")
         stringio = StringIO.StringIO(s)
 
@@ -287,6 +293,11 @@ class ClientSpeedtest(ClientHTTP):
         self.state = None
 
     def configure(self, conf):
+        # All the connections of the test use the bulk profile; we
+        # set it on a copy, so that it does not leak into the caller
+        conf = conf.copy()
+        if not conf.get("net.stream.profile"):
+            conf["net.stream.profile"] = "bulk"
         ClientHTTP.configure(self, conf)
 
     def connect_uri(self, uri=None, count=None):
@@ -302,6 +313,10 @@ class ClientSpeedtest(ClientHTTP):
 
         self.conf['version'] = CONFIG['speedtest_test_version']
 
+        # Collect sends the options of the test connections
+        self.conf["speedtest.client.sockopts"] = utils_net.get_sockopts(
+          stream.sock.sock)
+
         self.streams.append(stream)
         if len(self.streams) == self.conf.get("speedtest.client.nconn", 1):
             self.update()
@@ -24,12 +24,16 @@
 
 from neubot.utils_random import RandomBody
 from neubot.http.message import Message
+from neubot.http.message import ResponseTemplate
 from neubot.http.server import ServerHTTP
 
 from neubot.bytegen_speedtest import BytegenSpeedtest
 
 TARGET = 5
 
+# The response to latency and upload requests never changes
+EMPTY_RESPONSE = ResponseTemplate(code='200', reason='Ok')
+
 class SpeedtestServer(ServerHTTP):
 
     ''' Server-side of the speedtest test '''
@@ -46,10 +50,11 @@ class SpeedtestServer(ServerHTTP):
         # it.  Moreover, reading it leads to framentation, as
         # we need to actually allocate and then free all those
         # bytes.  (This is true especially when testing with
-        # fast Neubot clients.)  This fix brings the amount of
-        # memory consumed by the server under control again.
+        # fast Neubot clients.)  In sink mode the stream just
+        # counts the body bytes, without creating a piece object
+        # and invoking a callback for each of them.
         #
-        request.body.write = lambda data: None
+        stream.sink_body()
         return isgood
 
     @staticmethod
@@ -66,9 +71,7 @@ class SpeedtestServer(ServerHTTP):
 
         # Just ignore the incoming body
         if request.uri in ('/speedtest/latency', '/speedtest/upload'):
-            response = Message()
-            response.compose(code='200', reason='Ok')
-            stream.send_response(request, response)
+            stream.send_response(request, EMPTY_RESPONSE.response())
 
         elif request.uri == '/speedtest/download':
 
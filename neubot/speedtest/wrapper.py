@@ -68,6 +68,9 @@ class SpeedtestCollect(object):
         # Test version (added Neubot 0.4.12)
         self.testVersion = 1
 
+        # Socket options of the test connections, as JSON
+        self.sockopts = ''
+
 class SpeedtestNegotiate_Response(object):
 
     ''' Old XML negotiate response '''
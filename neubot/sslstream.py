@@ -25,6 +25,7 @@
 # Python3-ready: yes
 
 import logging
+import socket
 import ssl
 import sys
 
@@ -36,6 +37,115 @@ from neubot.pollable import SUCCESS
 from neubot.pollable import WANT_READ
 from neubot.pollable import WANT_WRITE
 from neubot.poller import POLLER
+from neubot import utils_net
+
+#
+# A full handshake costs a public key operation on the server and,
+# when a new context is created for each connection, also loading
+# and parsing the certificate and the private key.  So we keep one
+# context per (certfile, server_side) pair, which enables OpenSSL's
+# server-side session cache and session tickets, and, when Python
+# lets us handle sessions (3.6+), we remember the last session we
+# got from each endpoint and offer it at the next connect.
+#
+HAVE_CONTEXT = hasattr(ssl, 'SSLContext')
+HAVE_SESSION = hasattr(ssl, 'SSLSession')
+
+# Maximum number of client sessions we remember
+SESSION_CACHE_MAX = 64
+
+# Set to False to create a new context per connection
+CACHE_CONTEXTS = True
+
+CONTEXTS = {}
+SESSIONS = {}
+
+def get_context(certfile, server_side):
+    ''' Return the context to use for a connection '''
+    key = (certfile, server_side)
+    context = CONTEXTS.get(key)
+    if context is None:
+        context = ssl.SSLContext(getattr(ssl, 'PROTOCOL_TLS',
+                                         ssl.PROTOCOL_SSLv23))
+        # Stateless resumption: the server sends the client a ticket
+        context.options &= ~getattr(ssl, 'OP_NO_TICKET', 0)
+        if certfile:
+            context.load_cert_chain(certfile)
+        if CACHE_CONTEXTS:
+            CONTEXTS[key] = context
+    return context
+
+def prepare_server(certfile):
+    ''' Create the server context before accepting connections '''
+
+    #
+    # Workers forked after this point share the context and, hence,
+    # the session ticket keys, so each of them can resume a session
+    # that was established by another one.
+    #
+    if not HAVE_CONTEXT or not CACHE_CONTEXTS:
+        return
+    try:
+        get_context(certfile, True)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except:
+        logging.warning('sslstream: cannot load %s', certfile, exc_info=1)
+
+def wrap_socket(sock, certfile, server_side, endpoint=None):
+    ''' Wrap sock, resuming the session with endpoint if possible '''
+
+    # wrap_socket distinguishes between None and ''
+    if not certfile:
+        certfile = None
+
+    if not HAVE_CONTEXT:
+        return ssl.SSLSocket(sock, do_handshake_on_connect=False,
+                             certfile=certfile, server_side=server_side)
+
+    kwargs = {}
+    if not server_side and endpoint in SESSIONS:
+        kwargs['session'] = SESSIONS[endpoint]
+    context = get_context(certfile, server_side)
+    return context.wrap_socket(sock, do_handshake_on_connect=False,
+                               server_side=server_side, **kwargs)
+
+def save_session(sock, endpoint):
+    ''' Remember the session of a client socket before closing it '''
+    if not HAVE_SESSION or endpoint is None:
+        return
+    session = getattr(sock, 'session', None)
+    if session is None:
+        return
+    if endpoint not in SESSIONS and len(SESSIONS) >= SESSION_CACHE_MAX:
+        del SESSIONS[next(iter(SESSIONS))]
+    SESSIONS[endpoint] = session
+
+def read_batch(sock, maxlen):
+    ''' SSL_read() up to maxlen bytes, in as many records as are ready '''
+
+    #
+    # Each SSL_read() returns at most one TLS record (16 KiB), so a
+    # single read per readable event means many more trips through
+    # the poller than with plain sockets.  Here we keep reading as
+    # long as OpenSSL has bytes buffered or the kernel has records
+    # ready.  Errors after the first read are not raised here, since
+    # we have data to deliver: the next read will raise them again.
+    #
+    octets = sock.read(maxlen)
+    if not octets or len(octets) >= maxlen:
+        return octets
+    chunks, total = [octets], len(octets)
+    while total < maxlen:
+        try:
+            octets = sock.read(maxlen - total)
+        except (ssl.SSLError, socket.error):
+            break
+        if not octets:
+            break
+        chunks.append(octets)
+        total += len(octets)
+    return octets[:0].join(chunks)
 
 class SSLWrapper(object):
     ''' Wrapper for an SSL socket '''
@@ -47,12 +157,14 @@ class SSLWrapper(object):
     # with the same (simple) socket interface.
     #
 
-    def __init__(self, sock):
+    def __init__(self, sock, endpoint=None):
         self.sock = sock
+        self.endpoint = endpoint
 
     def close(self):
         ''' Wrapper for SSL_close() '''
         try:
+            save_session(self.sock, self.endpoint)
             self.sock.close()
         except (KeyboardInterrupt, SystemExit):
             raise
@@ -62,7 +174,7 @@ class SSLWrapper(object):
     def sorecv(self, maxlen):
         ''' Wrapper for SSL_read() '''
         try:
-            return SUCCESS, self.sock.read(maxlen)
+            return SUCCESS, read_batch(self.sock, maxlen)
         except ssl.SSLError:
             exception = sys.exc_info()[1]
             if exception.args[0] == ssl.SSL_ERROR_WANT_READ:
@@ -136,19 +248,12 @@ def initialise(stream, sock, sslcert):
 
     logging.debug('stream_ssl: initialise()')
 
-    #
-    # Do not use '' to indicate no certfile, because wrap_socket() only
-    # recognizes None for that purpose.  Instead, the empty string is
-    # taken as the path for the certificate and the call raises an error.
-    #
     if not sslcert:
-        server_side = False
-        sslcert = None
+        endpoint = utils_net.getpeername(sock)
+        stream.sock = SSLWrapper(wrap_socket(sock, None, False, endpoint),
+                                 endpoint)
     else:
-        server_side = True
-
-    stream.sock = SSLWrapper(ssl.SSLSocket(sock, do_handshake_on_connect=False,
-                                   certfile=sslcert, server_side=server_side))
+        stream.sock = SSLWrapper(wrap_socket(sock, sslcert, True))
 
     handshaker = Handshaker(stream)
     handshaker.handshake()
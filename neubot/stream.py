@@ -47,6 +47,46 @@ SOFT_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
 
 EMPTY_STRING = six.b('')
 
+# Size of pooled receive buffers, i.e. the largest single read
+RECV_MAXSIZE = 262144
+
+# Smallest adaptive read size
+RECV_MINSIZE = 8192
+
+# Adaptive read size of new streams
+RECV_INITSIZE = 65536
+
+class RecvBufferPool(object):
+
+    ''' Pool of preallocated receive buffers '''
+
+    #
+    # Reading with recv() allocates a fresh string as large as the
+    # requested size at each read, and the string is then shrunk to
+    # the amount of bytes actually read.  With 256 KiB reads that is
+    # a lot of allocator churn.  So we recv_into() bytearrays taken
+    # from this pool and either copy out just the bytes we read, or
+    # pass the consumer a memoryview on the buffer.
+    #
+
+    def __init__(self, bufsize, maxfree):
+        self.bufsize = bufsize
+        self.maxfree = maxfree
+        self.free = []
+
+    def get(self):
+        ''' Get a buffer from the pool '''
+        if self.free:
+            return self.free.pop()
+        return bytearray(self.bufsize)
+
+    def put(self, buff):
+        ''' Return a buffer to the pool '''
+        if len(self.free) < self.maxfree:
+            self.free.append(buff)
+
+RECV_POOL = RecvBufferPool(RECV_MAXSIZE, 4)
+
 class StreamWrapper(object):
 
     ''' Wrapper for a simple socket '''
@@ -83,6 +123,19 @@ class StreamWrapper(object):
             else:
                 raise
 
+    def sorecv_into(self, view):
+        ''' Wrapper for socket recv_into() '''
+        try:
+            return SUCCESS, self.sock.recv_into(view)
+        except socket.error:
+            exception = sys.exc_info()[1]
+            if exception.args[0] in SOFT_ERRORS:
+                return WANT_READ, 0
+            elif exception.args[0] == errno.ECONNRESET:
+                return CONNRST, 0
+            else:
+                raise
+
     def sosend(self, octets):
         ''' Wrapper for socket send() '''
         try:
@@ -103,6 +156,9 @@ class StreamWrapperDebug(StreamWrapper):
         maxlen = 1
         return StreamWrapper.sorecv(self, maxlen)
 
+    def sorecv_into(self, view):
+        return StreamWrapper.sorecv_into(self, view[:1])
+
 def _stream_wrapper(sock):
     ''' Create the right stream wrapper '''
     if not os.environ.get('NEUBOT_STREAM_DEBUG'):
@@ -148,8 +204,11 @@ class Stream(Pollable):
         self.conn_rst = False
         self.eof = False
         self.isclosed = False
+        self.recv_buff = None
         self.recv_bytes = 0
         self.recv_blocked = False
+        self.recv_size = RECV_INITSIZE
+        self.recv_zerocopy = False
         self.send_blocked = False
 
         self.atclose.add_callback(connection_lost)
@@ -209,6 +268,7 @@ class Stream(Pollable):
         self.atclose = None
         self.atconnect = None
         self.opaque = None
+        self.recv_buff = None
         self.recv_complete = None
         self.send_complete = None
         self.send_octets = None
@@ -236,6 +296,7 @@ class Stream(Pollable):
 
         self.recv_bytes = recv_bytes
         self.recv_complete = recv_complete
+        self.recv_zerocopy = False
 
         if self.recv_blocked:
             logging.debug('stream: recv() is blocked')
@@ -243,6 +304,19 @@ class Stream(Pollable):
 
         POLLER.set_readable(self)
 
+    def recv_view(self, recv_bytes, recv_complete):
+        ''' Async recv() that passes recv_complete() a memoryview '''
+
+        #
+        # The memoryview points into a pooled buffer that is reused
+        # as soon as recv_complete() returns.  So, this is for protocols
+        # that just count the received bytes, or that copy the few bytes
+        # they need to keep.  (Over SSL you always get a string.)
+        #
+
+        self.recv(recv_bytes, recv_complete)
+        self.recv_zerocopy = True
+
     def handle_read(self):
 
         #
@@ -259,7 +333,8 @@ class Stream(Pollable):
             self.handle_write()
             return
 
-        status, octets = self.sock.sorecv(self.recv_bytes)
+        recv_bytes = min(self.recv_bytes, self.recv_size)
+        status, octets = self._sorecv(recv_bytes)
 
         #
         # Optimisation: reorder if branches such that the ones more relevant
@@ -270,9 +345,13 @@ class Stream(Pollable):
 
         if status == SUCCESS and octets:
             self.bytes_in += len(octets)
+            self._adapt_recv_size(recv_bytes, len(octets))
             self.recv_bytes = 0
             POLLER.unset_readable(self)
             self.recv_complete(self, octets)
+            if self.recv_buff:
+                RECV_POOL.put(self.recv_buff)
+                self.recv_buff = None
             return
 
         if status == WANT_READ:
@@ -299,6 +378,33 @@ class Stream(Pollable):
 
         raise RuntimeError('stream: invalid status')
 
+    def _sorecv(self, recv_bytes):
+        ''' Read up to recv_bytes, using a pooled buffer if possible '''
+        sorecv_into = getattr(self.sock, 'sorecv_into', None)
+        if not sorecv_into:
+            return self.sock.sorecv(recv_bytes)
+        buff = RECV_POOL.get()
+        view = memoryview(buff)
+        status, count = sorecv_into(view[:recv_bytes])
+        if status != SUCCESS or count <= 0:
+            RECV_POOL.put(buff)
+            return status, EMPTY_STRING
+        if self.recv_zerocopy:
+            self.recv_buff = buff
+            return status, view[:count]
+        octets = view[:count].tobytes()
+        RECV_POOL.put(buff)
+        return status, octets
+
+    def _adapt_recv_size(self, recv_bytes, count):
+        ''' Grow or shrink the read size depending on throughput '''
+        if recv_bytes < self.recv_size:
+            return  # The protocol asked for less than we could read
+        if count >= recv_bytes:
+            self.recv_size = min(self.recv_size << 1, RECV_MAXSIZE)
+        elif count < (recv_bytes >> 2):
+            self.recv_size = max(self.recv_size >> 1, RECV_MINSIZE)
+
     #
     # Send path: the protocol invokes start send to start an async send()
     # operation, the poller invokes handle_write() when the underlying socket
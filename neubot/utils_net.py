@@ -26,11 +26,140 @@ import errno
 import logging
 import os
 import socket
+import struct
 import sys
 
 # Winsock returns EWOULDBLOCK
 INPROGRESS = [ 0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN ]
 
+#
+# Python 2 does not export SO_REUSEPORT, and no Python version
+# exports SO_ATTACH_REUSEPORT_CBPF, so we hardcode the Linux values.
+#
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', None)
+SO_ATTACH_REUSEPORT_CBPF = None
+if sys.platform.startswith('linux'):
+    if not SO_REUSEPORT:
+        SO_REUSEPORT = 15
+    SO_ATTACH_REUSEPORT_CBPF = 51
+
+#
+# Socket options that the profiles in neubot/sockopts.py may set.
+# Python 2 does not export the Linux-only ones, so, again, we have
+# hardcoded their values.
+#
+SOCKOPTS = {
+    'sndbuf': (socket.SOL_SOCKET, socket.SO_SNDBUF),
+    'rcvbuf': (socket.SOL_SOCKET, socket.SO_RCVBUF),
+    'nodelay': (socket.IPPROTO_TCP, socket.TCP_NODELAY),
+}
+if sys.platform.startswith('linux'):
+    SOCKOPTS['notsent_lowat'] = (socket.IPPROTO_TCP,
+      getattr(socket, 'TCP_NOTSENT_LOWAT', 25))
+    SOCKOPTS['congestion'] = (socket.IPPROTO_TCP,
+      getattr(socket, 'TCP_CONGESTION', 13))
+    SOCKOPTS['max_pacing_rate'] = (socket.SOL_SOCKET,
+      getattr(socket, 'SO_MAX_PACING_RATE', 47))
+
+def apply_sockopts(sock, sockopts):
+    ''' Apply the socket options of a profile to sock '''
+    for name, value in sorted(sockopts.items()):
+        if not value:
+            continue
+        if name not in SOCKOPTS:
+            logging.warning('utils_net: unsupported socket option: %s', name)
+            continue
+        if not isinstance(value, int):
+            value = value.encode('ascii')
+        level, optname = SOCKOPTS[name]
+        try:
+            sock.setsockopt(level, optname, value)
+        except socket.error:
+            logging.warning('utils_net: cannot set %s to %s', name,
+                            value, exc_info=1)
+
+def get_sockopts(sock):
+    ''' Read back the socket options that are in effect '''
+    result = {}
+    for name, (level, optname) in SOCKOPTS.items():
+        try:
+            if name == 'congestion':
+                value = sock.getsockopt(level, optname, 16)
+                value = value.split(b'\0')[0].decode('ascii')
+            else:
+                value = sock.getsockopt(level, optname)
+        except socket.error:
+            continue
+        result[name] = value
+    return result
+
+#
+# When the server runs more than one worker process, each worker
+# binds its own listening sockets with SO_REUSEPORT and the kernel
+# balances incoming connections among them.  Since the negotiate
+# state is per-process, all the connections of a client must land
+# on the same worker: we attach a classic BPF program that selects
+# the socket using the client address modulo the number of workers.
+# The program returns an index into the group of sockets bound to the
+# port, and the kernel orders the group by bind time (and moves the
+# last socket into the slot of a closed one), so this only works if
+# all workers bind in the same order: that is why server_supervisor
+# starts them one at a time and restarts all of them together.
+#
+REUSEPORT_WORKERS = 0
+
+def set_reuseport_workers(count):
+    ''' Set the number of workers sharing each listening port '''
+    global REUSEPORT_WORKERS
+    REUSEPORT_WORKERS = count
+
+def reuseport_supported():
+    ''' Returns True if SO_REUSEPORT steering is available '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        try:
+            reuseport_enable(sock)
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(1)
+            reuseport_attach(sock, socket.AF_INET, 2)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            logging.warning('utils_net: no SO_REUSEPORT steering',
+                            exc_info=1)
+            return False
+        return True
+    finally:
+        sock.close()
+
+def _reuseport_steering(family, count):
+    ''' Build the BPF program that steers a client to a worker '''
+    # Offset of the (last 32 bits of the) source address
+    if family == socket.AF_INET6:
+        offset = 20
+    else:
+        offset = 12
+    code = [
+        (0x20, 0, 0, (-0x100000 + offset) & 0xffffffff),  # ld [net + off]
+        (0x94, 0, 0, count),                              # mod #count
+        (0x16, 0, 0, 0),                                  # ret a
+    ]
+    return ''.join([struct.pack('HBBI', *insn) for insn in code])
+
+def reuseport_enable(sock):
+    ''' Enable SO_REUSEPORT (must be invoked before bind()) '''
+    if not SO_REUSEPORT or not SO_ATTACH_REUSEPORT_CBPF:
+        raise RuntimeError('utils_net: SO_REUSEPORT steering not available')
+    sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+
+def reuseport_attach(sock, family, count):
+    ''' Attach steering program (must be invoked after listen()) '''
+    # Lazy import: ctypes is needed to pass a pointer to the program
+    import ctypes
+    program = ctypes.create_string_buffer(_reuseport_steering(family, count))
+    fprog = struct.pack('HP', 3, ctypes.addressof(program))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, fprog)
+
 def format_epnt(epnt):
     ''' Format endpoint for printing '''
     address, port = epnt[:2]
@@ -92,7 +221,7 @@ def addrinfo_key(ainfo):
     ''' Map addrinfo to protocol family '''
     return COMPARE_AF[ainfo[0]]
 
-def listen(epnt, prefer_ipv6):
+def listen(epnt, prefer_ipv6, sockopts=None):
     ''' Listen to all sockets represented by epnt '''
 
     logging.debug('listen(): about to listen to: %s', str(epnt))
@@ -106,7 +235,8 @@ def listen(epnt, prefer_ipv6):
     # Allow to listen on a list of addresses
     if epnt[0] and ' ' in epnt[0]:
         for address in epnt[0].split():
-            result = listen((address.strip(), epnt[1]), prefer_ipv6)
+            result = listen((address.strip(), epnt[1]), prefer_ipv6,
+                            sockopts)
             sockets.extend(result)
         return sockets
 
@@ -134,11 +264,18 @@ def listen(epnt, prefer_ipv6):
             print ('listen(): trying to listen on : %s') %( format_ainfo(ainfo))
             sock = socket.socket(ainfo[0], socket.SOCK_STREAM)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if REUSEPORT_WORKERS > 0:
+                reuseport_enable(sock)
+            # Before listen(), so accepted sockets inherit the options
+            if sockopts:
+                apply_sockopts(sock, sockopts)
             sock.setblocking(False)
             sock.bind(ainfo[4])
             #sock.bind(('localhost', 23237))
             # Probably the backlog here is too big
             sock.listen(128)
+            if REUSEPORT_WORKERS > 0:
+                reuseport_attach(sock, ainfo[0], REUSEPORT_WORKERS)
 
             print ('listen(): listening on : %s') %( format_ainfo(ainfo))
             logging.debug('listen(): listening at: %s', format_epnt(ainfo[4]))
@@ -157,10 +294,8 @@ def listen(epnt, prefer_ipv6):
 
     return sockets
 
-def connect(epnt, prefer_ipv6):
-    ''' Connect to epnt '''
-
-    logging.debug('connect(): about to connect to: %s', str(epnt))
+def resolve_connect(epnt, prefer_ipv6):
+    ''' Resolve epnt and return the sorted list of addrinfos '''
 
     try:
         addrinfo = socket.getaddrinfo(epnt[0], epnt[1], socket.AF_UNSPEC,
@@ -168,37 +303,83 @@ def connect(epnt, prefer_ipv6):
     except socket.error:
         logging.error('connect(): cannot connect to %s',
                       format_epnt(epnt), exc_info=1)
-        return None
+        return []
+
+    addrinfo.sort(key=addrinfo_key, reverse=prefer_ipv6)
+    log_addrinfo(epnt, addrinfo)
+    return addrinfo
 
-    message = ['connect(): getaddrinfo() returned: [']
+def log_addrinfo(epnt, addrinfo):
+    ''' Log the result of getaddrinfo() '''
+    message = ['connect(): getaddrinfo(%s) returned: [' % format_epnt(epnt)]
     for ainfo in addrinfo:
         message.append(format_ainfo(ainfo))
         message.append(', ')
-    message[-1] = ']'
+    if addrinfo:
+        message[-1] = ']'
+    else:
+        message.append(']')
     logging.debug(''.join(message))
 
-    addrinfo.sort(key=addrinfo_key, reverse=prefer_ipv6)
+def interleave_families(addrinfo):
+    ''' Alternate address families, starting with the first one '''
 
+    #
+    # As recommended by RFC 6555 (Happy Eyeballs), so that racing
+    # connections over a broken family always tries the other one
+    # next.  The order within each family is preserved.
+    #
+
+    families = {}
+    order = []
     for ainfo in addrinfo:
-        try:
-            logging.debug('connect(): trying with: %s', format_ainfo(ainfo))
+        if ainfo[0] not in families:
+            families[ainfo[0]] = []
+            order.append(ainfo[0])
+        families[ainfo[0]].append(ainfo)
+    result = []
+    while order:
+        for family in list(order):
+            result.append(families[family].pop(0))
+            if not families[family]:
+                order.remove(family)
+    return result
+
+def connect_ainfo(ainfo, sockopts=None):
+    ''' Start a nonblocking connect() to ainfo '''
+    try:
+        logging.debug('connect(): trying with: %s', format_ainfo(ainfo))
 
-            sock = socket.socket(ainfo[0], socket.SOCK_STREAM)
-            sock.setblocking(False)
-            result = sock.connect_ex(ainfo[4])
-            if result not in INPROGRESS:
-                raise socket.error(result, os.strerror(result))
+        sock = socket.socket(ainfo[0], socket.SOCK_STREAM)
+        # Before connect(), so the window scale reflects the buffers
+        if sockopts:
+            apply_sockopts(sock, sockopts)
+        sock.setblocking(False)
+        result = sock.connect_ex(ainfo[4])
+        if result not in INPROGRESS:
+            raise socket.error(result, os.strerror(result))
 
-            logging.debug('connect(): connection to %s in progress...',
-                          format_epnt(ainfo[4]))
-            return sock
+        logging.debug('connect(): connection to %s in progress...',
+                      format_epnt(ainfo[4]))
+        return sock
 
-        except socket.error:
-            logging.warning('connect(): cannot connect to %s',
-              format_epnt(ainfo[4]), exc_info=1)
-        except:
-            logging.warning('connect(): cannot connect to %s',
-              format_epnt(ainfo[4]), exc_info=1)
+    except socket.error:
+        logging.warning('connect(): cannot connect to %s',
+          format_epnt(ainfo[4]), exc_info=1)
+    except:
+        logging.warning('connect(): cannot connect to %s',
+          format_epnt(ainfo[4]), exc_info=1)
+    return None
+
+def connect(epnt, prefer_ipv6, sockopts=None):
+    ''' Connect to epnt '''
+
+    logging.debug('connect(): about to connect to: %s', str(epnt))
+
+    for ainfo in resolve_connect(epnt, prefer_ipv6):
+        sock = connect_ainfo(ainfo, sockopts)
+        if sock:
+            return sock
 
     logging.error('connect(): cannot connect to %s: %s',
       format_epnt(epnt), 'all attempts failed')
@@ -28,9 +28,13 @@
 #
 
 import collections
+import hashlib
+import logging
 import os.path
 import random
 
+from neubot.config import CONFIG
+
 #
 # Must use WWWDIR because Python modules are not
 # reachable with Windows.  They are stored into
@@ -44,6 +48,26 @@ MAXDEPTH = 16
 # Size of a block
 BLOCKSIZE = 262144
 
+# Number of precomputed blocks
+POOLSIZE = 8
+
+# Where we save the base block, to avoid building it at each start
+CACHEPATH = os.sep.join([utils_hier.LOCALSTATEDIR, 'base_block.cache'])
+
+# Unit of the compressibility knob of the urandom payload
+SEGMENT = 4096
+
+ENGINES = ('urandom', 'words')
+
+PROPERTIES = (
+    ('payload.engine', 'urandom', 'Payload of the tests (urandom, words)'),
+    ('payload.compressibility', 0,
+     'Percentage of the urandom payload that compresses away'),
+)
+
+CONFIG.register_defaults_helper(PROPERTIES)
+CONFIG.register_descriptions_helper(PROPERTIES)
+
 def listdir(curdir, vector, depth):
 
     ''' Make a list of all the files in a given directory
@@ -59,14 +83,67 @@ def listdir(curdir, vector, depth):
         elif os.path.isfile(entry):
             vector.append(entry)
 
+#
+# Building the base block means reading some files and shuffling the
+# characters of some fifty thousand words, which takes a noticeable
+# fraction of a second.  So we save it into CACHEPATH, along with a
+# digest of the name, size and mtime of the files in WWWDIR, and we
+# build it again only when the digest changes.  Failing to read or
+# to write the cache is not an error: we just build the block.
+#
+
+def _digest_files(files, length):
+    ''' Return the digest of the files the base block is made of '''
+    digest = hashlib.sha1(str(length))
+    for fpath in sorted(files):
+        result = os.stat(fpath)
+        digest.update('%s %d %d\n' % (fpath, result.st_size,
+                                      int(result.st_mtime)))
+    return digest.hexdigest()
+
+def _read_cache(digest):
+    ''' Return the cached base block, or None '''
+    try:
+        fileptr = open(CACHEPATH, 'rb')
+        content = fileptr.read()
+        fileptr.close()
+    except (IOError, OSError):
+        return None
+    header, _, body = content.partition('\n')
+    if header != digest or not body:
+        logging.debug('utils_random: stale cache: %s', CACHEPATH)
+        return None
+    return collections.deque(body.split(' '))
+
+def _write_cache(digest, base_block):
+    ''' Save the base block, atomically '''
+    temp = '%s.%d' % (CACHEPATH, os.getpid())
+    try:
+        fileptr = open(temp, 'wb')
+        fileptr.write(digest + '\n')
+        fileptr.write(' '.join(base_block))
+        fileptr.close()
+        os.rename(temp, CACHEPATH)
+    except (IOError, OSError):
+        logging.debug('utils_random: cannot write cache: %s', CACHEPATH)
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+
 def create_base_block(length):
 
     ''' Create a base block of length @length '''
 
-    base_block = collections.deque()
-
     files = []
     listdir(utils_hier.WWWDIR, files, 0)
+
+    digest = _digest_files(files, length)
+    base_block = _read_cache(digest)
+    if base_block:
+        return base_block
+
+    base_block = collections.deque()
     random.shuffle(files)
 
     for fpath in files:
@@ -88,6 +165,7 @@ def create_base_block(length):
         if length <= 0:
             break
 
+    _write_cache(digest, base_block)
     return base_block
 
 def block_generator(size):
@@ -99,32 +177,109 @@ def block_generator(size):
         block.rotate(random.randrange(4, 16))
         yield ''.join(block)
 
+#
+# Joining the base block for each block we send costs one 256 KiB
+# allocation and copy per block, in the hottest path of the download
+# tests.  So we join POOLSIZE blocks once, at startup, and then we
+# hand out, in round robin, read-only memoryviews of them: slicing
+# a memoryview does not copy, and the stream code sends memoryviews
+# directly.  The blocks were already rotations of the same base
+# block, so cycling over the pool does not make the data any more
+# compressible than it was.
+#
+
 class RandomBlocks(object):
 
-    ''' Generate blocks randomly shuffling a base block '''
+    ''' Hand out blocks from a pool of randomly shuffled blocks '''
 
-    def __init__(self, size=BLOCKSIZE):
+    def __init__(self, size=BLOCKSIZE, poolsize=POOLSIZE):
         ''' Initialize random blocks generator '''
-        self._generator = block_generator(size)
         self.blocksiz = size
+        self.poolsize = poolsize
+        self._pool = []
+        self._index = 0
 
     def reinit(self):
-        ''' Reinitialize the generator '''
-        self._generator = block_generator(self.blocksiz)
+        ''' Reinitialize the pool of blocks '''
+        generator = block_generator(self.blocksiz)
+        self._pool = [memoryview(generator.next())
+                      for _ in range(self.poolsize)]
+        self._index = 0
 
     def get_block(self):
-        ''' Return a block of data '''
-        return self._generator.next()
+        ''' Return a block of data, as a read-only memoryview '''
+        if not self._pool:
+            self.reinit()
+        block = self._pool[self._index]
+        self._index = (self._index + 1) % self.poolsize
+        return block
 
+#
+# The pool is created on the first get_block(), so that commands
+# that do not run a test do not pay for it.  By then we may have
+# dropped root privileges, which is fine because the files in
+# WWWDIR must be readable by the unprivileged user anyway, since
+# we serve the web user interface from there.
+#
 RANDOMBLOCKS = RandomBlocks()
 
 #
-# XXX Create and discard the first block at the very
-# beginning, so we are sure that we can fetch all the
-# needed files in the common case, i.e. when we
-# startup as root.
+# The words payload above compresses roughly like text, so a link
+# with compression (e.g., a VPN or a WAN optimizer) would inflate
+# the measured goodput.  The urandom payload reads a pool of bytes
+# from os.urandom() once and then hands out read-only views of it
+# that start at a random offset: no copy per block, and the same
+# bytes do not reappear at a fixed distance.  The compressibility
+# knob zeroes the given percentage of each SEGMENT of the pool, so
+# one can also emulate content that compresses.
 #
-RANDOMBLOCKS.get_block()
+
+class UrandomBlocks(object):
+
+    ''' Hand out incompressible blocks from a pool of urandom bytes '''
+
+    def __init__(self, size=BLOCKSIZE, poolsize=POOLSIZE,
+                 compressibility=0):
+        ''' Initialize urandom blocks generator '''
+        self.blocksiz = size
+        self.poolsize = poolsize
+        self.compressibility = min(max(int(compressibility), 0), 100)
+        self._pool = memoryview(b'')
+        self.reinit()
+
+    def reinit(self):
+        ''' Reinitialize the pool of bytes '''
+        pool = bytearray(os.urandom((self.poolsize + 1) * self.blocksiz))
+        zeroes = SEGMENT * self.compressibility // 100
+        if zeroes:
+            filler = bytearray(zeroes)
+            for offset in range(0, len(pool), SEGMENT):
+                pool[offset:offset + zeroes] = filler
+        self._pool = memoryview(bytes(pool))
+
+    def get_block(self):
+        ''' Return a block of data, as a read-only memoryview '''
+        offset = random.randrange(self.poolsize * self.blocksiz + 1)
+        return self._pool[offset:offset + self.blocksiz]
+
+_PAYLOADS = {}
+
+def get_payload(engine=None, compressibility=None):
+    ''' Return the block generator of the configured payload engine '''
+    if engine is None:
+        engine = CONFIG['payload.engine']
+    if engine == 'words':
+        return RANDOMBLOCKS
+    if engine != 'urandom':
+        logging.warning('utils_random: no such engine: %s', engine)
+    if compressibility is None:
+        compressibility = CONFIG['payload.compressibility']
+    compressibility = int(compressibility)
+    blocks = _PAYLOADS.get(compressibility)
+    if blocks is None:
+        blocks = UrandomBlocks(compressibility=compressibility)
+        _PAYLOADS[compressibility] = blocks
+    return blocks
 
 class RandomBody(object):
 
@@ -134,18 +289,21 @@ class RandomBody(object):
      returned by its read() method.
     '''
 
-    def __init__(self, total):
+    def __init__(self, total, blocks=None):
         ''' Initialize random body object '''
         self.total = int(total)
+        if blocks is None:
+            blocks = get_payload()
+        self.blocks = blocks
 
     def read(self, want=None):
         ''' Read up to @want bytes '''
         if not want:
             want = self.total
-        amt = min(self.total, min(want, RANDOMBLOCKS.blocksiz))
+        amt = min(self.total, min(want, self.blocks.blocksiz))
         if amt:
             self.total -= amt
-            return RANDOMBLOCKS.get_block()[:amt]
+            return self.blocks.get_block()[:amt]
         else:
             return ''
 
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/accept_guard.py '''
+
+#
+# Regress-for: neubot/accept_guard.py
+# Python3-ready: yes
+#
+
+import errno
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot import accept_guard
+
+class FakeSocket(object):
+    ''' A fake accepted socket '''
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        ''' Close the socket '''
+        self.closed = True
+
+class FakeListeningSocket(object):
+    ''' Listening socket returning a scripted sequence of results '''
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    def accept(self):
+        ''' Return the next connection or raise the next error '''
+        if not self.results:
+            raise socket.error(errno.EAGAIN, 'Try again')
+        result = self.results.pop(0)
+        if isinstance(result, int):
+            raise socket.error(result, 'Scripted error')
+        return result, ('127.0.0.1', 54321)
+
+class FakeTask(object):
+    ''' A fake scheduled task '''
+
+    def __init__(self, delta, func, args):
+        self.delta = delta
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        ''' Cancel the task '''
+        self.cancelled = True
+
+class FakePoller(object):
+    ''' Records calls to unset_readable() and sched() '''
+
+    def __init__(self):
+        self.unset = []
+        self.tasks = []
+
+    def unset_readable(self, stream):
+        ''' Unset readable '''
+        self.unset.append(stream)
+
+    def set_readable(self, stream):
+        ''' Set readable '''
+        self.unset.remove(stream)
+
+    def sched(self, delta, func, *args):
+        ''' Schedule a task '''
+        task = FakeTask(delta, func, args)
+        self.tasks.append(task)
+        return task
+
+class TestAcceptGuard(unittest.TestCase):
+    ''' Regression tests for AcceptGuard '''
+
+    def setUp(self):
+        self.guard = accept_guard.AcceptGuard()
+        self.poller = FakePoller()
+        self.accepted = []
+        self.saved_batch = accept_guard.ACCEPT_BATCH
+        for key in accept_guard.STATS:
+            accept_guard.STATS[key] = 0
+
+    def tearDown(self):
+        accept_guard.ACCEPT_BATCH = self.saved_batch
+        if self.guard.spare >= 0:
+            accept_guard.os.close(self.guard.spare)
+
+    def test_batch(self):
+        ''' Make sure we accept all pending connections at once '''
+        lsock = FakeListeningSocket([FakeSocket(), errno.ECONNABORTED,
+                                     FakeSocket(), FakeSocket()])
+        self.guard.accept(self.poller, 'lsn', lsock, self.accepted.append)
+        self.assertEqual(len(self.accepted), 3)
+        self.assertEqual(accept_guard.STATS['accept.accepted'], 3)
+        self.assertEqual(accept_guard.STATS['accept.full_batches'], 0)
+
+    def test_batch_limit(self):
+        ''' Make sure we accept at most ACCEPT_BATCH connections '''
+        accept_guard.set_accept_batch(2)
+        lsock = FakeListeningSocket([FakeSocket() for _ in range(3)])
+        self.guard.accept(self.poller, 'lsn', lsock, self.accepted.append)
+        self.assertEqual(len(self.accepted), 2)
+        self.assertEqual(len(lsock.results), 1)
+        self.assertEqual(accept_guard.STATS['accept.full_batches'], 1)
+
+    def test_emfile(self):
+        ''' Make sure we drop one connection and back off on EMFILE '''
+        self.guard.reserve()
+        spare = self.guard.spare
+        self.assertTrue(spare >= 0)
+        dropped = FakeSocket()
+        lsock = FakeListeningSocket([errno.EMFILE, dropped, FakeSocket()])
+        self.guard.accept(self.poller, 'lsn', lsock, self.accepted.append)
+        self.assertEqual(self.accepted, [])
+        self.assertTrue(dropped.closed)
+        self.assertTrue(self.guard.spare >= 0)
+        self.assertEqual(self.poller.unset, ['lsn'])
+        self.assertEqual(accept_guard.STATS['accept.storms'], 1)
+        self.assertEqual(accept_guard.STATS['accept.drops'], 1)
+
+        task = self.poller.tasks[0]
+        self.assertEqual(task.delta, accept_guard.EMFILE_BACKOFF)
+        self.assertEqual(self.guard.paused, {'lsn': task})
+        task.func(task.args)
+        self.assertEqual(self.poller.unset, [])
+        self.assertEqual(self.guard.paused, {})
+
+    def test_close_while_paused(self):
+        ''' Make sure we don't resume a listener closed meanwhile '''
+        lsock = FakeListeningSocket([errno.EMFILE])
+        self.guard.accept(self.poller, 'lsn', lsock, self.accepted.append)
+        task = self.poller.tasks[0]
+        self.guard.forget('lsn')
+        self.assertTrue(task.cancelled)
+        self.assertEqual(self.guard.paused, {})
+        self.guard.forget('lsn')
+
+    def test_other_errors(self):
+        ''' Make sure we raise unexpected errors '''
+        lsock = FakeListeningSocket([errno.EBADF])
+        self.assertRaises(socket.error, self.guard.accept, self.poller,
+                          'lsn', lsock, self.accepted.append)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -43,6 +43,7 @@ PROPERTIES = (
     'bittorrent.numpieces',
     'bittorrent.piece_len',
     'bittorrent.port',
+    'bittorrent.sample_pieces',
     'bittorrent.watchdog',
 )
 
@@ -326,5 +326,156 @@ class TestOtherMessagesProcessing(unittest.TestCase):
     def got_piece(self, s, i, a, b):
         pass
 
+#
+# Make sure that the discard mode, where the payload of PIECE
+# messages is counted and thrown away as it arrives, dispatches
+# the same messages of the ordinary mode, regardless of how the
+# input is fragmented.
+#
+class TestDiscardPieces(unittest.TestCase):
+
+    def setUp(self):
+        self.numpieces = 1024
+        self.events = []
+        self.types = []
+        wire = []
+        sender = stream.StreamBitTorrent(None)
+        sender.start_send = wire.append
+        for idx in range(64):
+            sender.send_piece(idx, 16384 * (idx % 8),
+                              "A" * random.choice((1, 9, 4096, 20000)))
+            sender.send_have(idx)
+            sender.send_request(idx, 0, 1 << 17)
+            sender.send_keepalive()
+            sender.send_choke()
+        self.wire = "".join(str(octets) for octets in wire)
+
+    def feed(self, discard, amt, sample=0):
+        del self.events[:]
+        del self.types[:]
+        s = stream.StreamBitTorrent(None)
+        s.parent = self
+        s.start_recv = lambda: None
+        s.complete = True
+        s.left = 0
+        s.discard_pieces = discard
+        s.sample_pieces = sample
+        m = self.wire
+        while m:
+            s.recv_complete(m[:amt])
+            m = buffer(m, amt)
+        self.assertEqual((s.left, s.count, s.buff), (0, 0, []))
+        return list(self.events)
+
+    def test_same_messages(self):
+        """Make sure discard mode dispatches the same messages"""
+        expected = self.feed(False, len(self.wire))
+        self.assertEqual(len(expected), 64 * 4)
+        for amt in (1, 7, 9, 13, 4096, len(self.wire)):
+            self.assertEqual(self.feed(True, amt), expected)
+            self.assertEqual(set(self.types), set([int]))
+
+    def test_sample(self):
+        """Make sure one PIECE every N is dispatched as usual"""
+        expected = self.feed(False, len(self.wire))
+        self.assertEqual(self.feed(True, 4096, 4), expected)
+        self.assertEqual(self.types.count(str), 16)
+
+    def test_no_reassembly(self):
+        """Make sure we don't keep the payload of a PIECE"""
+        s = stream.StreamBitTorrent(None)
+        s.parent = self
+        s.complete = True
+        s.left = 0
+        s.discard_pieces = True
+        s.start_recv = lambda: None
+        m = struct.pack("!IcII", 9 + 4096, stream.PIECE, 7, 0) + "A" * 1000
+        s.recv_complete(m)
+        self.assertEqual(s.buff, [])
+        self.assertEqual(s.discarding, (7, 0, 4096))
+        self.assertEqual(s.left, 4096 - 1000)
+
+    def test_out_of_bounds(self):
+        """Make sure we check the index before the payload arrives"""
+        s = stream.StreamBitTorrent(None)
+        s.parent = self
+        s.complete = True
+        s.left = 0
+        s.discard_pieces = True
+        m = struct.pack("!IcII", 9 + 4096, stream.PIECE, self.numpieces, 0)
+        self.assertRaises(RuntimeError, s.recv_complete, m)
+
+    # Peer iface
+    def got_piece(self, s, i, a, b):
+        self.types.append(type(b))
+        if isinstance(b, int):
+            self.events.append(("piece", i, a, b))
+        else:
+            self.events.append(("piece", i, a, len(b)))
+    def got_have(self, i):
+        self.events.append(("have", i))
+    def got_request(self, s, i, a, b):
+        self.events.append(("request", i, a, b))
+    def got_choke(self, s):
+        self.events.append(("choke",))
+
+#
+#  ____                 _
+# / ___|   ___  _ __   __| |  ___  _ __
+# \___ \  / _ \| '_ \ / _` | / _ \| '__|
+#  ___) ||  __/| | | || (_| ||  __/| |
+# |____/  \___||_| |_| \__,_| \___||_|
+#
+# This section contains tests for the code that frames outgoing
+# messages.
+#
+
+#
+# Make sure that the messages packed with their length prefix
+# are the same we would have built with _send_message(), and that
+# the PIECE payload is queued without copying it.
+#
+class TestSendMessages(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = stream.StreamBitTorrent(None)
+        self.stream.start_send = self.start_send
+        self.queued = []
+
+    def start_send(self, octets):
+        self.queued.append(octets)
+
+    def framed(self, message):
+        del self.queued[:]
+        self.stream._send_message(message)
+        return self.queued.pop()
+
+    def test_request(self):
+        """Make sure REQUEST and CANCEL are framed as before"""
+        for t, func in ((stream.REQUEST, self.stream.send_request),
+                        (stream.CANCEL, self.stream.send_cancel)):
+            func(7, 16384, 1 << 17)
+            sent = self.queued.pop()
+            self.assertEqual(sent, self.framed(struct.pack("!cIII", t, 7,
+                                               16384, 1 << 17)))
+
+    def test_have(self):
+        """Make sure HAVE is framed as before"""
+        self.stream.send_have(1023)
+        sent = self.queued.pop()
+        self.assertEqual(sent, self.framed(struct.pack("!cI",
+                                           stream.HAVE, 1023)))
+
+    def test_piece(self):
+        """Make sure PIECE is a header followed by the block itself"""
+        block = memoryview("A" * 65536)[:4096]
+        self.stream.send_piece(3, 8192, block)
+        self.assertEqual(len(self.queued), 2)
+        self.assertEqual(len(self.queued[0]), 13)
+        self.assertTrue(self.queued[1] is block)
+        sent = self.queued[0] + self.queued[1].tobytes()
+        self.assertEqual(sent, self.framed(struct.pack("!cII", stream.PIECE,
+                                           3, 8192) + block.tobytes()))
+
 if __name__ == "__main__":
     unittest.main()
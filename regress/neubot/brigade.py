@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/brigade.py '''
+
+#
+# Regress-for: neubot/brigade.py
+# Python3-ready: yes
+#
+
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.brigade import Brigade
+from neubot import brigade
+from neubot import six
+
+class TestPullup(unittest.TestCase):
+    ''' Regression tests for Brigade.pullup() '''
+
+    def test_not_enough(self):
+        ''' Make sure pullup() returns empty when there's not enough '''
+        context = Brigade()
+        context.bufferise(six.b('abc'))
+        self.assertEqual(context.pullup(4), six.b(''))
+        self.assertEqual(context.total, 3)
+
+    def test_whole_bucket(self):
+        ''' Make sure pullup() of a whole bucket does not copy '''
+        context = Brigade()
+        bucket = six.b('abcdef')
+        context.bufferise(bucket)
+        self.assertTrue(context.pullup(6) is bucket)
+        self.assertEqual(context.total, 0)
+
+    def test_many_buckets(self):
+        ''' Make sure pullup() works across many buckets '''
+        context = Brigade()
+        for octets in (six.b('ab'), memoryview(six.b('cd')), six.b('ef')):
+            context.bufferise(octets)
+        self.assertEqual(context.pullup(3), six.b('abc'))
+        self.assertEqual(context.pullup(1), six.b('d'))
+        self.assertEqual(context.pullup(2), six.b('ef'))
+        self.assertEqual(context.total, 0)
+
+    def test_compact(self):
+        ''' Make sure consumed data is eventually dropped '''
+        context = Brigade()
+        context.bufferise(six.b('A') * brigade.COMPACT)
+        context.bufferise(six.b('B') * brigade.COMPACT)
+        context.skip(brigade.COMPACT + 1)
+        self.assertEqual(context.offset, 0)
+        self.assertEqual(len(context.data), brigade.COMPACT - 1)
+        self.assertEqual(context.pullup(2), six.b('BB'))
+
+class TestSkip(unittest.TestCase):
+    ''' Regression tests for Brigade.skip() '''
+
+    def test_skip(self):
+        ''' Make sure skip() works '''
+        context = Brigade()
+        context.bufferise(six.b('abc'))
+        self.assertEqual(context.skip(2), 0)
+        self.assertEqual(context.pullup(1), six.b('c'))
+
+    def test_partial(self):
+        ''' Make sure skip() consumes what is there and returns the rest '''
+        context = Brigade()
+        context.bufferise(six.b('abc'))
+        self.assertEqual(context.skip(5), 2)
+        self.assertEqual(context.total, 0)
+        self.assertEqual(context.skip(2), 2)
+
+class TestGetline(unittest.TestCase):
+    ''' Regression tests for Brigade.getline() '''
+
+    def test_split_line(self):
+        ''' Make sure getline() works with a line split in many pieces '''
+        context = Brigade()
+        for octet in six.b('HTTP/1.1 200 Ok'):
+            context.bufferise(six.b(chr(octet) if six.PY3 else octet))
+            self.assertEqual(context.getline(1024), six.b(''))
+        self.assertEqual(context.scanned, 15)
+        context.bufferise(six.b('\r\nContent-Length: 0\r\n'))
+        self.assertEqual(context.getline(1024), six.b('HTTP/1.1 200 Ok\r\n'))
+        self.assertEqual(context.getline(1024),
+                         six.b('Content-Length: 0\r\n'))
+        self.assertEqual(context.getline(1024), six.b(''))
+
+    def test_too_long(self):
+        ''' Make sure getline() raises if the line is too long '''
+        context = Brigade()
+        context.bufferise(six.b('A') * 8)
+        self.assertRaises(RuntimeError, context.getline, 8)
+
+    def test_maxline(self):
+        ''' Make sure getline() works when line length is maxline '''
+        context = Brigade()
+        context.bufferise(six.b('AAA\n'))
+        self.assertEqual(context.getline(4), six.b('AAA\n'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/http/assets.py '''
+
+#
+# Regress-for: neubot/http/assets.py
+#
+
+import gzip
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.http import assets
+from neubot.http.message import Message
+from neubot.http.server import ServerHTTP
+
+PAGE = '<html><!--#include virtual="/header.html"-->%s</html>'
+
+def _write(path, data):
+    ''' Write data into path and make sure the mtime changes '''
+    filep = open(path, 'wb')
+    filep.write(data)
+    filep.close()
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+
+class Stream(object):
+    ''' Records the responses sent by the server '''
+
+    def __init__(self):
+        self.responses = []
+
+    def send_response(self, request, response):
+        ''' Record the response '''
+        self.responses.append(response)
+
+class TestAssetCache(unittest.TestCase):
+    ''' Regression tests for the asset cache '''
+
+    def setUp(self):
+        self.rootdir = os.path.realpath(tempfile.mkdtemp())
+        self.index = os.path.join(self.rootdir, 'index.html')
+        self.header = os.path.join(self.rootdir, 'header.html')
+        _write(self.index, PAGE % ('x' * 1024))
+        _write(self.header, '<h1>Neubot</h1>')
+        self.server = ServerHTTP(None)
+        self.server.conf = {
+            'http.server.rootdir': self.rootdir,
+            'http.server.ssi': True,
+        }
+        self.interval = assets.CHECK_INTERVAL
+
+    def tearDown(self):
+        assets.CHECK_INTERVAL = self.interval
+        shutil.rmtree(self.rootdir)
+
+    def _get(self, uri, **headers):
+        ''' Process a GET for uri and return the response '''
+        request = Message(method=headers.pop('method', 'GET'), uri=uri,
+                          protocol='HTTP/1.1')
+        for key, value in headers.items():
+            request[key.replace('_', '-')] = value
+        stream = Stream()
+        self.server.process_request(stream, request)
+        return stream.responses[0]
+
+    def test_ssi(self):
+        ''' Make sure the page is served with includes expanded '''
+        response = self._get('/index.html')
+        self.assertEqual(response.code, '200')
+        self.assertEqual(response['content-type'],
+                         'text/html; charset=UTF-8')
+        self.assertEqual(response.body,
+                         '<html><h1>Neubot</h1>%s</html>' % ('x' * 1024))
+        self.assertEqual(response['vary'], 'Accept-Encoding')
+        self.assertTrue(response['etag'].startswith('"'))
+
+    def test_memory(self):
+        ''' Make sure a cached page does not touch the disk '''
+        first = self._get('/index.html')
+        os.unlink(self.index)
+        second = self._get('/index.html')
+        self.assertEqual(second.code, '200')
+        self.assertEqual(first.body, second.body)
+
+    def test_invalidate(self):
+        ''' Make sure we notice that a page or an include changed '''
+        assets.CHECK_INTERVAL = 0
+        first = self._get('/index.html')
+        _write(self.header, '<h1>Changed</h1>')
+        second = self._get('/index.html')
+        self.assertTrue('Changed' in second.body)
+        self.assertNotEqual(first['etag'], second['etag'])
+        os.unlink(self.index)
+        self.assertEqual(self._get('/index.html').code, '404')
+        self.assertEqual(self.server.assets.assets, {})
+        self.assertEqual(self.server.assets.total, 0)
+
+    def test_not_modified(self):
+        ''' Make sure If-None-Match yields 304 without body '''
+        etag = self._get('/index.html')['etag']
+        response = self._get('/index.html', if_none_match='"x", ' + etag)
+        self.assertEqual(response.code, '304')
+        self.assertEqual(response['etag'], etag)
+        self.assertEqual(response['content-length'], '')
+        self.assertEqual(response.length, 0)
+        response = self._get('/index.html', if_none_match='"x"')
+        self.assertEqual(response.code, '200')
+
+    def test_gzip(self):
+        ''' Make sure we serve the gzip variant when accepted '''
+        plain = self._get('/index.html')
+        response = self._get('/index.html', accept_encoding='gzip, deflate')
+        self.assertEqual(response['content-encoding'], 'gzip')
+        self.assertNotEqual(response['etag'], plain['etag'])
+        self.assertTrue(response.length < plain.length)
+        gzipfp = gzip.GzipFile(fileobj=StringIO.StringIO(response.body))
+        self.assertEqual(gzipfp.read(), plain.body)
+        response = self._get('/index.html', accept_encoding='gzip',
+                             if_none_match=response['etag'])
+        self.assertEqual(response.code, '304')
+        response = self._get('/index.html', accept_encoding='gzip;q=0')
+        self.assertEqual(response['content-encoding'], '')
+
+    def test_small(self):
+        ''' Make sure small bodies are not compressed '''
+        response = self._get('/header.html', accept_encoding='gzip')
+        self.assertEqual(response['content-encoding'], '')
+        self.assertEqual(response['vary'], '')
+
+    def test_head(self):
+        ''' Make sure HEAD has the length but not the body '''
+        response = self._get('/index.html', method='HEAD')
+        self.assertEqual(response['content-length'],
+                         str(len(self._get('/index.html').body)))
+        self.assertEqual(response.serialize_body(), '')
+
+    def test_large(self):
+        ''' Make sure large files are served from disk '''
+        _write(self.index, 'x' * (assets.MAXSIZE + 1))
+        response = self._get('/index.html')
+        self.assertEqual(response.length, assets.MAXSIZE + 1)
+        self.assertEqual(response['etag'], '')
+        self.assertEqual(self.server.assets.assets, {})
+
+    def test_not_found(self):
+        ''' Make sure missing files yield 404 '''
+        self.assertEqual(self._get('/nonexistent.html').code, '404')
+
+class TestHeaders(unittest.TestCase):
+    ''' Regression tests for header parsing '''
+
+    def test_accepts_gzip(self):
+        ''' Make sure we parse Accept-Encoding correctly '''
+        self.assertTrue(assets.accepts_gzip('gzip'))
+        self.assertTrue(assets.accepts_gzip('deflate, GZIP;q=0.5'))
+        self.assertFalse(assets.accepts_gzip(''))
+        self.assertFalse(assets.accepts_gzip('deflate'))
+        self.assertFalse(assets.accepts_gzip('gzip; q=0'))
+
+    def test_etag_matches(self):
+        ''' Make sure we parse If-None-Match correctly '''
+        self.assertTrue(assets.etag_matches('"a"', '"a"'))
+        self.assertTrue(assets.etag_matches('W/"a"', '"a"'))
+        self.assertTrue(assets.etag_matches('*', '"a"'))
+        self.assertTrue(assets.etag_matches('"b", "a"', '"a"'))
+        self.assertFalse(assets.etag_matches('', '"a"'))
+        self.assertFalse(assets.etag_matches('"b"', '"a"'))
+
+if __name__ == '__main__':
+    unittest.main()
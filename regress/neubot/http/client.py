@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/http/client.py '''
+
+#
+# Regress-for: neubot/http/client.py
+#
+
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.http.client import ClientHTTP
+from neubot.net.poller import POLLER
+
+class FakeStream(object):
+    ''' Fake idle stream taken from the pool '''
+
+    def __init__(self, rtt):
+        self.close_complete = False
+        self.parent = None
+        self.rtt = rtt
+
+class RecordingClient(ClientHTTP):
+    ''' Records the streams passed to connection_ready() '''
+
+    def __init__(self):
+        ClientHTTP.__init__(self, POLLER)
+        self.ready = []
+
+    def connection_ready(self, stream):
+        self.ready.append(stream)
+
+class TestReuseStream(unittest.TestCase):
+    ''' Regression tests for ClientHTTP._reuse_stream() '''
+
+    def test_rtt(self):
+        ''' Make sure a reused stream reports its original RTT '''
+        client = RecordingClient()
+        stream = FakeStream(0.25)
+        client._reuse_stream((stream, ('127.0.0.1', 8080)))
+        self.assertEqual(client.ready, [stream])
+        self.assertEqual(stream.parent, client)
+        self.assertEqual(client.rtts, [0.25])
+        self.assertEqual(client.rtt, 0.25)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/http/message.py '''
+
+#
+# Regress-for: neubot/http/message.py
+#
+
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.http import message
+
+class TestHeaders(unittest.TestCase):
+    ''' Regression tests for the header store '''
+
+    def test_missing(self):
+        ''' Make sure reading a missing header does not add it '''
+        msg = message.Message()
+        self.assertEqual(msg['connection'], '')
+        self.assertEqual(msg.headers, {})
+
+    def test_merge(self):
+        ''' Make sure repeated headers are merged '''
+        msg = message.Message()
+        msg['Accept'] = 'text/plain'
+        msg['accept'] = 'text/html'
+        self.assertEqual(msg['ACCEPT'], 'text/plain, text/html')
+
+    def test_capitalize(self):
+        ''' Make sure header names are capitalized on the wire '''
+        msg = message.Message(code='200', reason='Ok', protocol='HTTP/1.1')
+        msg['content-length'] = '0'
+        self.assertEqual(msg.serialize_headers().read(),
+                         'HTTP/1.1 200 Ok\r\nContent-Length: 0\r\n\r\n')
+
+class TestResponseTemplate(unittest.TestCase):
+    ''' Regression tests for ResponseTemplate '''
+
+    def test_same_as_compose(self):
+        ''' Make sure the template serializes like compose() '''
+        template = message.ResponseTemplate(code='200', reason='Ok',
+                                            body='hello')
+        response = template.response()
+        expected = message.Message()
+        expected.compose(code='200', reason='Ok', body='hello')
+        del expected['date']
+        headers = response.headers.copy()
+        del headers['date']
+        self.assertEqual(headers, expected.headers)
+        self.assertEqual(response.serialize_headers_string(),
+                         template.message.serialize_headers_string())
+        self.assertEqual(response.serialize_body(), 'hello')
+        self.assertEqual(response.length, 5)
+
+    def test_cached(self):
+        ''' Make sure we serialize once per second '''
+        template = message.ResponseTemplate(code='200', reason='Ok')
+        first = template.response()
+        second = template.response()
+        if first['date'] == second['date']:
+            self.assertTrue(first.serialized is second.serialized)
+        self.assertFalse(first is second)
+
+    def test_modified(self):
+        ''' Make sure modified responses are serialized again '''
+        template = message.ResponseTemplate(code='200', reason='Ok')
+        response = template.response()
+        response['connection'] = 'close'
+        self.assertTrue('Connection: close\r\n' in
+                        response.serialize_headers_string())
+        self.assertFalse('Connection' in
+                         template.response().serialize_headers_string())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/http/stream.py '''
+
+#
+# Regress-for: neubot/http/stream.py
+#
+
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.http import stream
+
+REQUEST = ('GET /speedtest/latency HTTP/1.1\r\n'
+           'Host: 127.0.0.1:8080\r\n'
+           'X-Custom:  value  \r\n'
+           '\r\n')
+
+UPLOAD = ('POST /speedtest/upload HTTP/1.1\r\n'
+          'Content-Length: 5\r\n'
+          '\r\n'
+          'hello')
+
+CHUNKED = ('HTTP/1.1 200 Ok\r\n'
+           'Transfer-Encoding: chunked\r\n'
+           '\r\n'
+           '5\r\nhello\r\n'
+           '6\r\n world\r\n'
+           '0\r\n'
+           'X-Trailer: ignored\r\n'
+           '\r\n')
+
+class Recorder(stream.StreamHTTP):
+    ''' Records the events generated by the receiver '''
+
+    def __init__(self):
+        stream.StreamHTTP.__init__(self, None)
+        self.events = []
+        self.message = {}
+        self.closed = False
+
+    def start_recv(self):
+        pass
+
+    def close(self):
+        self.closed = True
+        self.close_pending = True
+
+    def got_request_line(self, method, uri, protocol):
+        self.events.append(('request', method, uri, protocol))
+        self.message = {}
+
+    def got_response_line(self, protocol, code, reason):
+        self.events.append(('response', protocol, code, reason))
+        self.message = {}
+
+    def got_header(self, key, value):
+        self.events.append(('header', key, value))
+        self.message[key] = value
+
+    def got_end_of_headers(self):
+        if self.message.get('x-custom') == 'reject':
+            return stream.ERROR, 0
+        if self.message.get('transfer-encoding') == 'chunked':
+            return stream.CHUNK_LENGTH, 0
+        if 'content-length' in self.message:
+            return stream.BOUNDED, int(self.message['content-length'])
+        return stream.FIRSTLINE, 0
+
+    def got_piece(self, piece):
+        self.assertIsView(piece)
+        if self.events[-1][0] == 'body':
+            self.events[-1] = ('body', self.events[-1][1] + str(piece))
+        else:
+            self.events.append(('body', str(piece)))
+
+    @staticmethod
+    def assertIsView(piece):
+        ''' Make sure pieces are not copies '''
+        if not isinstance(piece, buffer):
+            raise AssertionError('piece is not a buffer')
+
+    def got_end_of_body(self):
+        self.events.append(('end',))
+
+def _feed(data, sizes):
+    ''' Feed data to a new Recorder in pieces of the given sizes '''
+    recorder = Recorder()
+    offset = 0
+    for size in sizes:
+        recorder.recv_complete(data[offset:offset + size])
+        offset += size
+    if offset < len(data):
+        recorder.recv_complete(data[offset:])
+    return recorder
+
+class TestRecvComplete(unittest.TestCase):
+    ''' Regression tests for StreamHTTP.recv_complete() '''
+
+    def test_request(self):
+        ''' Make sure we parse a request without body '''
+        recorder = _feed(REQUEST, [])
+        self.assertEqual(recorder.events, [
+            ('request', 'GET', '/speedtest/latency', 'HTTP/1.1'),
+            ('header', 'host', '127.0.0.1:8080'),
+            ('header', 'x-custom', 'value'),
+            ('end',),
+        ])
+        self.assertEqual(recorder.incoming, '')
+
+    def test_interned(self):
+        ''' Make sure common header names are interned '''
+        recorder = _feed(REQUEST, [])
+        self.assertTrue(recorder.events[1][1] is 'host')
+
+    def test_pipelined(self):
+        ''' Make sure we parse many messages in a single fragment '''
+        recorder = _feed(REQUEST + UPLOAD + REQUEST, [])
+        self.assertEqual([event[0] for event in recorder.events], [
+            'request', 'header', 'header', 'end',
+            'request', 'header', 'body', 'end',
+            'request', 'header', 'header', 'end',
+        ])
+        self.assertTrue(('body', 'hello') in recorder.events)
+
+    def test_fragmented(self):
+        ''' Make sure the result does not depend on fragmentation '''
+        data = REQUEST + UPLOAD + CHUNKED.replace('HTTP/1.1 200 Ok',
+                                                  'PUT /x HTTP/1.1')
+        expected = _feed(data, []).events
+        for index in range(1, len(data)):
+            self.assertEqual(_feed(data, [index]).events, expected)
+        self.assertEqual(_feed(data, [1] * len(data)).events, expected)
+
+    def test_chunked(self):
+        ''' Make sure we parse a chunked response '''
+        recorder = _feed(CHUNKED, [])
+        self.assertEqual(recorder.events, [
+            ('response', 'HTTP/1.1', '200', 'Ok'),
+            ('header', 'transfer-encoding', 'chunked'),
+            ('body', 'hello world'),
+            ('end',),
+        ])
+
+    def test_bare_lf(self):
+        ''' Make sure we accept lines terminated by LF only '''
+        recorder = _feed(REQUEST.replace('\r\n', '\n'), [])
+        self.assertEqual(recorder.events, _feed(REQUEST, []).events)
+
+    def test_error(self):
+        ''' Make sure we close when upstream rejects the headers '''
+        recorder = _feed(REQUEST.replace('value', 'reject') + REQUEST, [])
+        self.assertTrue(recorder.closed)
+        self.assertEqual(recorder.events[-1], ('header', 'x-custom',
+                                               'reject'))
+
+    def test_invalid(self):
+        ''' Make sure we raise on invalid input '''
+        self.assertRaises(RuntimeError, _feed, 'GET /\r\n\r\n', [])
+        self.assertRaises(RuntimeError, _feed,
+                          'GET / HTTP/1.1\r\nHost\r\n\r\n', [])
+        self.assertRaises(RuntimeError, _feed, 'GET / HTTP/2.0\r\n\r\n', [])
+
+    def test_too_long(self):
+        ''' Make sure we don't buffer headers forever '''
+        data = 'GET / HTTP/1.1\r\n' + 'X: y\r\n' * stream.MAXHEADERS
+        self.assertRaises(RuntimeError, _feed, data, [])
+
+class SinkRecorder(Recorder):
+    ''' Like Recorder but selects the sink mode for bodies '''
+
+    def got_end_of_headers(self):
+        self.sink_body()
+        return Recorder.got_end_of_headers(self)
+
+def _sink(data, sizes):
+    ''' Like _feed() but uses a SinkRecorder '''
+    recorder = SinkRecorder()
+    offset = 0
+    for size in sizes:
+        recorder.recv_complete(data[offset:offset + size])
+        offset += size
+    if offset < len(data):
+        recorder.recv_complete(data[offset:])
+    return recorder
+
+class TestSinkBody(unittest.TestCase):
+    ''' Regression tests for StreamHTTP.sink_body() '''
+
+    def test_bounded(self):
+        ''' Make sure we count the body without pieces '''
+        recorder = _sink(UPLOAD, [len(UPLOAD) - 3])
+        self.assertEqual(recorder.events, [
+            ('request', 'POST', '/speedtest/upload', 'HTTP/1.1'),
+            ('header', 'content-length', '5'),
+            ('end',),
+        ])
+        self.assertEqual(recorder.sink_bytes, 5)
+        self.assertTrue(0 < recorder.sink_first <= recorder.sink_last)
+
+    def test_chunked(self):
+        ''' Make sure we count the chunks of a chunked body '''
+        recorder = _sink(CHUNKED, [1] * len(CHUNKED))
+        self.assertEqual(recorder.events, [
+            ('response', 'HTTP/1.1', '200', 'Ok'),
+            ('header', 'transfer-encoding', 'chunked'),
+            ('end',),
+        ])
+        self.assertEqual(recorder.sink_bytes, 11)
+
+    def test_same_events(self):
+        ''' Make sure sink mode only drops the body events '''
+        data = REQUEST + UPLOAD + CHUNKED.replace('HTTP/1.1 200 Ok',
+                                                  'PUT /x HTTP/1.1')
+        expected = [event for event in _feed(data, []).events
+                    if event[0] != 'body']
+        for index in range(1, len(data)):
+            recorder = _sink(data, [index])
+            self.assertEqual(recorder.events, expected)
+            self.assertEqual(recorder.sink_bytes, 11)
+            self.assertEqual(recorder.incoming, '')
+
+    def test_reset(self):
+        ''' Make sure the counters are reset by the next message '''
+        recorder = _sink(UPLOAD + REQUEST, [])
+        self.assertEqual(recorder.sink_bytes, 0)
+        self.assertEqual(recorder.sink_first, 0.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/http_pool.py '''
+
+#
+# Regress-for: neubot/http_pool.py
+# Python3-ready: yes
+#
+
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.pollable import WATCHDOG
+from neubot import http_pool
+
+class FakeStream(object):
+    ''' Fake stream wrapping one end of a socketpair '''
+
+    def __init__(self):
+        self.sock, self.peer = socket.socketpair()
+        self.timeout = WATCHDOG
+        self.closed = False
+
+    def fileno(self):
+        ''' Return the socket file descriptor '''
+        return self.sock.fileno()
+
+    def set_timeout(self, timeo):
+        ''' Record the timeout '''
+        self.timeout = timeo
+
+    def close(self):
+        ''' Close both ends '''
+        self.closed = True
+        self.sock.close()
+        self.peer.close()
+
+class TestConnectionPool(unittest.TestCase):
+    ''' Regression tests for ConnectionPool '''
+
+    def setUp(self):
+        self.pool = http_pool.ConnectionPool()
+        self.streams = []
+
+    def tearDown(self):
+        for stream in self.streams:
+            if not stream.closed:
+                stream.close()
+
+    def _stream(self):
+        ''' Create a new fake stream '''
+        stream = FakeStream()
+        self.streams.append(stream)
+        return stream
+
+    def test_put_get(self):
+        ''' Make sure get() returns the most recently parked stream '''
+        first, second = self._stream(), self._stream()
+        self.assertTrue(self.pool.put('key', first))
+        self.assertTrue(self.pool.put('key', second))
+        self.assertEqual(first.timeout, http_pool.IDLE_TIMEOUT)
+        self.assertEqual(self.pool.get('key'), second)
+        self.assertEqual(second.timeout, WATCHDOG)
+        self.assertEqual(self.pool.get('key'), first)
+        self.assertEqual(self.pool.get('key'), None)
+        self.assertEqual(self.pool.idle, {})
+        self.assertEqual(self.pool.stats['http_pool.hits'], 2)
+        self.assertEqual(self.pool.stats['http_pool.misses'], 1)
+
+    def test_keys(self):
+        ''' Make sure streams are not shared across keys '''
+        self.pool.put('key', self._stream())
+        self.assertEqual(self.pool.get('other'), None)
+
+    def test_maxidle(self):
+        ''' Make sure put() fails when the pool is full '''
+        for _ in range(http_pool.MAXIDLE):
+            self.assertTrue(self.pool.put('key', self._stream()))
+        self.assertFalse(self.pool.put('key', self._stream()))
+
+    def test_stale(self):
+        ''' Make sure get() closes streams closed by peer '''
+        stream = self._stream()
+        self.pool.put('key', stream)
+        stream.peer.close()
+        self.assertEqual(self.pool.get('key'), None)
+        self.assertTrue(stream.closed)
+        self.assertEqual(self.pool.idle, {})
+
+    def test_discard(self):
+        ''' Make sure discard() forgets about closed streams '''
+        stream = self._stream()
+        self.pool.put('key', stream)
+        self.pool.discard(stream)
+        self.pool.discard(stream)
+        self.assertEqual(self.pool.idle, {})
+        self.assertEqual(self.pool.keys, {})
+        self.assertEqual(self.pool.get('key'), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,13 +30,108 @@
 
 import logging
 import sys
+import unittest
 
 if __name__ == "__main__":
     sys.path.insert(0, ".")
 
 from neubot.log import LOG, oops
+from neubot.log import StreamingLogger
 from neubot import compat
 
+class FakeStream(object):
+    ''' Fake stream that pauses its producer like net/stream.py '''
+
+    high_water = 64
+    low_water = 16
+
+    def __init__(self):
+        self.producer = None
+        self.atclosev = set()
+        self.lines = []
+        self.paused = False
+        self.closed = False
+
+    @staticmethod
+    def fileno():
+        ''' Not a real socket '''
+        return -1
+
+    def set_producer(self, producer):
+        ''' Set the producer '''
+        self.producer = producer
+
+    def atclose(self, func):
+        ''' Register close hook '''
+        self.atclosev.add(func)
+
+    def start_send(self, octets):
+        ''' Queue octets and pause the producer above high water '''
+        self.lines.append(octets)
+        if not self.paused and self.buffered() > self.high_water:
+            self.paused = True
+            self.producer.pause_writing(self)
+
+    def buffered(self):
+        ''' Number of queued bytes '''
+        return sum(len(line) for line in self.lines)
+
+    def drain(self):
+        ''' Send all queued lines and resume the producer '''
+        lines, self.lines = self.lines, []
+        if self.paused:
+            self.paused = False
+            self.producer.resume_writing(self)
+        return lines
+
+    def handle_close(self):
+        ''' Invoke close hooks '''
+        self.closed = True
+        for func in self.atclosev:
+            func(self, None)
+
+class TestStreamingLogger(unittest.TestCase):
+    ''' Regression tests for StreamingLogger '''
+
+    def test_slow_reader(self):
+        ''' Make sure lines are dropped, not queued, for slow readers '''
+        logger = StreamingLogger()
+        stream = FakeStream()
+        logger.start_streaming(stream)
+        for index in range(16):
+            logger.log("INFO", "line %d", (index,), None)
+        queued = len(stream.lines)
+        self.assertTrue(stream.paused)
+        self.assertTrue(queued < 16)
+        self.assertEqual(logger.dropped[stream], 16 - queued)
+
+        self.assertEqual(len(stream.drain()), queued)
+        self.assertEqual(stream.lines, [
+            "WARNING log: %d lines dropped (slow reader)\r\n" %
+            (16 - queued)])
+        self.assertEqual(logger.dropped, {})
+
+        logger.log("INFO", "line 16", None, None)
+        self.assertEqual(stream.drain(), [
+            "WARNING log: %d lines dropped (slow reader)\r\n" %
+            (16 - queued), "INFO line 16\r\n"])
+
+    def test_close(self):
+        ''' Make sure closed streams are detached '''
+        logger = StreamingLogger()
+        first, second = FakeStream(), FakeStream()
+        logger.start_streaming(first)
+        logger.start_streaming(second)
+        for index in range(16):
+            logger.log("INFO", "line %d", (index,), None)
+        first.handle_close()
+        self.assertEqual(logger.streams, set([second]))
+        self.assertFalse(first in logger.dropped)
+        logger.stop_streaming()
+        self.assertTrue(second.closed)
+        self.assertEqual(logger.streams, set())
+        self.assertEqual(logger.dropped, {})
+
 if __name__ == "__main__":
 
     logging.info("INFO w/ logging.info")
@@ -67,3 +162,5 @@ if __name__ == "__main__":
     logging.debug("DEBUG w/ logging.debug")
     logging.warning("WARNING w/ logging.warning")
     logging.error("ERROR w/ logging.error")
+
+    unittest.main()
@@ -22,8 +22,10 @@
 
 import StringIO
 import random
+import socket
 import struct
 import sys
+import tempfile
 import unittest
 
 if __name__ == "__main__":
@@ -31,6 +33,9 @@ if __name__ == "__main__":
 
 from neubot.config import CONFIG
 from neubot.net import stream
+from neubot import log
+from neubot import poller
+from neubot import utils_net
 
 #
 # Provide the bare minimum needed to look
@@ -469,5 +474,351 @@ class TestStreamSend_ReandSendQueue_NotEmpty(unittest.TestCase):
     def set_writable(self, stream):
         pass
 
+class TestStreamSend_Vectored(unittest.TestCase):
+
+    """Make sure queued strings are written with a single sosendv()"""
+
+    def setUp(self):
+        self.stream = stream.Stream(self)
+        self.stream.sock = self
+        self.calls = []
+        self.complete = 0
+        self.stream.send_complete = self._send_complete
+
+    def _send_complete(self):
+        self.complete += 1
+
+    def sosendv(self, buffers):
+        self.calls.append([stream._tobytes(octets) for octets in buffers])
+        return stream.SUCCESS, self.budget
+
+    def sosend(self, octets):
+        self.calls.append([stream._tobytes(octets)])
+        return stream.SUCCESS, min(self.budget, len(octets))
+
+    def test_gather(self):
+        """Make sure one sosendv() writes the whole queue"""
+        for octets in ("abc", "def", "ghi"):
+            self.stream.start_send(octets)
+        self.budget = 9
+        self.stream.handle_write()
+        self.assertEqual(self.calls, [["abc", "def", "ghi"]])
+        self.assertEqual(self.complete, 1)
+        self.assertFalse(self.stream.send_pending)
+
+    def test_partial(self):
+        """Make sure partial writes advance through the queue"""
+        self.stream.send_pending = True
+        self.stream.send_octets = "abc"
+        self.stream.send_queue.extend(["def", "ghi"])
+        self.budget = 4
+        self.stream.handle_write()
+        self.assertTrue(isinstance(self.stream.send_octets, memoryview))
+        self.assertEqual(self.stream.send_octets.tobytes(), "ef")
+        self.assertEqual(list(self.stream.send_queue), ["ghi"])
+        self.budget = 1
+        self.stream.handle_write()
+        self.assertEqual(self.stream.send_octets.tobytes(), "f")
+        self.budget = 4
+        self.stream.handle_write()
+        self.assertEqual(self.calls, [["abc", "def", "ghi"],
+                                      ["ef", "ghi"], ["f", "ghi"]])
+        self.assertEqual(self.complete, 1)
+        self.assertEqual(self.stream.bytes_sent_tot, 9)
+
+    def test_stop_at_filelike(self):
+        """Make sure we don't gather past a file-like"""
+        self.stream.send_pending = True
+        self.stream.send_octets = "abc"
+        self.stream.send_queue.extend(["def", StringIO.StringIO("ghi")])
+        self.budget = 6
+        self.stream.handle_write()
+        self.assertEqual(self.calls, [["abc", "def"]])
+        self.assertEqual(self.stream.send_octets, "ghi")
+
+    def test_ssl_no_gather(self):
+        """Make sure we use sosend() when sosendv() is missing"""
+        self.stream.sock = _SockNoVector(self)
+        self.stream.send_pending = True
+        self.stream.send_octets = "abc"
+        self.stream.send_queue.append("def")
+        self.budget = 3
+        self.stream.handle_write()
+        self.assertEqual(self.calls, [["abc"]])
+        self.assertEqual(self.stream.send_octets, "def")
+
+    def test_too_much(self):
+        """Make sure we raise if the socket claims too much"""
+        self.stream.send_octets = "abc"
+        self.stream.send_queue.append("def")
+        self.budget = 7
+        self.assertRaises(RuntimeError, self.stream.handle_write)
+
+    def test_readv(self):
+        """Make sure the vector of a readv() file-like is gathered"""
+        self.stream.start_send(_Vectors([["4\r\n", memoryview("abcd")],
+                                         ["\r\n0\r\n\r\n"]]))
+        self.assertEqual(self.stream.send_octets, "4\r\n")
+        self.assertEqual(self.stream.send_queued, 4)
+        self.budget = 7
+        self.stream.handle_write()
+        self.budget = 9
+        self.stream.handle_write()
+        self.assertEqual(self.calls, [["4\r\n", "abcd"],
+                                      ["\r\n0\r\n\r\n"]])
+        self.assertEqual(self.complete, 1)
+        self.assertEqual(self.stream.send_queued, 0)
+
+    def test_large_piece(self):
+        """Make sure a large piece is sent along with its header"""
+        self.stream.send_pending = True
+        self.stream.send_octets = "40000\r\n"
+        payload = memoryview("A" * stream.MAXBUF)
+        self.stream.send_queue.extend([payload, "\r\n"])
+        self.budget = 7
+        self.stream.handle_write()
+        self.assertEqual(self.calls, [["40000\r\n", payload.tobytes()]])
+        self.assertTrue(self.stream.send_octets is payload)
+
+    def set_writable(self, stream):
+        pass
+
+    def unset_writable(self, stream):
+        pass
+
+class _Vectors(object):
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def readv(self, count):
+        if not self.vectors:
+            return []
+        return self.vectors.pop(0)
+
+class TestSocketWrapper_Sosendv(unittest.TestCase):
+
+    """Make sure the sosendv() fallback does not copy large buffers"""
+
+    def setUp(self):
+        self.calls = []
+        self.wrapper = stream.SocketWrapper(self)
+        self.saved = stream.HAVE_SENDMSG
+        stream.HAVE_SENDMSG = False
+
+    def tearDown(self):
+        stream.HAVE_SENDMSG = self.saved
+
+    def send(self, octets, flags=0):
+        self.calls.append((octets, flags))
+        return len(octets)
+
+    def test_join_small(self):
+        """Make sure small buffers are joined"""
+        status, count = self.wrapper.sosendv(["abc", memoryview("def")])
+        self.assertEqual((status, count), (stream.SUCCESS, 6))
+        self.assertEqual(self.calls, [("abcdef", 0)])
+
+    def test_large(self):
+        """Make sure large buffers are sent without joining them"""
+        payload = memoryview("A" * stream.MAXJOIN)
+        self.wrapper.sosendv(["4000\r\n", payload])
+        self.assertEqual(self.calls, [("4000\r\n", stream.MSG_MORE)])
+        del self.calls[:]
+        self.wrapper.sosendv([payload, "\r\n"])
+        self.assertTrue(self.calls[0][0] is payload)
+
+class _SockNoVector(object):
+    def __init__(self, test):
+        self.sosend = test.sosend
+
+class TestStreamSend_Sendfile(unittest.TestCase):
+
+    """Make sure regular files are sent with sendfile()"""
+
+    def setUp(self):
+        lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        lsock.bind(("127.0.0.1", 0))
+        lsock.listen(1)
+        self.client = socket.create_connection(lsock.getsockname())
+        self.server = lsock.accept()[0]
+        lsock.close()
+        self.filep = tempfile.TemporaryFile()
+        self.filep.write("A" * 1000 + "B" * 1000)
+        self.filep.seek(1000)
+        self.stream = stream.Stream(self)
+        self.stream.sock = stream.SocketWrapper(self.server)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        self.filep.close()
+
+    def test_sendfile(self):
+        """Make sure sendfile() starts from the file position"""
+        if not stream.SENDFILE:
+            return
+        self.stream.start_send("head")
+        self.stream.start_send(self.filep)
+        self.stream.start_send("tail")
+        while self.stream.send_pending:
+            self.stream.handle_write()
+        received = []
+        while sum(len(octets) for octets in received) < 1008:
+            received.append(self.client.recv(4096))
+        self.assertEqual("".join(received), "head" + "B" * 1000 + "tail")
+        self.assertEqual(self.stream.bytes_sent_tot, 1008)
+
+    def test_ssl_no_sendfile(self):
+        """Make sure we don't use sendfile() without sosendfile()"""
+        self.stream.sock = object()
+        self.assertFalse(self.stream._can_sendfile(self.filep))
+
+    def test_stringio_no_sendfile(self):
+        """Make sure we don't use sendfile() for a StringIO"""
+        self.assertFalse(self.stream._can_sendfile(StringIO.StringIO("")))
+
+    def set_writable(self, stream):
+        pass
+
+    def unset_writable(self, stream):
+        pass
+
+class TestStreamSend_Watermarks(unittest.TestCase):
+
+    """Make sure producers are paused and resumed"""
+
+    def setUp(self):
+        self.stream = stream.Stream(self)
+        self.stream.sock = self
+        self.stream.high_water = 8
+        self.stream.low_water = 4
+        self.stream.set_producer(self)
+        self.events = []
+        self.budget = 0
+
+    def sosendv(self, buffers):
+        return stream.SUCCESS, self.budget
+
+    def sosend(self, octets):
+        return stream.SUCCESS, min(self.budget, len(octets))
+
+    def pause_writing(self, stream):
+        self.events.append("pause")
+
+    def resume_writing(self, stream):
+        self.events.append("resume")
+
+    def test_pause_resume(self):
+        """Make sure we pause above high and resume below low"""
+        for octets in ("abc", "def", "ghi", "jkl"):
+            self.stream.start_send(octets)
+        self.assertEqual(self.events, ["pause"])
+        self.assertEqual(self.stream.send_buffered(), 12)
+        self.budget = 5
+        self.stream.handle_write()
+        self.assertEqual(self.stream.send_buffered(), 7)
+        self.assertEqual(self.events, ["pause"])
+        self.budget = 3
+        self.stream.handle_write()
+        self.assertEqual(self.stream.send_buffered(), 4)
+        self.assertEqual(self.events, ["pause", "resume"])
+        self.budget = 4
+        self.stream.handle_write()
+        self.assertEqual(self.stream.send_buffered(), 0)
+        self.assertEqual(self.stream.send_queued, 0)
+        self.assertEqual(self.events, ["pause", "resume"])
+
+    def test_filelike(self):
+        """Make sure file-likes don't count"""
+        self.stream.start_send(StringIO.StringIO("A" * 1024))
+        self.assertEqual(self.events, [])
+
+    def test_streaming_logger(self):
+        """Make sure the streaming logger drops lines for slow readers"""
+        logger = log.StreamingLogger()
+        logger.start_streaming(self.stream)
+        self.stream.high_water = 48
+        for _ in range(4):
+            logger.log("INFO", "0123456789", None, None)
+        self.assertEqual(logger.dropped, {self.stream: 1})
+        self.budget = 51
+        self.stream.handle_write()
+        self.assertEqual(logger.dropped, {})
+        self.assertEqual(self.stream.send_octets,
+                         "WARNING log: 1 lines dropped (slow reader)\r\n")
+
+    def set_writable(self, stream):
+        pass
+
+    def unset_writable(self, stream):
+        pass
+
+class TestStreamHandler_Connect(unittest.TestCase):
+
+    """Make sure connections are established in parallel"""
+
+    def setUp(self):
+        self.lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.lsock.bind(("127.0.0.1", 0))
+        self.lsock.listen(16)
+        self.port = self.lsock.getsockname()[1]
+        self.poller = poller.Poller(1)
+        self.handler = stream.StreamHandler(self.poller)
+        self.made = []
+        self.failed = []
+        self.handler.connection_made = self._connection_made
+        self.handler.connection_failed = self._connection_failed
+
+    def tearDown(self):
+        for sock, endpoint, rtt in self.made:
+            sock.close()
+        self.lsock.close()
+
+    def _connection_made(self, sock, endpoint, rtt):
+        self.made.append((sock, endpoint, rtt))
+        if len(self.made) == 3:
+            self.poller.break_loop()
+
+    def _connection_failed(self, connector, exception):
+        self.failed.append(connector)
+        self.poller.break_loop()
+
+    def _loop(self):
+        self.poller.sched(5, self.poller.break_loop)
+        self.poller.loop()
+
+    def test_parallel(self):
+        """Make sure we start all the connections at once"""
+        self.handler.connect(("127.0.0.1", self.port), 3)
+        self.assertEqual(self.handler.connecting, 3)
+        self._loop()
+        self.assertEqual(len(self.made), 3)
+        self.assertEqual(len(self.handler.rtts), 3)
+        self.assertEqual(self.failed, [])
+
+    def test_fallback(self):
+        """Make sure we fall back to the next address"""
+        self.handler.connect(("::1 127.0.0.1", self.port), 3)
+        self._loop()
+        self.assertEqual(len(self.made), 3)
+        for _, endpoint, _ in self.made:
+            self.assertEqual(endpoint[0], "127.0.0.1")
+
+    def test_failure(self):
+        """Make sure we report failure and close the good sockets"""
+        self.lsock.close()
+        self.handler.connect(("127.0.0.1", self.port), 2)
+        self._loop()
+        self.assertEqual(len(self.failed), 2)
+        self.assertEqual(self.made, [])
+
+    def test_interleave(self):
+        """Make sure we alternate address families"""
+        ainfos = [(socket.AF_INET6, 1), (socket.AF_INET6, 2),
+                  (socket.AF_INET, 3), (socket.AF_INET6, 4)]
+        result = [ainfo[1] for ainfo in
+                  utils_net.interleave_families(ainfos)]
+        self.assertEqual(result, [1, 3, 2, 4])
+
 if __name__ == "__main__":
     unittest.main()
@@ -22,13 +22,17 @@
 
 ''' Regression test for neubot/poller.py '''
 
+import socket
 import sys
 import unittest
 
 if __name__ == '__main__':
     sys.path.insert(0, '.')
 
+from neubot.pollable import Pollable
+from neubot.poller import BACKENDS
 from neubot.poller import Poller
+from neubot.utils import ticks
 
 class TestCheckTimeoutStream(object):
     ''' Fake stream for TestCheckTimeout '''
@@ -37,6 +41,8 @@ class TestCheckTimeoutStream(object):
         '''Initialize fake stream '''
         self._result = result
         self._fileno = fileno
+        self.created = 0
+        self.watchdog = 0
 
     def fileno(self):
         ''' Return file number '''
@@ -60,6 +66,20 @@ class TestCheckTimeoutStream(object):
         ''' String representation of this stream '''
         return "stream %d" % self._fileno
 
+class TestCheckTimeoutPollable(Pollable):
+    ''' Fake pollable for TestCheckTimeout '''
+
+    def __init__(self, result, fileno):
+        Pollable.__init__(self)
+        self._result = result
+        self._fileno = fileno
+
+    def fileno(self):
+        return self._fileno
+
+    def handle_close(self):
+        self._result.append(self._fileno)
+
 class TestCheckTimeout(unittest.TestCase):
     ''' Regression test for poller.check_timeout() '''
 
@@ -68,7 +88,7 @@ class TestCheckTimeout(unittest.TestCase):
         poller = Poller(1)
         result = []
         stream = TestCheckTimeoutStream(result, 1)
-        poller.readset[1] = stream
+        poller.set_readable(stream)
         poller.check_timeout()
         self.assertEqual(result, [1])
 
@@ -77,7 +97,7 @@ class TestCheckTimeout(unittest.TestCase):
         poller = Poller(1)
         result = []
         stream = TestCheckTimeoutStream(result, 1)
-        poller.writeset[1] = stream
+        poller.set_writable(stream)
         poller.check_timeout()
         self.assertEqual(result, [1])
 
@@ -94,9 +114,9 @@ class TestCheckTimeout(unittest.TestCase):
         #
         for i in range(256):
             stream = TestCheckTimeoutStream(result, i)
-            poller.readset[i] = stream
+            poller.set_readable(stream)
             if i > 14 and i < 128:
-                poller.writeset[i] = stream
+                poller.set_writable(stream)
 
         # This should close odd streams only
         poller.check_timeout()
@@ -110,5 +130,215 @@ class TestCheckTimeout(unittest.TestCase):
         # Make sure the writable set is consistent
         self.assertEqual(sorted(poller.writeset), range(16, 128, 2))
 
+        # Make sure the counters are consistent
+        data = {}
+        poller.snap(data)
+        self.assertEqual(data['poller']['watchdog']['expired'], 128)
+        self.assertEqual(data['poller']['watchdog']['watched'], 128)
+
+    def test_deadline_index(self):
+        ''' Make sure only expiring streams are touched '''
+        poller = Poller(1)
+        result = []
+        expiring = TestCheckTimeoutStream(result, 1)
+        poller.set_readable(expiring)
+        for i in range(2, 64):
+            stream = TestCheckTimeoutStream(result, i)
+            stream.created = ticks()
+            stream.watchdog = 300
+            poller.set_readable(stream)
+        poller.check_timeout()
+        self.assertEqual(result, [1])
+        self.assertEqual(poller.watchdog_stats['checked'], 1)
+
+    def test_pollable_rearm(self):
+        ''' Make sure a shortened watchdog is honoured at once '''
+        poller = Poller(1)
+        result = []
+        stream = TestCheckTimeoutPollable(result, 3)
+        poller.set_readable(stream)
+        poller.check_timeout()
+        self.assertEqual(result, [])
+
+        # Activity moves the deadline forward: nothing happens
+        stream.created = ticks()
+        poller.check_timeout()
+        self.assertEqual(result, [])
+
+        # A shorter watchdog must be noticed immediately
+        stream.created = ticks() - 10
+        stream.watchdog = 5
+        poller.check_timeout()
+        self.assertEqual(result, [3])
+        self.assertEqual(poller.deadlines, {})
+
+class TestTimers(unittest.TestCase):
+    ''' Regression test for the poller timers '''
+
+    def test_run_expired(self):
+        ''' Make sure all expired timers run in one pass and in order '''
+        poller = Poller(1)
+        result = []
+        poller.sched(0, result.append, 1)
+        poller.sched(0, result.append, 2)
+        poller.sched(-1, result.append, 0)
+        poller.sched(3600, result.append, 3)
+        poller._run_expired()
+        self.assertEqual(result, [(0,), (1,), (2,)])
+
+    def test_cancel(self):
+        ''' Make sure cancelled timers do not fire '''
+        poller = Poller(1)
+        result = []
+        task = poller.sched(0, result.append, 1)
+        poller.sched(0, result.append, 2)
+        task.cancel()
+        task.cancel()
+        self.assertTrue(task.cancelled())
+        poller._run_expired()
+        self.assertEqual(result, [(2,)])
+        self.assertEqual(poller.timers_cancelled, 0)
+
+    def test_cancel_from_task(self):
+        ''' Make sure a task can cancel another expired task '''
+        poller = Poller(1)
+        result = []
+        tasks = []
+        poller.sched(0, lambda: tasks[0].cancel())
+        tasks.append(poller.sched(0, result.append, 1))
+        poller._run_expired()
+        self.assertEqual(result, [])
+        # The cancelled task was not in the heap anymore
+        self.assertEqual(poller.timers_cancelled, 0)
+        data = {}
+        poller.snap(data)
+        self.assertEqual(data['poller']['timers'], len(poller.timers))
+
+    def test_no_starvation(self):
+        ''' Make sure a zero-delay task rescheduled from a task
+            runs in the next pass, not in the current one '''
+        poller = Poller(1)
+        result = []
+        def reschedule():
+            result.append(1)
+            poller.sched(0, reschedule)
+        poller.sched(0, reschedule)
+        poller._run_expired()
+        self.assertEqual(result, [1])
+        self.assertEqual(poller._next_timeout(), 0)
+
+    def test_compact(self):
+        ''' Make sure the heap is compacted after many cancels '''
+        poller = Poller(1)
+        tasks = [poller.sched(60, lambda: None) for _ in range(256)]
+        for task in tasks:
+            task.cancel()
+        self.assertTrue(len(poller.timers) < 256)
+        # Only the check_timeout() timer should survive
+        self.assertEqual(len(poller.timers) - poller.timers_cancelled, 1)
+
+class TestBackendStream(object):
+    ''' Fake stream for TestBackends '''
+
+    def __init__(self, sock, result):
+        ''' Initialize fake stream '''
+        self.sock = sock
+        self.result = result
+
+    def fileno(self):
+        ''' Return file number '''
+        return self.sock.fileno()
+
+    def handle_read(self):
+        ''' Invoked when the socket is readable '''
+        self.result.append(('read', self.fileno()))
+
+    def handle_write(self):
+        ''' Invoked when the socket is writable '''
+        self.result.append(('write', self.fileno()))
+
+    def handle_close(self):
+        ''' Invoked when this stream is closed '''
+        self.result.append(('close', self.fileno()))
+
+class TestBackends(unittest.TestCase):
+    ''' Make sure that all readiness backends behave the same '''
+
+    def _run_backend(self, name):
+        ''' Run the test with the given backend '''
+        poller = Poller(1, backend=name)
+        self.assertEqual(poller.backend.name, name)
+        result = []
+        left, right = socket.socketpair()
+        stream_left = TestBackendStream(left, result)
+        stream_right = TestBackendStream(right, result)
+
+        # Nothing to read yet, but the socket is writable
+        poller.set_readable(stream_left)
+        poller.set_writable(stream_right)
+        poller._poll(0.1)
+        self.assertEqual(result, [('write', right.fileno())])
+
+        # Now the other end becomes readable
+        del result[:]
+        poller.unset_writable(stream_right)
+        right.send('x')
+        poller._poll(1)
+        self.assertEqual(result, [('read', left.fileno())])
+
+        # Unset followed by set does not lose the registration
+        del result[:]
+        poller.unset_readable(stream_left)
+        poller.set_readable(stream_left)
+        poller._poll(1)
+        self.assertEqual(result, [('read', left.fileno())])
+
+        # Once unregistered, no more events
+        del result[:]
+        poller.unset_readable(stream_left)
+        poller.set_readable(stream_right)
+        poller._poll(0.1)
+        self.assertEqual(result, [])
+
+        poller.close(stream_right)
+        poller.backend.close()
+        left.close()
+        right.close()
+
+    def test_backends(self):
+        ''' Make sure all available backends work '''
+        for name in BACKENDS:
+            self._run_backend(name)
+
+    def _run_fd_reuse(self, name):
+        ''' Run the fd reuse test with the given backend '''
+        poller = Poller(1, backend=name)
+        result = []
+        left, right = socket.socketpair()
+        poller.set_writable(TestBackendStream(left, result))
+        poller._poll(0.1)
+        fileno = left.fileno()
+
+        # Close and reuse the descriptor before the next flush
+        del result[:]
+        poller.unset_writable(TestBackendStream(left, result))
+        left.close()
+        left, other = socket.socketpair()
+        if left.fileno() != fileno:
+            left, other = other, left
+        self.assertEqual(left.fileno(), fileno)
+        poller.set_writable(TestBackendStream(left, result))
+        poller._poll(1)
+        self.assertEqual(result, [('write', fileno)])
+
+        poller.backend.close()
+        for sock in (left, right, other):
+            sock.close()
+
+    def test_fd_reuse(self):
+        ''' Make sure a reused file descriptor is registered again '''
+        for name in BACKENDS:
+            self._run_fd_reuse(name)
+
 if __name__ == '__main__':
     unittest.main()
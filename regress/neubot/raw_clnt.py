@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/raw_clnt.py '''
+
+#
+# Regress-for: neubot/raw_clnt.py
+#
+
+import struct
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.raw_clnt import ClientContext
+from neubot.raw_clnt import RawClient
+
+PIECE_LEN = 32768
+PIECES = 20
+
+class CountingContext(ClientContext):
+    ''' Counts the bytes that are bufferised (i.e. copied) '''
+
+    def __init__(self, state):
+        ClientContext.__init__(self, state)
+        self.copied = 0
+
+    def bufferise(self, octets):
+        self.copied += len(octets)
+        ClientContext.bufferise(self, octets)
+
+class FakeStream(object):
+    ''' Fake stream that records recv_view() calls '''
+
+    def __init__(self):
+        self.opaque = CountingContext({'rcvr_data': []})
+        self.bytes_in = 0
+        self.receiving = 0
+        self.closed = False
+
+    def recv_view(self, maxrecv, recv_complete):
+        ''' Record that we are receiving '''
+        self.receiving += 1
+
+    def close(self):
+        ''' Record that we are closed '''
+        self.closed = True
+
+class TestWaitingPiece(unittest.TestCase):
+    ''' Regression tests for RawClient._waiting_piece() '''
+
+    def _run(self, fragment, wrap):
+        ''' Feed PIECEs and the final empty message in fragments '''
+        piece = struct.pack('!I', PIECE_LEN) + 'A' * PIECE_LEN
+        data = bytearray(piece * PIECES + struct.pack('!I', 0))
+        client = RawClient()
+        stream = FakeStream()
+        try:
+            for offset in range(0, len(data), fragment):
+                chunk = data[offset:offset + fragment]
+                stream.bytes_in += len(chunk)
+                client._waiting_piece(stream, wrap(chunk))
+        finally:
+            context = stream.opaque
+            if context.periodic:
+                context.periodic.cancel()
+        self.assertTrue(stream.closed)
+        self.assertTrue(context.state['complete'])
+        self.assertEqual(stream.receiving, len(context.state['rcvr_data'])
+                         - 1)
+        self.assertEqual(context.total, 0)
+        return context.copied
+
+    def test_views(self):
+        ''' Make sure we copy only the length prefixes '''
+        for fragment in (3, 1000, 58400, 65536, 262144):
+            self.assertEqual(self._run(fragment, memoryview),
+                             4 * (PIECES + 1))
+
+    def test_strings(self):
+        ''' Make sure strings (as passed by SSL streams) work '''
+        self.assertEqual(self._run(58400, str), 4 * (PIECES + 1))
+
+if __name__ == '__main__':
+    unittest.main()
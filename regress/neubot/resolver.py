@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/resolver.py '''
+
+#
+# Regress-for: neubot/resolver.py
+# Python3-ready: yes
+#
+
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.poller import POLLER
+from neubot.resolver import Resolver
+from neubot import resolver
+
+class TestResolver(unittest.TestCase):
+    ''' Regression tests for Resolver '''
+
+    def setUp(self):
+        self.resolver = Resolver()
+        self.results = []
+
+    def _callback(self, result):
+        ''' Save the result and stop the loop '''
+        self.results.append(result)
+        POLLER.break_loop()
+
+    def _loop(self):
+        ''' Run the loop until the callback or a timeout '''
+        task = POLLER.sched(10, POLLER.break_loop)
+        POLLER.again = True
+        POLLER.loop()
+        task.cancel()
+
+    def test_numeric(self):
+        ''' Make sure numeric addresses are resolved at once '''
+        self.resolver.resolve(('127.0.0.1', 80), False, self._callback)
+        self.assertEqual(len(self.results), 1)
+        self.assertEqual(self.results[0][0][4], ('127.0.0.1', 80))
+        self.assertEqual(self.resolver.stats['resolver.numeric'], 1)
+
+    def test_sorted(self):
+        ''' Make sure the result honours prefer_ipv6 '''
+        if not socket.has_ipv6:
+            return
+        self.resolver.resolve(('::1', 80), False, self._callback)
+        self.resolver.resolve(('::1', 80), True, self._callback)
+        self.assertEqual(self.results[0], self.results[1])
+
+    def test_async_and_cache(self):
+        ''' Make sure names are resolved off-loop and cached '''
+        self.resolver.resolve(('localhost', 80), False, self._callback)
+        self.resolver.resolve(('localhost', 80), False, self._callback)
+        self.assertEqual(self.results, [])
+        self.assertEqual(len(self.resolver.waiting), 1)
+        self._loop()
+        self.assertEqual(len(self.results), 2)
+        self.assertTrue(self.results[0])
+        self.assertEqual(self.resolver.waiting, {})
+
+        self.resolver.resolve(('localhost', 80), False, self._callback)
+        self.assertEqual(len(self.results), 3)
+        self.assertEqual(self.resolver.stats['resolver.hits'], 1)
+        self.assertEqual(self.resolver.stats['resolver.misses'], 2)
+
+    def test_failure(self):
+        ''' Make sure failures are reported with an empty list '''
+        self.resolver.resolve(('nonexistent.invalid', 80), False,
+                              self._callback)
+        self._loop()
+        self.assertEqual(self.results, [[]])
+        key = ('nonexistent.invalid', 80, socket.AF_UNSPEC)
+        self.assertEqual(self.resolver.cache[key][1], [])
+
+    def test_expire(self):
+        ''' Make sure cache entries expire '''
+        key = ('localhost', 80, socket.AF_UNSPEC)
+        self.resolver.cache[key] = (0, [])
+        self.resolver.resolve(('localhost', 80), False, self._callback)
+        self.assertEqual(self.results, [])
+        self._loop()
+        self.assertTrue(self.results[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/server_supervisor.py '''
+
+#
+# Regress-for: neubot/server_supervisor.py
+#
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.compat import json
+from neubot.poller import POLLER
+
+from neubot import server_supervisor
+
+class FakeSupervisor(object):
+    ''' Records the workers that say they are ready '''
+
+    def __init__(self):
+        self.ready = []
+
+    def worker_ready(self, channel):
+        self.ready.append(channel.index)
+
+class TestWorkerChannel(unittest.TestCase):
+    ''' Regression tests for WorkerChannel '''
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+        self.supervisor = FakeSupervisor()
+        self.channel = server_supervisor.WorkerChannel(1, 1234, self.rfd,
+                                                       self.supervisor)
+
+    def tearDown(self):
+        self.channel.handle_close()
+        if self.wfd >= 0:
+            os.close(self.wfd)
+
+    def test_counters(self):
+        ''' Make sure we reassemble counters split across reads '''
+        line = json.dumps({'poller.timers': 3}) + '\n'
+        os.write(self.wfd, line[:5])
+        self.channel.handle_read()
+        self.assertEqual(self.channel.counters, {})
+        os.write(self.wfd, line[5:] + line.replace('3', '4'))
+        self.channel.handle_read()
+        self.assertEqual(self.channel.counters, {'poller.timers': 4})
+        self.assertFalse(self.channel.ready)
+
+    def test_ready(self):
+        ''' Make sure the supervisor knows when a worker is ready '''
+        os.write(self.wfd, server_supervisor.READY + '\n')
+        self.channel.handle_read()
+        self.assertTrue(self.channel.ready)
+        self.assertEqual(self.supervisor.ready, [1])
+
+    def test_eof(self):
+        ''' Make sure we close the pipe on EOF '''
+        os.close(self.wfd)
+        self.wfd = -1
+        self.channel.handle_read()
+        self.assertEqual(self.channel.filenum, -1)
+
+class TestWorkerReporter(unittest.TestCase):
+    ''' Regression tests for WorkerReporter '''
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+        self.counters = {'poller.timers': 1}
+        self.reporter = server_supervisor.WorkerReporter(self.wfd,
+                                                         self.report)
+
+    def tearDown(self):
+        self.reporter.task.cancel()
+        POLLER.again = True
+        os.close(self.wfd)
+        if self.rfd >= 0:
+            os.close(self.rfd)
+
+    def report(self):
+        return self.counters
+
+    def test_report(self):
+        ''' Make sure we report counters and readiness '''
+        self.reporter.ready()
+        self.assertEqual(os.read(self.rfd, 65536).split('\n'), [
+            json.dumps(self.counters), server_supervisor.READY, ''])
+
+    def test_eagain(self):
+        ''' Make sure we never block on a slow supervisor '''
+        self.counters = dict(('counter.%d' % index, index)
+                             for index in range(16384))
+        self.reporter.task.cancel()
+        self.reporter._report()
+        self.reporter.task.cancel()
+        self.reporter._report()
+
+    def test_epipe(self):
+        ''' Make sure we stop when the supervisor is gone '''
+        os.close(self.rfd)
+        self.rfd = -1
+        self.reporter.task.cancel()
+        self.reporter._report()
+        self.assertFalse(POLLER.again)
+
+#
+# The following test forks real workers, which write what they
+# see to a file, and runs the supervisor in the global poller.
+#
+class TestSupervisor(unittest.TestCase):
+    ''' Regression tests for Supervisor '''
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'events')
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.generation = 0
+        self.spawned = []
+        self.saved = (server_supervisor.REAP_INTERVAL,
+                      server_supervisor.MIN_LIFETIME)
+        server_supervisor.REAP_INTERVAL = 0.1
+        server_supervisor.MIN_LIFETIME = 0
+        self.supervisor = server_supervisor.Supervisor(3, self.worker_main,
+                                                       dict)
+        self.supervisor.close_in_workers(self.listener)
+
+        # Record how many workers exist when we fork each of them
+        spawn = self.supervisor._spawn
+        def _spawn(index):
+            self.spawned.append((self.generation, index,
+                                 len(self.supervisor.channels)))
+            spawn(index)
+        self.supervisor._spawn = _spawn
+        start_generation = self.supervisor._start_generation
+        def _start_generation():
+            self.generation += 1
+            start_generation()
+        self.supervisor._start_generation = _start_generation
+
+    def tearDown(self):
+        (server_supervisor.REAP_INTERVAL,
+         server_supervisor.MIN_LIFETIME) = self.saved
+        POLLER.again = True
+        self.listener.close()
+        shutil.rmtree(self.tempdir)
+
+    def worker_main(self, index):
+        ''' Body of the workers (runs in the child) '''
+        try:
+            self.listener.fileno()
+            inherited = True
+        except socket.error:
+            inherited = False
+        filep = open(self.path, 'a')
+        filep.write('%d %d %d %d\n' % (self.generation, index, os.getpid(),
+                                       inherited))
+        filep.close()
+        # The second worker of the first generation crashes
+        if self.generation == 1 and index == 1:
+            POLLER.sched(0.5, lambda: os._exit(1))
+        # Like a real worker, we have something to listen to
+        POLLER.set_readable(server_supervisor.KeepAlive())
+        POLLER.loop()
+
+    def events(self):
+        ''' Read the events written by the workers '''
+        if not os.path.exists(self.path):
+            return []
+        filep = open(self.path)
+        events = [tuple(int(field) for field in line.split())
+                  for line in filep]
+        filep.close()
+        return events
+
+    def check(self):
+        ''' Stop when the second generation is ready '''
+        channels = self.supervisor.channels.values()
+        if (self.generation == 2 and len(channels) == 3 and
+          all(channel.ready for channel in channels)):
+            self.supervisor.stop()
+            return
+        POLLER.sched(0.1, self.check)
+
+    def test_restart(self):
+        ''' Make sure workers start in order and restart together '''
+        self.supervisor.start()
+        POLLER.sched(0.1, self.check)
+        watchdog = POLLER.sched(30, self.supervisor.stop)
+        POLLER.loop()
+        watchdog.cancel()
+        pids = list(self.supervisor.channels.keys())
+        for pid in pids:
+            os.waitpid(pid, 0)
+        self.supervisor.reaper.cancel()
+        for channel in self.supervisor.channels.values():
+            POLLER.close(channel)
+
+        # Each worker is forked when the previous one is ready
+        self.assertEqual(self.spawned, [(1, 0, 0), (1, 1, 1), (1, 2, 2),
+                                        (2, 0, 0), (2, 1, 1), (2, 2, 2)])
+        self.assertEqual(self.supervisor.restarts, 1)
+
+        # Whole new generation, which did not inherit our socket
+        events = self.events()
+        self.assertEqual([event[:2] for event in events], [
+            (1, 0), (1, 1), (1, 2), (2, 0), (2, 1), (2, 2)])
+        self.assertEqual(sorted(event[2] for event in events[3:]),
+                         sorted(pids))
+        self.assertEqual([event[3] for event in events], [0] * 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/sockopts.py '''
+
+#
+# Regress-for: neubot/sockopts.py
+# Python3-ready: yes
+#
+
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.config import CONFIG
+from neubot import sockopts
+from neubot import utils_net
+
+class TestGetProfile(unittest.TestCase):
+    ''' Regression tests for get_profile() '''
+
+    def tearDown(self):
+        CONFIG['sockopts.bulk.sndbuf'] = 0
+
+    def test_defaults(self):
+        ''' Make sure profiles skip the kernel-default options '''
+        self.assertEqual(sockopts.get_profile('bulk'), {})
+        self.assertEqual(sockopts.get_profile('realtime'),
+                         {'nodelay': 1, 'notsent_lowat': 16384})
+
+    def test_config(self):
+        ''' Make sure profiles are read from CONFIG '''
+        CONFIG['sockopts.bulk.sndbuf'] = 65536
+        self.assertEqual(sockopts.get_profile('bulk'), {'sndbuf': 65536})
+
+    def test_unknown(self):
+        ''' Make sure an unknown or empty profile sets no option '''
+        self.assertEqual(sockopts.get_profile('nonexistent'), {})
+        self.assertEqual(sockopts.get_profile(''), {})
+
+class TestApplySockopts(unittest.TestCase):
+    ''' Regression tests for utils_net.apply_sockopts() '''
+
+    def test_apply(self):
+        ''' Make sure options are applied and read back '''
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        utils_net.apply_sockopts(sock, {'nodelay': 1, 'rcvbuf': 32768,
+                                        'sndbuf': 0, 'nonexistent': 1})
+        result = utils_net.get_sockopts(sock)
+        self.assertTrue(result['nodelay'])
+        self.assertTrue(result['rcvbuf'] >= 32768)
+        sock.close()
+
+    def test_listen(self):
+        ''' Make sure listen() applies the options '''
+        sockets = utils_net.listen(('127.0.0.1', 0), False, {'nodelay': 1})
+        self.assertEqual(len(sockets), 1)
+        self.assertTrue(utils_net.get_sockopts(sockets[0])['nodelay'])
+        sockets[0].close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/sslstream.py '''
+
+#
+# Regress-for: neubot/sslstream.py
+# Python3-ready: yes
+#
+
+import ssl
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot import sslstream
+
+class FakeSSLSocket(object):
+    ''' Returns queued records, then raises WANT_READ (or EOF) '''
+
+    def __init__(self, records, session=None):
+        self.records = list(records)
+        self.session = session
+
+    def read(self, maxlen):
+        ''' Fake SSL_read() '''
+        if not self.records:
+            raise ssl.SSLError(ssl.SSL_ERROR_WANT_READ, 'want read')
+        record = self.records.pop(0)
+        if not record:
+            self.records.insert(0, record)
+        elif len(record) > maxlen:
+            self.records.insert(0, record[maxlen:])
+            record = record[:maxlen]
+        return record
+
+class TestReadBatch(unittest.TestCase):
+    ''' Regression tests for read_batch() '''
+
+    def test_many_records(self):
+        ''' Make sure read_batch() drains all the ready records '''
+        sock = FakeSSLSocket(['A' * 16384, 'B' * 16384, 'C' * 100])
+        octets = sslstream.read_batch(sock, 65536)
+        self.assertEqual(octets, 'A' * 16384 + 'B' * 16384 + 'C' * 100)
+
+    def test_maxlen(self):
+        ''' Make sure read_batch() does not read more than maxlen '''
+        sock = FakeSSLSocket(['A' * 16384, 'B' * 16384])
+        octets = sslstream.read_batch(sock, 20000)
+        self.assertEqual(octets, 'A' * 16384 + 'B' * 3616)
+        self.assertEqual(sock.records, ['B' * 12768])
+
+    def test_first_read(self):
+        ''' Make sure read_batch() raises if the first read fails '''
+        sock = FakeSSLSocket([])
+        self.assertRaises(ssl.SSLError, sslstream.read_batch, sock, 65536)
+
+    def test_eof(self):
+        ''' Make sure read_batch() stops at EOF '''
+        sock = FakeSSLSocket(['A' * 10, ''])
+        self.assertEqual(sslstream.read_batch(sock, 65536), 'A' * 10)
+        self.assertEqual(sslstream.read_batch(sock, 65536), '')
+
+class TestSessionCache(unittest.TestCase):
+    ''' Regression tests for the contexts and sessions caches '''
+
+    def setUp(self):
+        self.saved = (sslstream.HAVE_SESSION, sslstream.SESSION_CACHE_MAX)
+        sslstream.SESSIONS.clear()
+
+    def tearDown(self):
+        sslstream.HAVE_SESSION, sslstream.SESSION_CACHE_MAX = self.saved
+        sslstream.SESSIONS.clear()
+
+    def test_context(self):
+        ''' Make sure we reuse the context of a previous connection '''
+        if not sslstream.HAVE_CONTEXT:
+            return
+        context = sslstream.get_context(None, False)
+        self.assertTrue(sslstream.get_context(None, False) is context)
+
+    def test_save(self):
+        ''' Make sure we remember the session of an endpoint '''
+        sslstream.HAVE_SESSION = True
+        sslstream.save_session(FakeSSLSocket([], 'S1'), ('1.2.3.4', 443))
+        sslstream.save_session(FakeSSLSocket([], None), ('1.2.3.4', 80))
+        sslstream.save_session(FakeSSLSocket([], 'S2'), None)
+        self.assertEqual(sslstream.SESSIONS, {('1.2.3.4', 443): 'S1'})
+
+    def test_bounded(self):
+        ''' Make sure the sessions cache does not grow forever '''
+        sslstream.HAVE_SESSION = True
+        sslstream.SESSION_CACHE_MAX = 2
+        for port in range(4):
+            sslstream.save_session(FakeSSLSocket([], port), port)
+        self.assertEqual(len(sslstream.SESSIONS), 2)
+        self.assertEqual(sslstream.SESSIONS[3], 3)
+
+if __name__ == '__main__':
+    unittest.main()
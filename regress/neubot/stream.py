@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/stream.py '''
+
+#
+# Regress-for: neubot/stream.py
+# Python3-ready: yes
+#
+
+import socket
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.poller import POLLER
+from neubot import stream
+from neubot import six
+
+class TestRecvBufferPool(unittest.TestCase):
+    ''' Regression tests for RecvBufferPool '''
+
+    def test_reuse(self):
+        ''' Make sure the pool reuses buffers '''
+        pool = stream.RecvBufferPool(16, 1)
+        buff = pool.get()
+        self.assertEqual(len(buff), 16)
+        pool.put(buff)
+        self.assertTrue(pool.get() is buff)
+
+    def test_maxfree(self):
+        ''' Make sure the pool keeps at most maxfree buffers '''
+        pool = stream.RecvBufferPool(16, 1)
+        pool.put(bytearray(16))
+        pool.put(bytearray(16))
+        self.assertEqual(len(pool.free), 1)
+
+class TestStreamRecv(unittest.TestCase):
+    ''' Regression tests for Stream receive path '''
+
+    def setUp(self):
+        lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        lsock.bind(('127.0.0.1', 0))
+        lsock.listen(1)
+        self.left = socket.create_connection(lsock.getsockname())
+        right = lsock.accept()[0]
+        lsock.close()
+        self.stream = stream.Stream(right, lambda s: None, lambda s: None,
+                                    None, None, None)
+        self.received = []
+
+    def tearDown(self):
+        self.left.close()
+        POLLER.close(self.stream)
+        POLLER.unset_readable(self.stream)
+
+    def _recv_complete(self, strm, octets):
+        ''' Record what the stream received '''
+        if isinstance(octets, memoryview):
+            self.received.append((memoryview, octets.tobytes()))
+        else:
+            self.received.append((type(octets), octets))
+
+    def test_recv_string(self):
+        ''' Make sure recv() passes a string '''
+        self.left.send(six.b('abcdef'))
+        self.stream.recv(1024, self._recv_complete)
+        self.stream.handle_read()
+        self.assertEqual(self.received, [(type(six.b('')), six.b('abcdef'))])
+
+    def test_recv_view(self):
+        ''' Make sure recv_view() passes a memoryview '''
+        self.left.send(six.b('abcdef'))
+        self.stream.recv_view(1024, self._recv_complete)
+        self.stream.handle_read()
+        self.assertEqual(self.received, [(memoryview, six.b('abcdef'))])
+        self.assertEqual(self.stream.recv_buff, None)
+
+    def test_adapt(self):
+        ''' Make sure the read size grows and shrinks '''
+        strm = self.stream
+        strm.recv_size = 16384
+        strm._adapt_recv_size(16384, 16384)
+        self.assertEqual(strm.recv_size, 32768)
+        strm._adapt_recv_size(32768, 1000)
+        self.assertEqual(strm.recv_size, 16384)
+        strm._adapt_recv_size(1024, 1024)
+        self.assertEqual(strm.recv_size, 16384)
+        strm.recv_size = stream.RECV_MAXSIZE
+        strm._adapt_recv_size(stream.RECV_MAXSIZE, stream.RECV_MAXSIZE)
+        self.assertEqual(strm.recv_size, stream.RECV_MAXSIZE)
+        strm.recv_size = stream.RECV_MINSIZE
+        strm._adapt_recv_size(stream.RECV_MINSIZE, 1)
+        self.assertEqual(strm.recv_size, stream.RECV_MINSIZE)
+
+if __name__ == '__main__':
+    unittest.main()
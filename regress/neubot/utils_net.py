@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression tests for neubot/utils_net.py '''
+
+#
+# Regress-for: neubot/utils_net.py
+#
+
+import errno
+import socket
+import struct
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot import utils_net
+
+def _decode(program):
+    ''' Decode a classic BPF program into instructions '''
+    size = struct.calcsize('HBBI')
+    return [struct.unpack('HBBI', program[offset:offset + size])
+            for offset in range(0, len(program), size)]
+
+class TestReuseportSteering(unittest.TestCase):
+    ''' Regression tests for the SO_REUSEPORT steering program '''
+
+    def test_program(self):
+        ''' Make sure we load the source address modulo count '''
+        for family, offset in ((socket.AF_INET, 12),
+                               (socket.AF_INET6, 20)):
+            program = utils_net._reuseport_steering(family, 3)
+            self.assertEqual(_decode(program), [
+                (0x20, 0, 0, 0x100000000 - 0x100000 + offset),
+                (0x94, 0, 0, 3),
+                (0x16, 0, 0, 0),
+            ])
+
+    def _group(self, count):
+        ''' Bind count sockets to the same port, in order '''
+        group = []
+        port = 0
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            utils_net.reuseport_enable(sock)
+            sock.bind(('127.0.0.1', port))
+            sock.listen(16)
+            utils_net.reuseport_attach(sock, socket.AF_INET, count)
+            sock.setblocking(False)
+            port = sock.getsockname()[1]
+            group.append(sock)
+        return group, port
+
+    @staticmethod
+    def _steered(group, port, source):
+        ''' Return the index of the socket accepting from source '''
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.bind((source, 0))
+        client.connect(('127.0.0.1', port))
+        try:
+            for index, sock in enumerate(group):
+                try:
+                    sock.accept()[0].close()
+                except socket.error:
+                    if sys.exc_info()[1].args[0] != errno.EAGAIN:
+                        raise
+                    continue
+                return index
+            return -1
+        finally:
+            client.close()
+
+    def test_steering(self):
+        ''' Make sure a client lands on the same index on all ports '''
+        if not utils_net.reuseport_supported():
+            sys.stderr.write('SO_REUSEPORT steering not available\n')
+            return
+        first, first_port = self._group(3)
+        second, second_port = self._group(3)
+        try:
+            for last in range(1, 10):
+                source = '127.0.0.%d' % last
+                expected = (0x7f000000 + last) % 3
+                self.assertEqual(self._steered(first, first_port, source),
+                                 expected)
+                self.assertEqual(self._steered(second, second_port,
+                                               source), expected)
+        finally:
+            for sock in first + second:
+                sock.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,7 +22,11 @@
 
 ''' Unit test for neubot/utils_random.py '''
 
+import os
+import shutil
 import sys
+import tempfile
+import zlib
 
 sys.path.insert(0, '.')
 
@@ -31,16 +35,71 @@ from neubot import utils
 BEFORE = utils.ticks()
 from neubot.utils_random import RANDOMBLOCKS
 from neubot.utils_random import RandomBody
+from neubot.utils_random import UrandomBlocks
+from neubot.utils_random import get_payload
 ELAPSED = utils.ticks() - BEFORE
+from neubot import utils_random
 print('Time to import: %s' % (utils.time_formatter(ELAPSED)))
 
+def check_cache(tempdir):
+
+    ''' Make sure the base block is built lazily and cached '''
+
+    utils_random.CACHEPATH = os.sep.join([tempdir, 'base_block.cache'])
+    size = RANDOMBLOCKS.blocksiz
+
+    # Nothing happens until the first block is requested
+    assert(not RANDOMBLOCKS._pool)
+    assert(not os.path.exists(utils_random.CACHEPATH))
+
+    first = utils_random.create_base_block(size)
+    assert(os.path.exists(utils_random.CACHEPATH))
+    assert(sum(len(word) for word in first) == size)
+    second = utils_random.create_base_block(size)
+    assert(second == first)
+
+    # A different digest means that WWWDIR has changed
+    filep = open(utils_random.CACHEPATH, 'r+b')
+    filep.write('0')
+    filep.close()
+    third = utils_random.create_base_block(size)
+    assert(third != first)
+    assert(utils_random.create_base_block(size) == third)
+
 def main():
 
     ''' Unit test for neubot/utils_random.py '''
 
+    tempdir = tempfile.mkdtemp()
+    try:
+        check_cache(tempdir)
+    finally:
+        shutil.rmtree(tempdir)
+
     assert(len(RANDOMBLOCKS.get_block()) == RANDOMBLOCKS.blocksiz)
     assert(RANDOMBLOCKS.get_block() != RANDOMBLOCKS.get_block())
 
+    # Blocks are read-only views recycled from the pool
+    block = RANDOMBLOCKS.get_block()
+    assert(isinstance(block, memoryview) and block.readonly)
+    for _ in range(RANDOMBLOCKS.poolsize - 1):
+        assert(RANDOMBLOCKS.get_block() is not block)
+    assert(RANDOMBLOCKS.get_block() is block)
+
+    # The urandom payload does not compress, unless we ask for it
+    blocks = UrandomBlocks()
+    block = blocks.get_block()
+    assert(len(block) == blocks.blocksiz and block.readonly)
+    assert(len(zlib.compress(block.tobytes())) >= len(block))
+    assert(block != blocks.get_block())
+    block = UrandomBlocks(compressibility=50).get_block().tobytes()
+    assert(0.45 < float(len(zlib.compress(block))) / len(block) < 0.55)
+
+    assert(get_payload('words') is RANDOMBLOCKS)
+    assert(get_payload('urandom', 10) is get_payload('urandom', 10))
+    assert(get_payload('urandom', 10) is not get_payload('urandom', 20))
+    assert(isinstance(RandomBody(1).blocks, UrandomBlocks))
+
     filep, total = RandomBody(RANDOMBLOCKS.blocksiz + 789), 0
     while True:
         block = filep.read(128)
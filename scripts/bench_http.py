@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Measures the rate of /speedtest/latency requests (or, with -u,
+    of /speedtest/upload requests carrying a body of the given size)
+    served by neubot/http/server.py over a keep-alive loopback
+    connection '''
+
+import getopt
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+sys.path.insert(0, '.')
+
+from neubot.config import CONFIG
+from neubot.http.message import Message
+from neubot.http.server import HTTP_SERVER
+from neubot.net.poller import POLLER
+from neubot.speedtest.server import SPEEDTEST_SERVER
+from neubot import utils
+
+USAGE = ('usage: bench_http.py [-q] [-d depth] [-n count] [-p port] '
+         '[-u size]\n')
+
+def _server(port):
+    ''' Run the server (in the child) '''
+    HTTP_SERVER.configure(CONFIG.copy())
+    HTTP_SERVER.register_child(SPEEDTEST_SERVER, '/speedtest/latency')
+    HTTP_SERVER.register_child(SPEEDTEST_SERVER, '/speedtest/upload')
+    HTTP_SERVER.listen(('127.0.0.1', port))
+    POLLER.loop()
+    os._exit(0)
+
+def _connect(port):
+    ''' Connect to the server, retrying while it starts '''
+    for _ in range(50):
+        try:
+            return socket.create_connection(('127.0.0.1', port))
+        except socket.error:
+            time.sleep(0.1)
+    sys.exit('bench_http: cannot connect')
+
+def _request(port, size):
+    ''' Build the request sent by the speedtest client '''
+    request = Message()
+    if size:
+        request.compose(method='POST', pathquery='/speedtest/upload',
+                        host='127.0.0.1:%d' % port, body='A' * size,
+                        mimetype='application/octet-stream')
+    else:
+        request.compose(method='HEAD', pathquery='/speedtest/latency',
+                        host='127.0.0.1:%d' % port)
+    request['authorization'] = '0123456789abcdef0123456789abcdef'
+    request['user-agent'] = 'Neubot/0.4.16.9'
+    body = request.serialize_body()
+    if not isinstance(body, basestring):
+        body = body.read()
+    return request.serialize_headers().read() + body
+
+def bench(port, count, depth, size):
+    ''' Send count requests, depth of them at a time '''
+
+    pid = os.fork()
+    if pid == 0:
+        # Keep the access log out of the terminal
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 2)
+        _server(port)
+
+    try:
+        sock = _connect(port)
+        batch = _request(port, size) * depth
+        before = os.times()
+        begin = utils.ticks()
+        for _ in range(count // depth):
+            sock.sendall(batch)
+            data, responses = '', 0
+            while responses < depth:
+                octets = sock.recv(65536)
+                if not octets:
+                    sys.exit('bench_http: connection closed')
+                data += octets
+                responses = data.count('\r\n\r\n')
+        elapsed = utils.ticks() - begin
+        sock.close()
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    after = os.times()
+
+    total = (count // depth) * depth
+    sys.stdout.write('%8.1f requests/s\n' % (total / elapsed))
+    if size:
+        sys.stdout.write('%8.1f MB/s\n' % (total * size / elapsed / 1e6))
+    sys.stdout.write('server CPU time: %.3f s (%.1f us/request)\n' % (
+                     after[2] - before[2] + after[3] - before[3],
+                     1000000 * (after[2] - before[2] + after[3] -
+                                before[3]) / total))
+
+def main(args):
+    ''' Main function '''
+
+    try:
+        options, arguments = getopt.getopt(args[1:], 'd:n:p:qu:')
+    except getopt.error:
+        sys.exit(USAGE)
+    if arguments:
+        sys.exit(USAGE)
+
+    count, depth, port, size = 20000, 16, 8088, 0
+    for name, value in options:
+        if name == '-d':
+            depth = int(value)
+        elif name == '-n':
+            count = int(value)
+        elif name == '-p':
+            port = int(value)
+        elif name == '-q':
+            CONFIG['verbose'] = 0
+        elif name == '-u':
+            size = int(value)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    bench(port, count, depth, size)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Measures the cost of one poller iteration with many idle
+    loopback connections and a few active ones '''
+
+import getopt
+import socket
+import sys
+
+sys.path.insert(0, '.')
+
+from neubot.poller import BACKENDS
+from neubot.poller import Poller
+from neubot import utils
+
+USAGE = 'usage: bench_poller.py [-a active] [-b backend] [-i idle] [-n iter]\n'
+
+class IdleStream(object):
+    ''' A loopback connection on which nothing happens '''
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def fileno(self):
+        ''' Return file number '''
+        return self.sock.fileno()
+
+    def handle_read(self):
+        ''' Should not happen '''
+        raise RuntimeError('bench_poller: idle stream is readable')
+
+    def handle_close(self):
+        ''' Invoked when the stream is closed '''
+
+class ActiveStream(IdleStream):
+    ''' A loopback connection that bounces one byte back and forth '''
+
+    def __init__(self, sock, peer):
+        IdleStream.__init__(self, sock)
+        self.peer = peer
+        self.count = 0
+
+    def handle_read(self):
+        ''' Consume the byte and send it to the peer '''
+        self.sock.recv(1)
+        self.peer.send('x')
+        self.count += 1
+
+def _loopback_pair(lsock):
+    ''' Create a connected pair of loopback TCP sockets '''
+    client = socket.create_connection(lsock.getsockname())
+    server = lsock.accept()[0]
+    return client, server
+
+def _raise_nofile(wanted):
+    ''' Try to raise the RLIMIT_NOFILE soft limit '''
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < wanted:
+        if hard != resource.RLIM_INFINITY:
+            wanted = min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+def bench(backend, idle, active, iterations):
+    ''' Run the benchmark using the specified backend '''
+
+    lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    lsock.bind(('127.0.0.1', 0))
+    lsock.listen(128)
+
+    poller = Poller(1, backend=backend)
+    sockets, actives = [], []
+
+    for _ in range(idle):
+        client, server = _loopback_pair(lsock)
+        sockets.extend((client, server))
+        poller.set_readable(IdleStream(server))
+
+    for _ in range(active):
+        client, server = _loopback_pair(lsock)
+        sockets.extend((client, server))
+        stream = ActiveStream(server, client)
+        actives.append(stream)
+        poller.set_readable(stream)
+        poller.set_readable(ActiveStream(client, server))
+        client.send('x')
+
+    # Warm up (and flush the interest set to the backend)
+    poller._poll(1)
+
+    begin = utils.ticks()
+    for _ in range(iterations):
+        poller._poll(1)
+    elapsed = utils.ticks() - begin
+
+    events = sum(stream.count for stream in actives)
+    sys.stdout.write('%-6s idle=%d active=%d: %.1f usec/iteration\n' % (
+                     backend, idle, active, elapsed * 1e06 / iterations))
+    sys.stdout.write('%-6s %d ping-pong events served\n' % (backend, events))
+
+    poller.backend.close()
+    for sock in sockets:
+        sock.close()
+    lsock.close()
+
+def main(args):
+    ''' Main function '''
+
+    try:
+        options, arguments = getopt.getopt(args[1:], 'a:b:i:n:')
+    except getopt.error:
+        sys.exit(USAGE)
+    if arguments:
+        sys.exit(USAGE)
+
+    active, backends, idle, iterations = 4, sorted(BACKENDS), 5000, 1000
+    for name, value in options:
+        if name == '-a':
+            active = int(value)
+        elif name == '-b':
+            backends = [value]
+        elif name == '-i':
+            idle = int(value)
+        elif name == '-n':
+            iterations = int(value)
+
+    _raise_nofile(2 * (idle + active) + 64)
+
+    for backend in backends:
+        if backend == 'select' and 2 * (idle + active) >= 1024:
+            sys.stdout.write('select skipped: too many fds for FD_SETSIZE\n')
+            continue
+        bench(backend, idle, active, iterations)
+
+if __name__ == '__main__':
+    main(sys.argv)
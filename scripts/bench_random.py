@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+''' Measures how fast neubot/utils_random.py generates random blocks,
+    comparing the old join-per-block generator with the block pool '''
+
+import getopt
+import sys
+
+sys.path.insert(0, '.')
+
+from neubot.utils_random import RANDOMBLOCKS
+from neubot.utils_random import RandomBody
+from neubot.utils_random import block_generator
+from neubot import utils
+
+USAGE = 'usage: bench_random.py [-n GiB]\n'
+
+class OldRandomBlocks(object):
+    ''' The previous RandomBlocks, which joins a new block each time '''
+
+    def __init__(self):
+        self._generator = block_generator(RANDOMBLOCKS.blocksiz)
+        self.blocksiz = RANDOMBLOCKS.blocksiz
+
+    def get_block(self):
+        ''' Return a block of data '''
+        return self._generator.next()
+
+def _blocks(blocks, total):
+    ''' Fetch total bytes worth of blocks '''
+    count = 0
+    while count < total:
+        count += len(blocks.get_block())
+
+def _body(blocks, total):
+    ''' Like RandomBody.read(), sending MAXBUF bytes at a time '''
+    count = 0
+    while count < total:
+        count += len(blocks.get_block()[:65536])
+
+def bench(name, blocks, function, total):
+    ''' Run function and report GB/s per core '''
+    # Single threaded and CPU bound, so wall clock time is CPU time
+    begin = utils.ticks()
+    function(blocks, total)
+    elapsed = utils.ticks() - begin
+    sys.stdout.write('%-24s %8.2f GB/s per core (%.3f s)\n' % (
+                     name, total / elapsed / 1e09, elapsed))
+
+def main(args):
+    ''' Main function '''
+
+    try:
+        options, arguments = getopt.getopt(args[1:], 'n:')
+    except getopt.error:
+        sys.exit(USAGE)
+    if arguments:
+        sys.exit(USAGE)
+
+    total = 1 << 30
+    for name, value in options:
+        if name == '-n':
+            total = int(float(value) * (1 << 30))
+
+    old = OldRandomBlocks()
+    bench('old get_block()', old, _blocks, total)
+    bench('new get_block()', RANDOMBLOCKS, _blocks, total)
+    bench('old get_block()[:64K]', old, _body, total)
+    bench('new get_block()[:64K]', RANDOMBLOCKS, _body, total)
+
+    # Sanity check: the body must be a view of the pool
+    if not isinstance(RandomBody(1).read(), memoryview):
+        sys.exit('bench_random: RandomBody does not return views')
+
+if __name__ == '__main__':
+    main(sys.argv)
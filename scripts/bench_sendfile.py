@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Measures how fast neubot/http/server.py serves a large static
+    file over loopback, with and without sendfile() '''
+
+import getopt
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '.')
+
+from neubot.config import CONFIG
+from neubot.http.server import ServerHTTP
+from neubot.net import stream
+from neubot.poller import POLLER
+from neubot import utils
+
+USAGE = 'usage: bench_sendfile.py [-m sendfile|read] [-p port] [-s MiB]\n'
+
+def _client(mode, port, size):
+    ''' Download the file and report the goodput (in the child) '''
+    for _ in range(50):
+        try:
+            sock = socket.create_connection(('127.0.0.1', port))
+            break
+        except socket.error:
+            time.sleep(0.1)
+    else:
+        os._exit(1)
+    sock.sendall('GET /big.bin HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                 'Connection: close\r\n\r\n')
+    begin, count = utils.ticks(), 0
+    while True:
+        octets = sock.recv(262144)
+        if not octets:
+            break
+        count += len(octets)
+    elapsed = utils.ticks() - begin
+    sys.stdout.write('%-8s %8.1f MB/s (%d bytes in %.3f s)\n' % (
+                     mode, count / elapsed / 1e06, count, elapsed))
+    sys.stdout.flush()
+    if count < size:
+        os._exit(1)
+    os._exit(0)
+
+def _wait_client(args):
+    ''' Stop the loop when the client is done '''
+    pid = args[0]
+    if os.waitpid(pid, os.WNOHANG)[0] == pid:
+        POLLER.break_loop()
+        return
+    POLLER.sched(0.1, _wait_client, pid)
+
+def bench(rootdir, mode, port, size):
+    ''' Serve the file once using the specified mode '''
+
+    if mode == 'read':
+        stream.SENDFILE = None
+    elif not stream.SENDFILE:
+        sys.stdout.write('sendfile skipped: not available\n')
+        return
+
+    conf = CONFIG.copy()
+    conf['http.server.rootdir'] = rootdir
+    server = ServerHTTP(POLLER)
+    server.configure(conf)
+    server.listen(('127.0.0.1', port))
+
+    pid = os.fork()
+    if pid == 0:
+        _client(mode, port, size)
+    POLLER.sched(0.1, _wait_client, pid)
+    POLLER.again = True  # The previous run did break_loop()
+    before = os.times()
+    POLLER.loop()
+    after = os.times()
+    sys.stdout.write('%-8s server CPU time: %.3f s\n' % (mode,
+                     after[0] - before[0] + after[1] - before[1]))
+
+def main(args):
+    ''' Main function '''
+
+    try:
+        options, arguments = getopt.getopt(args[1:], 'm:p:s:')
+    except getopt.error:
+        sys.exit(USAGE)
+    if arguments:
+        sys.exit(USAGE)
+
+    modes, port, size = ['sendfile', 'read'], 8081, 100
+    for name, value in options:
+        if name == '-m':
+            modes = [value]
+        elif name == '-p':
+            port = int(value)
+        elif name == '-s':
+            size = int(value)
+    size <<= 20
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rootdir = tempfile.mkdtemp()
+    try:
+        filep = open(os.sep.join([rootdir, 'big.bin']), 'wb')
+        chunk = os.urandom(1 << 20)
+        for _ in range(size >> 20):
+            filep.write(chunk)
+        filep.close()
+
+        for index, mode in enumerate(modes):
+            bench(rootdir, mode, port + index, size)
+    finally:
+        shutil.rmtree(rootdir)
+
+if __name__ == '__main__':
+    main(sys.argv)
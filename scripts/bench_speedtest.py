@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+''' Measures the server CPU time spent per gigabyte delivered by
+    the chunked speedtest download over loopback '''
+
+import getopt
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+sys.path.insert(0, '.')
+
+from neubot.config import CONFIG
+from neubot.http.server import HTTP_SERVER
+from neubot.net.poller import POLLER
+from neubot.speedtest import server
+from neubot.speedtest.server import SPEEDTEST_SERVER
+from neubot import utils
+
+USAGE = 'usage: bench_speedtest.py [-p port] [-t seconds]\n'
+
+def _server(port, seconds):
+    ''' Run the server (in the child) '''
+    server.TARGET = seconds
+    HTTP_SERVER.configure(CONFIG.copy())
+    HTTP_SERVER.register_child(SPEEDTEST_SERVER, '/speedtest')
+    HTTP_SERVER.listen(('127.0.0.1', port))
+    POLLER.loop()
+    os._exit(0)
+
+def _connect(port):
+    ''' Connect to the server, retrying while it starts '''
+    for _ in range(50):
+        try:
+            return socket.create_connection(('127.0.0.1', port))
+        except socket.error:
+            time.sleep(0.1)
+    sys.exit('bench_speedtest: cannot connect')
+
+def _download(sock):
+    ''' Download the chunked response and return the body length '''
+    sock.sendall('GET /speedtest/download HTTP/1.1\r\n'
+                 'Host: 127.0.0.1\r\n\r\n')
+    filep = sock.makefile('rb')
+    while filep.readline() not in ('\r\n', ''):
+        pass
+    total = 0
+    while True:
+        length = int(filep.readline().strip(), 16)
+        if length == 0:
+            filep.readline()
+            return total
+        while length > 0:
+            octets = filep.read(min(length, 1 << 20))
+            if not octets:
+                sys.exit('bench_speedtest: connection closed')
+            length -= len(octets)
+            total += len(octets)
+        if filep.read(2) != '\r\n':
+            sys.exit('bench_speedtest: invalid chunk')
+
+def bench(port, seconds):
+    ''' Run one download and report server CPU per gigabyte '''
+
+    pid = os.fork()
+    if pid == 0:
+        # Keep the server logs out of the terminal
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        _server(port, seconds)
+
+    try:
+        sock = _connect(port)
+        before = os.times()
+        begin = utils.ticks()
+        total = _download(sock)
+        elapsed = utils.ticks() - begin
+        sock.close()
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    after = os.times()
+
+    user, system = after[2] - before[2], after[3] - before[3]
+    sys.stdout.write('%8.1f MB/s\n' % (total / elapsed / 1e06))
+    sys.stdout.write('server CPU time per GB: %.3f s (user %.3f s, '
+                     'system %.3f s)\n' % ((user + system) / (total / 1e09),
+                     user / (total / 1e09), system / (total / 1e09)))
+
+def main(args):
+    ''' Main function '''
+
+    try:
+        options, arguments = getopt.getopt(args[1:], 'p:t:')
+    except getopt.error:
+        sys.exit(USAGE)
+    if arguments:
+        sys.exit(USAGE)
+
+    port, seconds = 8089, 5
+    for name, value in options:
+        if name == '-p':
+            port = int(value)
+        elif name == '-t':
+            seconds = float(value)
+
+    CONFIG['verbose'] = 0
+    logging.getLogger().setLevel(logging.WARNING)
+    bench(port, seconds)
+
+if __name__ == '__main__':
+    main(sys.argv)
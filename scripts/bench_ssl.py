@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Measures the rate of SSL handshakes over loopback, with and
+    without the contexts and sessions caches of neubot/sslstream.py '''
+
+import getopt
+import logging
+import os
+import shutil
+import signal
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '.')
+
+from neubot.handler import Handler
+from neubot.poller import POLLER
+from neubot.stream import Stream
+from neubot import sslstream
+from neubot import utils
+
+USAGE = 'usage: bench_ssl.py [-c certfile] [-m fresh|cached] [-n count] \
+[-p port]\n'
+
+class HelloServer(Handler):
+    ''' Sends hello and closes each connection '''
+
+    def handle_accept(self, listener, sock, sslconfig, sslcert):
+        Stream(sock, self._connection_made, self._connection_lost,
+               sslconfig, sslcert, None)
+
+    def _connection_made(self, stream):
+        ''' Invoked after the handshake '''
+        stream.send('hello\n', self._send_complete)
+
+    @staticmethod
+    def _send_complete(stream):
+        ''' Invoked when hello was sent '''
+        stream.close()
+
+    @staticmethod
+    def _connection_lost(stream):
+        ''' Invoked when the connection is closed '''
+
+def _server(certfile, port):
+    ''' Run the server (in the child) '''
+    HelloServer().listen(('127.0.0.1', port), False, True, certfile)
+    POLLER.loop()
+    os._exit(0)
+
+def _connect(port):
+    ''' Connect to the server, retrying while it starts '''
+    for _ in range(50):
+        try:
+            return socket.create_connection(('127.0.0.1', port))
+        except socket.error:
+            time.sleep(0.1)
+    sys.exit('bench_ssl: cannot connect')
+
+def bench(certfile, mode, port, count):
+    ''' Run count handshakes using the specified mode '''
+
+    sslstream.CACHE_CONTEXTS = (mode == 'cached')
+    sslstream.CONTEXTS.clear()
+    sslstream.SESSIONS.clear()
+
+    pid = os.fork()
+    if pid == 0:
+        _server(certfile, port)
+
+    endpoint = ('127.0.0.1', port)
+    try:
+        _connect(port).close()
+        before = os.times()
+        begin, resumed = utils.ticks(), 0
+        for _ in range(count):
+            sock = sslstream.wrap_socket(_connect(port), None, False,
+                                         endpoint)
+            sock.do_handshake()
+            try:
+                while sock.read(8192):
+                    pass
+            except ssl.SSLError:
+                pass  # The server does not send close_notify
+            if getattr(sock, 'session_reused', False):
+                resumed += 1
+            sslstream.save_session(sock, endpoint)
+            sock.close()
+        elapsed = utils.ticks() - begin
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    after = os.times()
+
+    sys.stdout.write('%-8s %8.1f handshakes/s (%d resumed)\n' % (mode,
+                     count / elapsed, resumed))
+    sys.stdout.write('%-8s server CPU time: %.3f s\n' % (mode,
+                     after[2] - before[2] + after[3] - before[3]))
+
+def main(args):
+    ''' Main function '''
+
+    try:
+        options, arguments = getopt.getopt(args[1:], 'c:m:n:p:')
+    except getopt.error:
+        sys.exit(USAGE)
+    if arguments:
+        sys.exit(USAGE)
+
+    certfile, modes, count, port = None, ['fresh', 'cached'], 500, 8443
+    for name, value in options:
+        if name == '-c':
+            certfile = value
+        elif name == '-m':
+            modes = [value]
+        elif name == '-n':
+            count = int(value)
+        elif name == '-p':
+            port = int(value)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        if not certfile:
+            keyfile = os.sep.join([tmpdir, 'key.pem'])
+            crtfile = os.sep.join([tmpdir, 'crt.pem'])
+            subprocess.check_call(['openssl', 'req', '-x509', '-newkey',
+              'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+              '-keyout', keyfile, '-out', crtfile],
+              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            certfile = os.sep.join([tmpdir, 'cert.pem'])
+            filep = open(certfile, 'w')
+            for path in (keyfile, crtfile):
+                filep.write(open(path).read())
+            filep.close()
+
+        for index, mode in enumerate(modes):
+            bench(certfile, mode, port + index, count)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main(sys.argv)
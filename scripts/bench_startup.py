@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+''' Measures how long it takes to start the agent, the server and
+    some short command line subcommands '''
+
+import getopt
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, '.')
+
+from neubot import utils
+
+USAGE = 'usage: bench_startup.py [-n count]\n'
+
+#
+# We cannot wait for the agent and the server to exit, so for them
+# we measure the time to import the module that implements them,
+# i.e., everything that happens before their main() runs.  The
+# subcommands print their usage and exit with status 1.
+#
+COMMANDS = (
+    ('agent', ['-c', 'import neubot.agent'], 0),
+    ('server', ['-c', 'import neubot.server'], 0),
+    ('database -h', ['UNIX/bin/neubot', 'database', '-h'], 1),
+    ('privacy -h', ['UNIX/bin/neubot', 'privacy', '-h'], 1),
+    ('raw -h', ['UNIX/bin/neubot', 'raw', '-h'], 1),
+    ('speedtest -h', ['UNIX/bin/neubot', 'speedtest', '-h'], 1),
+    ('bittorrent -h', ['UNIX/bin/neubot', 'bittorrent', '-h'], 1),
+)
+
+def _run_once(arguments):
+    ''' Run the command once and return the elapsed time '''
+    devnull = open(os.devnull, 'wb')
+    begin = utils.ticks()
+    retval = subprocess.call([sys.executable] + arguments,
+                             stdout=devnull, stderr=devnull)
+    elapsed = utils.ticks() - begin
+    devnull.close()
+    return retval, elapsed
+
+def bench(name, arguments, expected, count):
+    ''' Run the command count times and report the best time '''
+    samples = []
+    for _ in range(count):
+        retval, elapsed = _run_once(arguments)
+        if retval != expected:
+            sys.stdout.write('%-16s failed (exit status %d)\n' % (
+                             name, retval))
+            return
+        samples.append(elapsed)
+    samples.sort()
+    sys.stdout.write('%-16s best %7.1f ms  median %7.1f ms\n' % (
+                     name, samples[0] * 1000,
+                     samples[len(samples) // 2] * 1000))
+
+def main(args):
+    ''' Main function '''
+
+    try:
+        options, arguments = getopt.getopt(args[1:], 'n:')
+    except getopt.error:
+        sys.exit(USAGE)
+    if arguments:
+        sys.exit(USAGE)
+
+    count = 10
+    for name, value in options:
+        if name == '-n':
+            count = int(value)
+
+    for name, arguments, expected in COMMANDS:
+        bench(name, arguments, expected, count)
+
+if __name__ == '__main__':
+    main(sys.argv)